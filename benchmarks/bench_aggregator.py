@@ -0,0 +1,73 @@
+# Replays an aggTrade stream through the TradeAggregator into a ring StockFrame and
+# reports trades/s for time, volume and dollar bars, decoding included.
+#
+#   python -m benchmarks.bench_aggregator --trades 1000000 --symbols 20
+import time
+import argparse
+import tracemalloc
+
+from benchmarks.fake_exchange import agg_trade_messages
+
+from essentials.aggregator import TradeAggregator
+from essentials.market_data import _loads
+from essentials.stock_frame import StockFrame
+
+
+BARS = {
+    'time': 1000,
+    'volume': 50.0,
+    'dollar': 5000.0
+}
+
+
+def replay(messages: list, kind: str, size: float) -> tuple:
+
+    stock_frame = StockFrame(data=[], backend='ring', capacity=100000)
+    aggregator = TradeAggregator(stock_frame=stock_frame, kind=kind, size=size)
+
+    start = time.perf_counter()
+    for message in messages:
+        aggregator.add_event(event=_loads(message)['data'])
+    aggregator.flush()
+    elapsed = time.perf_counter() - start
+
+    return aggregator, elapsed
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trades', type=int, default=1000000)
+    parser.add_argument('--symbols', type=int, default=20)
+    arguments = parser.parse_args()
+
+    symbols = ['SYM{:04d}'.format(number) for number in range(arguments.symbols)]
+    messages = agg_trade_messages(symbols=symbols, trades=arguments.trades)
+
+    print('{trades} trades over {symbols} symbols'.format(trades=arguments.trades, symbols=arguments.symbols))
+
+    for kind, size in BARS.items():
+        aggregator, elapsed = replay(messages=messages, kind=kind, size=size)
+        print('  {kind:6s} bars  {rate:10,.0f} trades/s   {bars:8d} bars'.format(
+            kind=kind,
+            rate=arguments.trades / elapsed,
+            bars=aggregator.bars
+        ))
+
+    # With a ring StockFrame nothing grows with the number of trades.
+    stock_frame = StockFrame(data=[], backend='ring', capacity=1000)
+    aggregator = TradeAggregator(stock_frame=stock_frame, kind='time', size=BARS['time'])
+    events = [_loads(message)['data'] for message in messages]
+
+    tracemalloc.start()
+    for position, event in enumerate(events, start=1):
+        aggregator.add_event(event=event)
+        # Flushed once per micro-batch, like the pipeline does.
+        if position % 500 == 0:
+            aggregator.flush()
+        if position == len(events) // 2:
+            half, _ = tracemalloc.get_traced_memory()
+    full, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('  traced memory after half of the trades {half:8.1f} KiB, after all {full:8.1f} KiB'.format(half=half / 1024, full=full / 1024))
@@ -0,0 +1,58 @@
+# Backfills synthetic klines from a local HTTP stub and reports bars per second for
+# a single worker against a pool of workers.
+#
+#   python -m benchmarks.bench_backfill --symbols 20 --days 7 --latency 0.02
+import time
+import argparse
+
+from essentials.backfill import KlineBackfill
+from essentials.backfill import WeightRateLimiter
+from essentials.stock_frame import StockFrame
+
+from benchmarks.fake_exchange import FakeRestServer
+
+
+def run(server: FakeRestServer, symbols: int, days: int, workers: int) -> None:
+
+    names = ['SYM{:04d}USDT'.format(number) for number in range(symbols)]
+    end = 1600000000000
+    start = end - days * 86400000
+
+    backfill = KlineBackfill(base_url=server.url, max_workers=workers, limiter=WeightRateLimiter())
+
+    begin = time.perf_counter()
+    columns = backfill.fetch(symbols=names, interval='1m', start=start, end=end)
+    fetched = time.perf_counter()
+    stock_frame = StockFrame.from_columns(columns=columns)
+    loaded = time.perf_counter()
+
+    bars = sum(len(symbol_columns['datetime']) for symbol_columns in columns.values())
+
+    print('{workers:>3} workers: {bars:,} bars in {pages} pages, fetch {fetch:.2f} s, load {load:.3f} s, {rate:,.0f} bars/s'.format(
+        workers=workers,
+        bars=bars,
+        pages=backfill.requests_made,
+        fetch=fetched - begin,
+        load=loaded - fetched,
+        rate=bars / (loaded - begin)
+    ))
+
+    assert len(stock_frame.frame) == bars
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated seconds per request.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8, 16])
+    arguments = parser.parse_args()
+
+    stub = FakeRestServer(latency=arguments.latency)
+    stub.start()
+
+    for worker_count in arguments.workers:
+        run(server=stub, symbols=arguments.symbols, days=arguments.days, workers=worker_count)
+
+    stub.stop()
@@ -0,0 +1,86 @@
+# Replays synthetic 1-minute bars through the backtest, in fast mode and (on a slice of
+# the history) in event mode, and prints the throughput of both.
+#
+#   python -m benchmarks.bench_backtest --symbols 50 --bars 525600
+import argparse
+import operator
+
+import numpy as np
+
+from essentials.backtest import Backtest
+from essentials.indicators import Indicators
+
+
+def random_walk_columns(symbols: int, bars: int, seed: int = 0) -> dict:
+
+    rng = np.random.default_rng(seed)
+    timestamps = 1600000000000 + np.arange(bars, dtype=np.int64) * 60000
+    columns = {}
+
+    for number in range(symbols):
+
+        close = 100.0 + np.cumsum(rng.normal(scale=0.1, size=bars))
+        open_ = np.concatenate(([close[0]], close[:-1]))
+        spread = np.abs(rng.normal(scale=0.05, size=bars))
+
+        columns['SYM{:04d}'.format(number)] = {
+            'datetime': timestamps,
+            'open': open_,
+            'high': np.maximum(open_, close) + spread,
+            'low': np.minimum(open_, close) - spread,
+            'close': close,
+            'volume': rng.uniform(1.0, 10.0, size=bars)
+        }
+
+    return columns
+
+
+def rsi_strategy(indicators: Indicators) -> None:
+
+    indicators.rsi(period=14)
+    indicators.set_indicator_signals(
+        indicator='rsi_14',
+        buy=30.0,
+        sell=70.0,
+        condition_buy=operator.lt,
+        condition_sell=operator.gt
+    )
+
+
+def report(result) -> None:
+
+    summary = result.summary()
+    print('{mode:<6} {bars:>12,} bars {elapsed:8.2f} s {rate:>12,.0f} bars/s   round trips {trips:,}   equity {equity:,.2f}'.format(
+        mode=summary['mode'],
+        bars=summary['bars'],
+        elapsed=summary['elapsed_s'],
+        rate=summary['bars_per_second'],
+        trips=summary['round_trips'],
+        equity=summary['equity']
+    ))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=525600)
+    parser.add_argument('--event-bars', type=int, default=2000)
+    arguments = parser.parse_args()
+
+    columns = random_walk_columns(symbols=arguments.symbols, bars=arguments.bars)
+
+    backtest = Backtest(columns=columns, strategy=rsi_strategy, stop_loss=0.01, take_profit=0.02)
+    report(backtest.run(mode='fast'))
+
+    # Event mode walks every bar through the live code path, a short slice shows its rate.
+    head = {
+        symbol: {name: values[:arguments.event_bars] for name, values in symbol_columns.items()}
+        for symbol, symbol_columns in columns.items()
+    }
+
+    fast = Backtest(columns=head, strategy=rsi_strategy, stop_loss=0.01, take_profit=0.02).run(mode='fast')
+    event = Backtest(columns=head, strategy=rsi_strategy, stop_loss=0.01, take_profit=0.02).run(mode='event')
+    report(event)
+
+    print('fast and event mode agree on the slice:', fast.fills == event.fills)
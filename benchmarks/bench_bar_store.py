@@ -0,0 +1,90 @@
+# Cold start comparison: building the StockFrame from a list of dicts (the
+# StockFrame.create_frame path) against loading the local BarStore.
+#
+#   python -m benchmarks.bench_bar_store --symbols 50 --bars 20000
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from essentials.bar_store import BarStore
+from essentials.stock_frame import StockFrame
+
+
+def make_columns(symbols: int, bars: int) -> dict:
+
+    rng = np.random.default_rng(0)
+    columns = {}
+
+    for number in range(symbols):
+        close = 100.0 + np.cumsum(rng.normal(size=bars))
+        columns['SYM{:04d}USDT'.format(number)] = {
+            'datetime': 1600000000000 + np.arange(bars, dtype=np.int64) * 60000,
+            'open': close,
+            'high': close + 0.1,
+            'low': close - 0.1,
+            'close': close,
+            'volume': np.ones(bars)
+        }
+
+    return columns
+
+
+def to_dicts(columns: dict) -> list:
+
+    rows = []
+    for symbol, symbol_columns in columns.items():
+        for position in range(len(symbol_columns['datetime'])):
+            rows.append({
+                'symbol': symbol,
+                'datetime': int(symbol_columns['datetime'][position]),
+                'open': float(symbol_columns['open'][position]),
+                'close': float(symbol_columns['close'][position]),
+                'high': float(symbol_columns['high'][position]),
+                'low': float(symbol_columns['low'][position]),
+                'volume': float(symbol_columns['volume'][position])
+            })
+
+    return rows
+
+
+def timed(function) -> float:
+
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=20000)
+    arguments = parser.parse_args()
+
+    columns = make_columns(symbols=arguments.symbols, bars=arguments.bars)
+    rows = to_dicts(columns)
+    symbols = list(columns)
+    total = arguments.symbols * arguments.bars
+
+    print('{:,} bars ({} symbols x {:,})'.format(total, arguments.symbols, arguments.bars))
+    print('list of dicts -> StockFrame      {:8.3f} s'.format(timed(lambda: StockFrame(data=rows))))
+
+    root = tempfile.mkdtemp()
+    try:
+        for file_format in ('arrow', 'parquet'):
+            store = BarStore(root='{}/{}'.format(root, file_format), file_format=file_format)
+            for symbol, symbol_columns in columns.items():
+                store.save(symbol, '1m', symbol_columns)
+
+            for backend in ('pandas', 'ring'):
+                elapsed = timed(lambda: StockFrame.from_columns(
+                    columns=store.load_many(symbols=symbols, interval='1m'),
+                    backend=backend,
+                    capacity=arguments.bars
+                ))
+                print('{:<7} store -> StockFrame ({:<6}) {:8.3f} s'.format(file_format, backend, elapsed))
+    finally:
+        shutil.rmtree(root)
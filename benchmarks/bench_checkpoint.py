@@ -0,0 +1,99 @@
+# Time to get back to a warm trading state after a restart: a full rebuild of the
+# StockFrame and streaming indicators from the bar history, against restoring the
+# newest checkpoint and replaying the bars that came in since.
+#
+#   python -m benchmarks.bench_checkpoint --symbols 500 --bars 2000 --missed 10
+import os
+import time
+import shutil
+import argparse
+import operator
+import tempfile
+
+from benchmarks.bench_backtest import random_walk_columns
+from benchmarks.suite import head
+
+from essentials.portfolio import Portfolio
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+from essentials.checkpoint import CheckpointStore
+
+
+def strategy(indicators: Indicators) -> Indicators:
+
+    indicators.rsi(period=14)
+    indicators.sma(period=20)
+    indicators.ema(period=50)
+    indicators.set_indicator_signals(indicator='rsi_14', buy=30.0, sell=70.0, condition_buy=operator.lt, condition_sell=operator.gt)
+
+    return indicators
+
+
+def tail(columns: dict, start: int) -> dict:
+    return {symbol: {name: values[start:] for name, values in symbol_columns.items()} for symbol, symbol_columns in columns.items()}
+
+
+def rebuild(columns: dict, bars: int) -> Indicators:
+
+    stock_frame = StockFrame.from_columns(columns=columns, backend='ring', capacity=bars)
+    indicators = strategy(Indicators(price_data_frame=stock_frame, streaming=True))
+    indicators.refresh()
+
+    return indicators
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--bars', type=int, default=2000)
+    parser.add_argument('--missed', type=int, default=10, help='Bars that came in while the bot was down.')
+    parser.add_argument('--repeat', type=int, default=3)
+    arguments = parser.parse_args()
+
+    columns = random_walk_columns(symbols=arguments.symbols, bars=arguments.bars + arguments.missed)
+    history = head(columns=columns, bars=arguments.bars)
+    missed = tail(columns=columns, start=arguments.bars)
+
+    indicators = rebuild(columns=history, bars=arguments.bars)
+
+    portfolio = Portfolio()
+    for symbol in list(columns)[:50]:
+        portfolio.add_position(symbol=symbol, asset_type='CRYPTO', purchase_date=None, quantity=1.0, purchase_price=100.0)
+
+    root = tempfile.mkdtemp(prefix='bench_checkpoint_')
+    store = CheckpointStore(root=root, keep=1)
+
+    try:
+        start = time.perf_counter()
+        path = store.save(stock_frame=indicators.stock_frame, indicators=[indicators], portfolio=portfolio)
+        saved = time.perf_counter() - start
+
+        rebuilds, resumes, strategies = [], [], []
+        for _ in range(arguments.repeat):
+
+            start = time.perf_counter()
+            rebuild(columns=columns, bars=arguments.bars)
+            rebuilds.append(time.perf_counter() - start)
+
+            # The indicators saved in the checkpoint, then the same through the strategy.
+            start = time.perf_counter()
+            store.restore().replay(columns=missed)
+            resumes.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            store.restore(strategy=strategy).replay(columns=missed)
+            strategies.append(time.perf_counter() - start)
+
+        print('{symbols} symbols x {bars} bars, {missed} missed bars, rsi_14, sma_20 and ema_50'.format(
+            symbols=arguments.symbols, bars=arguments.bars, missed=arguments.missed))
+        print('  checkpoint         {seconds:8.3f} s to save, {mb:.1f} MB on disk'.format(seconds=saved, mb=directory_size(path) / 2 ** 20))
+        print('  full rebuild       {seconds:8.3f} s'.format(seconds=min(rebuilds)))
+        print('  resume             {seconds:8.3f} s   {speedup:5.1f}x'.format(seconds=min(resumes), speedup=min(rebuilds) / min(resumes)))
+        print('  resume (strategy)  {seconds:8.3f} s   {speedup:5.1f}x'.format(seconds=min(strategies), speedup=min(rebuilds) / min(strategies)))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,74 @@
+# Time and peak memory of building a StockFrame from raw Binance klines, through the
+# list-of-dicts create_frame path and through StockFrame.from_klines.
+#
+#   python -m benchmarks.bench_from_klines --symbols 50 --bars 25000
+import gc
+import time
+import argparse
+import tracemalloc
+
+from essentials.stock_frame import StockFrame
+
+from benchmarks.fake_exchange import synthetic_klines
+
+
+def klines_to_dicts(klines: dict) -> list:
+
+    return [
+        {
+            'symbol': symbol,
+            'datetime': row[0],
+            'open': float(row[1]),
+            'high': float(row[2]),
+            'low': float(row[3]),
+            'close': float(row[4]),
+            'volume': float(row[5])
+        }
+        for symbol, rows in klines.items()
+        for row in rows
+    ]
+
+
+def measure(name: str, function) -> None:
+
+    gc.collect()
+    start = time.perf_counter()
+    stock_frame = function()
+    elapsed = time.perf_counter() - start
+    del stock_frame
+
+    # Second run for memory only, tracing allocations slows the run down a lot.
+    gc.collect()
+    tracemalloc.start()
+    stock_frame = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('{name:<28} {elapsed:7.2f} s   peak {peak:8.1f} MB   rows {rows:,}'.format(
+        name=name,
+        elapsed=elapsed,
+        peak=peak / 1e6,
+        rows=len(stock_frame.frame)
+    ))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=25000)
+    arguments = parser.parse_args()
+
+    klines = {
+        'SYM{:04d}USDT'.format(number): synthetic_klines(
+            symbol='SYM{:04d}USDT'.format(number),
+            start=0,
+            end=(arguments.bars - 1) * 60000,
+            limit=arguments.bars
+        )
+        for number in range(arguments.symbols)
+    }
+
+    measure('list of dicts + create_frame', lambda: StockFrame(data=klines_to_dicts(klines)))
+    measure('from_klines (pandas)', lambda: StockFrame.from_klines(klines=klines))
+    measure('from_klines (ring)', lambda: StockFrame.from_klines(klines=klines, backend='ring', capacity=arguments.bars))
@@ -0,0 +1,89 @@
+# Fires a burst of trades (market entries with a stop loss and take profit) at the
+# local mock exchange, one request at a time and through the pooled gateway, and
+# reports the round-trip latency percentiles and the order throughput.
+#
+#   python -m benchmarks.bench_gateway --trades 200 --latency 0.02
+import time
+import argparse
+
+from essentials.trades import Trade
+from essentials.gateway import OrderGateway
+from essentials.backfill import WeightRateLimiter
+
+from benchmarks.fake_exchange import FakeRestServer
+
+
+API_KEY = 'benchmark-key'
+API_SECRET = 'benchmark-secret'
+
+
+def make_trades(count: int, order_type: str, run: int) -> list:
+
+    trades = []
+    for number in range(count):
+        trade = Trade()
+        trade.new_trade(
+            trade_id='run{run}-SYM{number:04d}'.format(run=run, number=number),
+            order_type=order_type,
+            side='long',
+            enter_or_exit='enter',
+            price=100.0
+        )
+        trade.instrument(symbol='SYM{number:04d}USDT'.format(number=number), quantity=1.5, asset_type='CRYPTO')
+        trade.add_stop_loss(stop_size=0.02, percentage=True)
+        trade.add_take_profit(profit_size=0.04, percentage=True)
+        trades.append(trade)
+
+    return trades
+
+
+def run(server: FakeRestServer, trades: list, workers: int, label: str) -> None:
+
+    # The mock is not rate limited, lift the client side order limit for the burst.
+    gateway = OrderGateway(
+        api_key=API_KEY,
+        api_secret=API_SECRET,
+        base_url=server.url,
+        max_workers=workers,
+        order_limiter=WeightRateLimiter(limit=100000, window=10.0)
+    )
+
+    with gateway:
+        start = time.perf_counter()
+        answers = gateway.wait(gateway.submit_many(trades))
+        elapsed = time.perf_counter() - start
+
+    assert all(trade.order_response is answer for trade, answer in zip(trades, answers))
+    stats = gateway.latency_stats()
+
+    print('{label:<8} {workers:>3} workers: {trades} trades, {requests} requests in {elapsed:6.2f} s, {rate:8.1f} trades/s, '
+          'p50 {p50:7.1f} ms, p99 {p99:7.1f} ms'.format(
+              label=label,
+              workers=workers,
+              trades=len(trades),
+              requests=gateway.requests_made,
+              elapsed=elapsed,
+              rate=len(trades) / elapsed,
+              p50=stats['p50_ms'],
+              p99=stats['p99_ms']
+          ))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trades', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated seconds per request.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 503.')
+    arguments = parser.parse_args()
+
+    server = FakeRestServer(latency=arguments.latency, api_secret=API_SECRET, error_rate=arguments.error_rate)
+    server.start()
+
+    try:
+        for number, workers in enumerate(arguments.workers):
+            run(server=server, trades=make_trades(arguments.trades, 'mkt', run=2 * number), workers=workers, label='market')
+            run(server=server, trades=make_trades(arguments.trades, 'lmt', run=2 * number + 1), workers=workers, label='limit')
+    finally:
+        server.stop()
@@ -0,0 +1,88 @@
+# Compares the per-symbol lambda transforms Indicators used to run against the
+# vectorized kernels in essentials.kernels.
+#
+#   python -m benchmarks.bench_indicators --bars 1000
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from essentials import kernels
+
+
+def make_frame(symbols: int, bars: int, seed: int = 0) -> pd.DataFrame:
+
+    rng = np.random.default_rng(seed)
+    names = np.repeat(['SYM{:04d}'.format(number) for number in range(symbols)], bars)
+    times = np.tile(np.arange(bars, dtype=np.int64) * 60000, symbols)
+    close = 100.0 + np.cumsum(rng.normal(size=symbols * bars))
+
+    index = pd.MultiIndex.from_arrays(
+        [names, pd.to_datetime(times, unit='ms')],
+        names=['symbol', 'datetime']
+    )
+
+    return pd.DataFrame(data={'close': close}, index=index).sort_index()
+
+
+def best_of(function, repeat: int = 3) -> float:
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def run(symbols: int, bars: int) -> None:
+
+    frame = make_frame(symbols=symbols, bars=bars)
+    groups = frame.groupby(level='symbol')['close']
+    values = frame['close'].to_numpy()
+    starts = kernels.group_starts(frame.index)
+
+    cases = {
+        'change_in_price': (
+            lambda: groups.transform(lambda x: x.diff()),
+            lambda: kernels.grouped_diff(values, starts)
+        ),
+        'sma(20)': (
+            lambda: groups.transform(lambda x: x.rolling(window=20).mean()),
+            lambda: kernels.grouped_rolling_mean(values, starts, window=20)
+        ),
+        'ema(20)': (
+            lambda: groups.transform(lambda x: x.ewm(span=20).mean()),
+            lambda: kernels.grouped_ewm_mean(values, starts, alpha=2.0 / 21.0)
+        ),
+        'rsi(14)': (
+            lambda: groups.transform(lambda x: x.diff().clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean()),
+            lambda: kernels.grouped_rsi(values, starts, period=14)
+        ),
+    }
+
+    for name, (legacy, vectorized) in cases.items():
+        legacy_time = best_of(legacy)
+        vectorized_time = best_of(vectorized)
+        print('{symbols:>5} symbols  {name:<16} lambda {legacy:9.2f} ms  kernel {kernel:9.2f} ms  x{speedup:6.1f}'.format(
+            symbols=symbols,
+            name=name,
+            legacy=legacy_time * 1000,
+            kernel=vectorized_time * 1000,
+            speedup=legacy_time / vectorized_time
+        ))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bars', type=int, default=1000, help='Bars per symbol.')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 100, 1000])
+    arguments = parser.parse_args()
+
+    print('numba: {}'.format('on' if kernels.numba is not None else 'off'))
+
+    for symbol_count in arguments.symbols:
+        run(symbols=symbol_count, bars=arguments.bars)
@@ -0,0 +1,85 @@
+# Runs a trading loop tick (add_rows, indicator refresh, signal check, building a
+# bracket order) with the instrumentation enabled and disabled, and prints the
+# overhead and the histograms it collected. Disabling puts the original methods back,
+# so the disabled loop runs exactly the code it ran before instrumentation existed.
+#
+#   python -m benchmarks.bench_instrumentation --symbols 50 --ticks 2000
+import time
+import argparse
+import operator
+
+from benchmarks.bench_backtest import random_walk_columns
+from benchmarks.bench_timeframes import quotes_at
+
+from essentials.trades import Trade
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+from essentials.instrumentation import INSTRUMENTATION
+
+
+def run_loop(columns: dict, bars: int, ticks: int) -> float:
+
+    history = {symbol: {name: values[:bars] for name, values in symbol_columns.items()} for symbol, symbol_columns in columns.items()}
+    stock_frame = StockFrame.from_columns(columns=history, backend='ring', capacity=bars + ticks)
+
+    indicators = Indicators(price_data_frame=stock_frame, streaming=True)
+    indicators.rsi(period=14)
+    indicators.sma(period=20)
+    indicators.set_indicator_signals(indicator='rsi_14', buy=30.0, sell=70.0, condition_buy=operator.lt, condition_sell=operator.gt)
+
+    start = time.perf_counter()
+
+    for position in range(bars, bars + ticks):
+        quotes = quotes_at(columns=columns, position=position)
+        stock_frame.add_rows(data=quotes)
+        indicators.refresh()
+        signals = indicators.check_signals()
+
+        symbol = next(iter(quotes))
+        trade = Trade()
+        trade.new_trade(trade_id='bench', order_type='lmt', side='long', enter_or_exit='enter', price=quotes[symbol]['closePrice'])
+        trade.instrument(symbol=symbol, quantity=1, asset_type='CRYPTO')
+        trade.add_stop_loss(stop_size=0.01, percentage=True)
+        trade.add_take_profit(profit_size=0.02, percentage=True)
+
+    return (time.perf_counter() - start) / ticks
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    arguments = parser.parse_args()
+
+    columns = random_walk_columns(symbols=arguments.symbols, bars=arguments.bars + arguments.ticks)
+
+    # Warm up.
+    run_loop(columns=columns, bars=arguments.bars, ticks=arguments.ticks)
+    enabled, disabled = [], []
+
+    # Alternate the modes so drift in the machine's speed hits both alike.
+    for _ in range(arguments.rounds):
+        INSTRUMENTATION.enable()
+        enabled.append(run_loop(columns=columns, bars=arguments.bars, ticks=arguments.ticks))
+        INSTRUMENTATION.disable()
+        disabled.append(run_loop(columns=columns, bars=arguments.bars, ticks=arguments.ticks))
+
+    stats = INSTRUMENTATION.stats()
+    enabled, disabled = min(enabled), min(disabled)
+
+    print('{symbols} symbols, one tick of the loop'.format(symbols=arguments.symbols))
+    print('  disabled       {us:9.1f} us'.format(us=disabled * 1e6))
+    print('  enabled        {us:9.1f} us   {overhead:+6.2f}%'.format(us=enabled * 1e6, overhead=(enabled / disabled - 1.0) * 100))
+    print()
+
+    for name, summary in stats.items():
+        print('  {name:28s} {count:8d}  p50 {p50:9.1f} us  p99 {p99:9.1f} us  max {max:9.1f} us'.format(
+            name=name,
+            count=summary['count'],
+            p50=summary['p50_us'],
+            p99=summary['p99_us'],
+            max=summary['max_us']
+        ))
@@ -0,0 +1,66 @@
+# Replays synthetic klines through a local fake WebSocket server into a StockFrame and
+# reports the tick-to-frame latency of MarketDataPipeline.
+#
+#   python -m benchmarks.bench_market_data --symbols 200 --bars 50
+#   python -m benchmarks.bench_market_data --symbols 20 --bars 20 --replay --delay 0.001
+import time
+import asyncio
+import argparse
+
+from essentials.stock_frame import StockFrame
+from essentials.market_data import MarketDataPipeline
+from essentials.market_data import ReplayTransport
+from essentials.market_data import WebSocketTransport
+
+from benchmarks.fake_exchange import FakeStreamServer
+from benchmarks.fake_exchange import kline_messages
+
+
+async def run(symbols: int, bars: int, ticks: int, replay: bool, delay: float = 0.0) -> None:
+
+    names = ['SYM{:04d}USDT'.format(number) for number in range(symbols)]
+    messages = kline_messages(symbols=names, bars=bars, ticks_per_bar=ticks)
+    stock_frame = StockFrame(data=[], backend='ring', capacity=bars + 1)
+
+    server = None
+    if replay:
+        transport = ReplayTransport(messages=messages, delay=delay)
+    else:
+        server = FakeStreamServer(messages=messages)
+        await server.start()
+        transport = WebSocketTransport(url=server.url)
+
+    pipeline = MarketDataPipeline(stock_frame=stock_frame, symbols=names, transport=transport, book_ticker=False)
+
+    start = time.perf_counter()
+    await pipeline.run()
+    elapsed = time.perf_counter() - start
+
+    if server is not None:
+        await server.stop()
+
+    print('{source}: {messages} messages, {bars} bars in {batches} batches, {elapsed:.2f} s, {rate:,.0f} msg/s'.format(
+        source='replay' if replay else 'websocket',
+        messages=pipeline.messages_received,
+        bars=pipeline.bars_added,
+        batches=pipeline.batches,
+        elapsed=elapsed,
+        rate=pipeline.messages_received / elapsed
+    ))
+    print('tick-to-frame latency: {}'.format(
+        ', '.join('{}={:,.0f}'.format(key, value) for key, value in pipeline.latency_stats().items())
+    ))
+    print('frame rows: {}'.format(len(stock_frame.frame)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--bars', type=int, default=50)
+    parser.add_argument('--ticks', type=int, default=2, help='Kline updates per bar.')
+    parser.add_argument('--replay', action='store_true', help='Skip the socket and replay in process.')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds between replayed messages, for the latency of lone ticks.')
+    arguments = parser.parse_args()
+
+    asyncio.run(run(symbols=arguments.symbols, bars=arguments.bars, ticks=arguments.ticks, replay=arguments.replay, delay=arguments.delay))
@@ -0,0 +1,77 @@
+# Memory per symbol per bar of a StockFrame with RSI and SMA, plain against the memory
+# budget mode (compact=True), and how many symbols fit into a budget at that rate.
+#
+#   python -m benchmarks.bench_memory --symbols 200 --bars 5000 --budget-mb 4096
+#
+# Prices are rounded to a tick of 0.01 like exchange prices, so they fit in float32.
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_backtest import random_walk_columns
+
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+
+
+def on_ticks(columns: dict, tick: float) -> dict:
+
+    for symbol_columns in columns.values():
+        for name in ('open', 'close', 'high', 'low'):
+            symbol_columns[name] = np.round(symbol_columns[name] / tick) * tick
+
+    return columns
+
+
+def measure(columns: dict, backend: str, bars: int, compact: bool) -> dict:
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    stock_frame = StockFrame.from_columns(columns=columns, backend=backend, capacity=bars, compact=compact)
+    indicators = Indicators(price_data_frame=stock_frame)
+    indicators.rsi(period=14)
+    indicators.sma(period=20)
+    indicators.refresh()
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    usage = stock_frame.memory_usage()
+    usage['scratch_bytes'] = indicators.scratch_bytes
+    usage['peak_bytes'] = peak
+    usage['seconds'] = elapsed
+
+    return usage
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--bars', type=int, default=5000)
+    parser.add_argument('--tick', type=float, default=0.01)
+    parser.add_argument('--budget-mb', type=float, default=4096)
+    arguments = parser.parse_args()
+
+    columns = on_ticks(random_walk_columns(symbols=arguments.symbols, bars=arguments.bars), tick=arguments.tick)
+    budget = arguments.budget_mb * 2 ** 20
+
+    print('{symbols} symbols x {bars} bars, rsi_14 and sma_20'.format(symbols=arguments.symbols, bars=arguments.bars))
+    print('  {case:16s} {per_bar:>10s} {total:>10s} {peak:>10s} {seconds:>8s} {fits:>14s}'.format(
+        case='', per_bar='B/bar', total='held MB', peak='peak MB', seconds='s', fits='symbols/budget'))
+
+    for backend in ('pandas', 'ring'):
+        for compact in (False, True):
+            usage = measure(columns=columns, backend=backend, bars=arguments.bars, compact=compact)
+            print('  {case:16s} {per_bar:10.1f} {total:10.1f} {peak:10.1f} {seconds:8.2f} {fits:14,.0f}'.format(
+                case='{backend}{compact}'.format(backend=backend, compact=' compact' if compact else ''),
+                per_bar=usage['bytes_per_bar'],
+                total=usage['bytes'] / 2 ** 20,
+                peak=usage['peak_bytes'] / 2 ** 20,
+                seconds=usage['seconds'],
+                fits=budget / (usage['bytes_per_bar'] * arguments.bars)
+            ))
@@ -0,0 +1,70 @@
+# Times a parameter sweep with 1, 2, 4, ... worker processes up to the number of cores
+# and prints the speedup over a single worker.
+#
+#   python -m benchmarks.bench_optimizer --symbols 20 --bars 50000
+import os
+import time
+import argparse
+import operator
+
+from essentials.indicators import Indicators
+from essentials.optimizer import Optimizer
+
+from benchmarks.bench_backtest import random_walk_columns
+
+
+def rsi_strategy(indicators: Indicators, parameters: dict) -> None:
+
+    column_name = 'rsi_{period}'.format(period=parameters['period'])
+
+    indicators.rsi(period=parameters['period'])
+    indicators.set_indicator_signals(
+        indicator=column_name,
+        buy=parameters['buy'],
+        sell=parameters['sell'],
+        condition_buy=operator.lt,
+        condition_sell=operator.gt
+    )
+
+
+GRID = {
+    'period': [7, 14, 21, 28],
+    'buy': [20.0, 30.0],
+    'sell': [70.0, 80.0],
+    'stop_loss': [0.01, 0.02]
+}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--bars', type=int, default=50000)
+    parser.add_argument('--output', default=None)
+    arguments = parser.parse_args()
+
+    columns = random_walk_columns(symbols=arguments.symbols, bars=arguments.bars)
+
+    workers = [1]
+    while workers[-1] * 2 <= os.cpu_count():
+        workers.append(workers[-1] * 2)
+    if workers[-1] != os.cpu_count():
+        workers.append(os.cpu_count())
+
+    baseline = None
+    for count in workers:
+
+        with Optimizer(columns=columns, strategy=rsi_strategy, grid=GRID, max_workers=count) as optimizer:
+            start = time.perf_counter()
+            results = optimizer.run(output=arguments.output)
+            elapsed = time.perf_counter() - start
+
+        baseline = baseline or elapsed
+        print('{count:>3} workers {elapsed:8.2f} s   speedup {speedup:5.2f}x   {runs} backtests'.format(
+            count=count,
+            elapsed=elapsed,
+            speedup=baseline / elapsed,
+            runs=len(results)
+        ))
+
+    print(results.head(5).to_string())
@@ -0,0 +1,91 @@
+# Replays a recorded-style diff-depth stream into an OrderBook and reports updates/s,
+# next to a dict book that has to scan every level for the best bid/ask and the depth.
+#
+#   python -m benchmarks.bench_order_book --updates 100000 --levels 1000
+import json
+import time
+import argparse
+
+from benchmarks.fake_exchange import depth_messages
+
+from essentials.order_book import OrderBook
+
+
+class DictBook:
+
+    def __init__(self, snapshot: dict) -> None:
+
+        self.bids = {float(price): float(size) for price, size in snapshot['bids']}
+        self.asks = {float(price): float(size) for price, size in snapshot['asks']}
+
+    def apply(self, event: dict) -> None:
+
+        for side, levels in ((self.bids, event['b']), (self.asks, event['a'])):
+            for price, size in levels:
+                price, size = float(price), float(size)
+                if size == 0.0:
+                    side.pop(price, None)
+                else:
+                    side[price] = size
+
+    def mid_price(self) -> float:
+        return (max(self.bids) + min(self.asks)) / 2.0
+
+    def bid_depth(self, price: float) -> float:
+        return sum(size for level, size in self.bids.items() if level >= price)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=100000)
+    parser.add_argument('--levels', type=int, default=1000)
+    parser.add_argument('--changes', type=int, default=5)
+    arguments = parser.parse_args()
+
+    snapshot, messages = depth_messages(symbol='BTCUSDT', updates=arguments.updates, levels=arguments.levels, changes=arguments.changes)
+    events = [json.loads(message)['data'] for message in messages]
+
+    book = OrderBook(symbol='BTCUSDT')
+    book.seed(snapshot=snapshot)
+
+    start = time.perf_counter()
+    for event in events:
+        book.apply(event=event)
+    apply_time = time.perf_counter() - start
+
+    # A strategy reads the top of the book and the depth near it after every update.
+    book = OrderBook(symbol='BTCUSDT')
+    book.seed(snapshot=snapshot)
+
+    start = time.perf_counter()
+    for event in events:
+        book.apply(event=event)
+        mid_price = book.mid_price
+        book.depth(side='bid', price=mid_price * 0.999)
+    query_time = time.perf_counter() - start
+
+    dict_book = DictBook(snapshot=snapshot)
+    sample = events[:min(len(events), 10000)]
+
+    start = time.perf_counter()
+    for event in sample:
+        dict_book.apply(event=event)
+        dict_mid_price = dict_book.mid_price()
+        dict_book.bid_depth(price=dict_mid_price * 0.999)
+    dict_time = (time.perf_counter() - start) / len(sample) * len(events)
+
+    assert book.synced and book.gaps == 0 and book.updates_applied == len(events)
+
+    if len(sample) == len(events):
+        assert abs(book.mid_price - dict_book.mid_price()) < 1e-9
+        assert abs(book.depth(side='bid', price=dict_book.mid_price() * 0.999) - dict_book.bid_depth(price=dict_book.mid_price() * 0.999)) < 1e-6
+
+    print('{updates} updates x {changes} levels on a {levels} level book'.format(
+        updates=len(events),
+        changes=arguments.changes,
+        levels=arguments.levels
+    ))
+    print('  apply                {rate:10,.0f} updates/s'.format(rate=len(events) / apply_time))
+    print('  apply + mid + depth  {rate:10,.0f} updates/s'.format(rate=len(events) / query_time))
+    print('  dict book            {rate:10,.0f} updates/s'.format(rate=len(events) / dict_time))
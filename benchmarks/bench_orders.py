@@ -0,0 +1,291 @@
+# Orders per second for a market entry with a stop loss and a take profit, built the
+# way Trade used to (fresh lookup tables and nested dicts on every call) against the
+# __slots__ order objects, with and without serializing the payload. The gateway sends
+# from the objects, the payload is only built when `Trade.order` is read.
+#
+#   python -m benchmarks.bench_orders --orders 100000
+import time
+import argparse
+
+from typing import Optional
+
+from essentials.trades import Trade
+
+
+class DictTrade:
+    """Trade as it was before the order objects, nested dicts built on every call."""
+
+    def __init__(self):
+
+        self.order = {}
+        self._order_response = {}
+
+        self._trigger_added = False
+        self._multi_leg = False
+
+        # For identification
+        self._trade_id = ""
+
+        # Long or short
+        self.side = ""
+
+        # Opposite of the side chosen in self.side
+        self.side_opposite = ""
+
+        # Enter or exit a position
+        self.enter_or_exit = ""
+
+        # Opposite of the enter exit value
+        self.enter_or_exit_opposite = ""
+
+    def new_trade(self, trade_id: str, order_type: str, side: str, enter_or_exit: str, price: float = 0.0, stop_limit_price: float = 0.0) -> dict:
+
+        self.trade_id = trade_id
+        self.order_types = {
+            'mkt': 'MARKET',
+            'lmt': 'LIMIT',
+            'stop': 'STOP',
+            'stop_lmt': 'STOP_LIMIT',
+            'trailing_stop': 'TRAILING_STOP'
+        }
+
+        self.order_instructions = {
+            'enter': {
+                'long': 'BUY',
+                'short': 'SELL_SHORT'
+            },
+            'exit': {
+                'long': 'SELL',
+                'short': 'BUY_TO_COVER'
+            }
+        }
+
+        self.order = {
+            'orderStrategyType': "SINGLE",
+            'orderType': self.order_types[order_type],
+            'session': 'NORMAL',
+            'duration': 'DAY',
+            'orderLegCollection': [
+                {
+                    'instruction': self.order_instructions[enter_or_exit][side],
+                    'quantity': 0,
+                    'instrument': {
+                        'symbol': None,
+                        'assetType': None
+                    }
+
+                }
+            ]
+
+        }
+
+        if self.order['orderType'] == 'STOP':
+            self.order['stopPrice'] = price
+
+        elif self.order['orderType'] == 'LIMIT':
+            self.order['price'] = price
+
+        elif self.order['orderType'] == 'STOP_LIMIT':
+            self.order['stopPrice'] = price
+            self.order['price'] = stop_limit_price
+
+        elif self.order['orderType'] == 'TRAILING_STOP':
+            self.order['stopPriceLinkBasis'] = ''
+            self.order['stopPriceLinkType'] = ''
+            self.order['stopPriceOffset'] = 0.00
+            self.order['stopType'] = 'STANDARD'
+
+        self.enter_or_exit = enter_or_exit
+        self.side = side
+        self.order_type = order_type
+        self.price = price
+
+        # Store important info for use later.
+        if order_type == 'stop':
+            self.stop_price = price
+        elif order_type == 'stop_lmt':
+            self.stop_price = price
+            self.stop_limit_price = stop_limit_price
+        else:
+            self.stop_price = 0.0
+
+        if self.enter_or_exit == 'enter':
+            self.enter_or_exit_opposite = 'exit'
+        elif self.enter_or_exit == 'exit':
+            self.enter_or_exit_opposite = 'enter'
+
+        if self.side == 'long':
+            self.side_opposite = 'short'
+        elif self.side == 'short':
+            self.side_opposite = 'long'
+
+        return self.order
+
+    def instrument(self, symbol: str, quantity: int, asset_type: str, sub_asset_type: str = None, order_leg_id: int = 0) -> dict:
+
+        leg = self.order['orderLegCollection'][order_leg_id]
+
+        leg['instrument']['symbol'] = symbol
+        leg['instrument']['assetType'] = asset_type
+        leg['quantity'] = quantity
+
+        self.order_size = quantity
+        self.symbol = symbol
+        self.asset_type = asset_type
+
+        return leg
+
+    def add_stop_loss(self, stop_size: float, percentage: bool = False) -> bool:
+
+        if not self._trigger_added:
+            self._convert_to_trigger()
+
+        # Market orders carry the price they were made at as a reference.
+        price = self.price
+
+        if percentage:
+            adjustment = 1.0 - stop_size if self.side == 'long' else 1.0 + stop_size
+            new_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=True)
+        else:
+            adjustment = -stop_size if self.side == 'long' else stop_size
+            new_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=False)
+
+        stop_loss_order = {
+            "orderType": "STOP",
+            "session": "NORMAL",
+            "duration": "DAY",
+            "stopPrice": new_price,
+            "orderStrategyType": "SINGLE",
+            "orderLegCollection": [
+                {
+                    "instruction": self.order_instructions[self.enter_or_exit_opposite][self.side],
+                    "quantity": self.order_size,
+                    "instrument": {
+                        "symbol": self.symbol,
+                        "assetType": self.asset_type
+                    }
+                }
+            ]
+        }
+
+        self.stop_loss_order = stop_loss_order
+        self.order['childOrderStrategies'].append(self.stop_loss_order)
+
+        return True
+
+    def _calculate_new_price(self, price: float, adjustment: float, percentage: bool) -> float:
+        """
+        :param price: This is the price which should be re calculated
+        :param adjustment: The adjustment to made
+        :param percentage: This determiens wheter the adjustment are of
+        a percentage stake or just simply an addition / subtraction of the price.
+        :return: float new_price
+        """
+        if percentage:
+            new_price = price * adjustment
+        else:
+            new_price = price + adjustment
+
+        if new_price < 1:
+            new_price = round(new_price, 4)
+        else:
+            new_price = round(new_price, 2)
+
+        return new_price
+
+    def add_take_profit(self, profit_size: float, percentage: bool = False) -> bool:
+
+        if not self._trigger_added:
+            self._convert_to_trigger()
+
+        price = self.price
+
+        if percentage:
+            # The adjustment will be based on a percentage.
+            adjustment = 1.0 + profit_size if self.side == 'long' else 1.0 - profit_size
+            profit_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=True)
+        else:
+            # The adjustment will be plain
+            adjustment = profit_size if self.side == 'long' else -profit_size
+            profit_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=False)
+
+        take_profit_order = {
+            "orderType": "LIMIT",
+            "session": "NORMAL",
+            "duration": "DAY",
+            "price": profit_price,
+            "orderStrategyType": "SINGLE",
+            "orderLegCollection": [
+                {
+                    "instruction": self.order_instructions[self.enter_or_exit_opposite][self.side],
+                    "quantity": self.order_size,
+                    "instrument": {
+                        "symbol": self.symbol,
+                        "assetType": self.asset_type
+                    }
+                }
+            ]
+        }
+
+        # Add the order.
+        self.take_profit_order = take_profit_order
+        self.order['childOrderStrategies'].append(self.take_profit_order)
+
+        return True
+
+    def _convert_to_trigger(self):
+
+        if self.order and self._trigger_added == False:
+            self.order['orderStrategyType'] = 'TRIGGER'
+            self.order['childOrderStrategies'] = []
+            self._trigger_added = True
+
+
+def dict_trade(symbol: str, price: float, quantity: float) -> DictTrade:
+
+    trade = DictTrade()
+    trade.new_trade(trade_id=symbol, order_type='mkt', side='long', enter_or_exit='enter', price=price)
+    trade.instrument(symbol=symbol, quantity=quantity, asset_type='CRYPTO')
+    trade.add_stop_loss(stop_size=0.02, percentage=True)
+    trade.add_take_profit(profit_size=0.04, percentage=True)
+
+    return trade
+
+
+def slots_trade(symbol: str, price: float, quantity: float) -> Trade:
+
+    trade = Trade()
+    trade.new_trade(trade_id=symbol, order_type='mkt', side='long', enter_or_exit='enter', price=price)
+    trade.instrument(symbol=symbol, quantity=quantity, asset_type='CRYPTO')
+    trade.add_stop_loss(stop_size=0.02, percentage=True)
+    trade.add_take_profit(profit_size=0.04, percentage=True)
+
+    return trade
+
+
+def rate(function, count: int) -> float:
+
+    start = time.perf_counter()
+    for number in range(count):
+        function(number)
+
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=100000)
+    arguments = parser.parse_args()
+
+    cases = {
+        'dict Trade': lambda number: dict_trade('SYM', 100.0 + number % 10, 1.5),
+        'Trade, objects only': lambda number: slots_trade('SYM', 100.0 + number % 10, 1.5),
+        'Trade, with payload': lambda number: slots_trade('SYM', 100.0 + number % 10, 1.5).order
+    }
+
+    reference = slots_trade('SYM', 100.0, 1.5).order
+    assert reference == dict_trade('SYM', 100.0, 1.5).order
+
+    for name, function in cases.items():
+        print('{name:<22} {rate:>12,.0f} orders/s'.format(name=name, rate=rate(function, count=arguments.orders)))
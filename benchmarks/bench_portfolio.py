@@ -0,0 +1,74 @@
+# Revalues a book of positions on every tick, looping over the old dict of dicts
+# against one Portfolio.mark_to_market call on the slot arrays.
+#
+#   python -m benchmarks.bench_portfolio --positions 1000
+import time
+import argparse
+
+import numpy as np
+
+from essentials.portfolio import Portfolio
+
+
+def dict_revalue(positions: dict, prices: dict) -> tuple:
+
+    market_value = 0.0
+    profit_loss = 0.0
+    values = {}
+
+    for symbol, position in positions.items():
+        value = position['quantity'] * prices[symbol]
+        values[symbol] = value
+        market_value += value
+        profit_loss += (prices[symbol] - position['purchase_price']) * position['quantity']
+
+    allocation = {symbol: value / market_value for symbol, value in values.items()}
+
+    return market_value, profit_loss, allocation
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--positions', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=2000)
+    arguments = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    symbols = ['SYM{:04d}'.format(number) for number in range(arguments.positions)]
+
+    portfolio = Portfolio()
+    for symbol in symbols:
+        portfolio.add_position(
+            symbol=symbol,
+            asset_type='CRYPTO',
+            purchase_date=None,
+            quantity=float(rng.uniform(1.0, 10.0)),
+            purchase_price=float(rng.uniform(50.0, 150.0))
+        )
+
+    positions = portfolio.positions
+    slots = portfolio.slots(symbols=symbols)
+    ticks = rng.uniform(50.0, 150.0, size=(arguments.ticks, len(symbols)))
+    tick_dicts = [dict(zip(symbols, tick.tolist())) for tick in ticks[:200]]
+
+    start = time.perf_counter()
+    for tick in tick_dicts:
+        dict_revalue(positions=positions, prices=tick)
+    dict_time = (time.perf_counter() - start) / len(tick_dicts)
+
+    start = time.perf_counter()
+    for tick in ticks:
+        portfolio.mark_to_market(prices=tick, slots=slots)
+    array_time = (time.perf_counter() - start) / len(ticks)
+
+    market_value, profit_loss, _ = dict_revalue(positions=positions, prices=tick_dicts[-1])
+    result = portfolio.mark_to_market(prices=ticks[199], slots=slots)
+    assert np.isclose(market_value, result['total_market_value']) and np.isclose(profit_loss, result['total_profit_loss'])
+
+    print('{positions} positions   dict loop {dict_us:9.1f} us/tick   mark_to_market {array_us:7.1f} us/tick   {speedup:5.1f}x'.format(
+        positions=arguments.positions,
+        dict_us=dict_time * 1e6,
+        array_us=array_time * 1e6,
+        speedup=dict_time / array_time
+    ))
@@ -0,0 +1,170 @@
+# Pre-trade risk checks on a batch of candidates: the sizing and exposure limits checked
+# one trade at a time in Python, against RiskManager.check on the Trade objects and
+# RiskManager.size on the candidates as arrays, before any Trade is made. The second
+# table times the whole way from the signals to the orders: a Trade built for every
+# candidate and checked by the loop, against sizing first and only building the trades
+# that passed, like `Robot.trades_from_signals`.
+#
+#   python -m benchmarks.bench_risk --positions 200 --candidates 10 100 500 1000
+import time
+import argparse
+
+import numpy as np
+
+from essentials.trades import Trade
+from essentials.portfolio import Portfolio
+from essentials.risk import RiskManager
+
+
+def build(symbol: str, number: int, enter: bool, quantity: float = 0.0) -> Trade:
+
+    trade = Trade()
+    trade.new_trade(trade_id='{symbol}_{number}'.format(symbol=symbol, number=number), order_type='mkt',
+                    side='long', enter_or_exit='enter' if enter else 'exit')
+    trade.instrument(symbol=symbol, quantity=quantity, asset_type='CRYPTO')
+
+    return trade
+
+
+def candidates(symbols: list, count: int, rng: np.random.Generator) -> list:
+
+    # One candidate per symbol like the signals give, unless there are more candidates than symbols.
+    picks = rng.choice(len(symbols), size=count, replace=count > len(symbols))
+
+    return [build(symbol=symbols[pick], number=number, enter=rng.random() < 0.8) for number, pick in enumerate(picks.tolist())]
+
+
+def loop_check(risk: RiskManager, trades: list, prices: dict) -> list:
+    """The same rules for fixed fraction sizing, one trade after the other."""
+
+    portfolio = risk.portfolio
+    exposure = portfolio.exposure()
+    quantities = portfolio.quantities
+
+    used = {}
+    gross = float(np.abs(exposure).sum())
+    approved = []
+
+    for trade in trades:
+        slot = portfolio.slot(symbol=trade.symbol) if portfolio.in_portfolio(symbol=trade.symbol) else None
+        held = float(quantities[slot]) if slot is not None else 0.0
+        price = prices[trade.symbol]
+
+        if trade.enter_or_exit == 'exit':
+            if held > 0.0:
+                trade.modify_quantity(quantity=held)
+                approved.append(trade)
+            continue
+
+        current = float(exposure[slot]) if slot is not None else 0.0
+        room = max(risk.max_position * risk.equity - current - used.get(trade.symbol, 0.0), 0.0)
+        notional = min(risk.fraction * risk.equity, room, max(risk.max_gross * risk.equity - gross, 0.0))
+
+        if notional > 0.0:
+            used[trade.symbol] = used.get(trade.symbol, 0.0) + notional
+            gross += notional
+            trade.modify_quantity(quantity=notional / price)
+            approved.append(trade)
+
+    return approved
+
+
+def sized_trades(risk: RiskManager, symbols: list, enter: np.ndarray, prices: dict) -> list:
+    """Sizes the candidates first and only builds the trades that passed."""
+
+    quantity, reasons = risk.size(symbols=symbols, enter=enter, long=np.ones(len(symbols), dtype=bool), prices=prices)
+
+    return [
+        build(symbol=symbol, number=number, enter=entry, quantity=size)
+        for number, (symbol, entry, size, reason) in enumerate(zip(symbols, enter.tolist(), quantity.tolist(), reasons.tolist()))
+        if not reason
+    ]
+
+
+def reset(trades: list) -> None:
+
+    for trade in trades:
+        trade.modify_quantity(quantity=0.0)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--positions', type=int, default=200)
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--candidates', type=int, nargs='+', default=[10, 100, 500, 1000])
+    parser.add_argument('--repeat', type=int, default=200)
+    arguments = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    symbols = ['SYM{:04d}'.format(number) for number in range(arguments.symbols)]
+    prices = {symbol: float(rng.uniform(1.0, 200.0)) for symbol in symbols}
+
+    portfolio = Portfolio()
+    for symbol in symbols[:arguments.positions]:
+        portfolio.add_position(symbol=symbol, asset_type='CRYPTO', purchase_date=None,
+                               quantity=float(rng.uniform(0.1, 5.0)), purchase_price=prices[symbol])
+    portfolio.update_prices(prices=prices)
+
+    equity = 100 * float(np.abs(portfolio.exposure()).sum())
+    risk = RiskManager(portfolio=portfolio, equity=equity, fraction=0.001, max_position=0.01, max_gross=1.0)
+
+    print('{positions} positions, fixed fraction sizing, symbol and gross limits'.format(positions=arguments.positions))
+    print('  {count:>10s} {loop:>10s} {check:>10s} {speedup:>8s} {size:>10s} {speedup:>8s} {passed:>7s} {same:>5s}'.format(
+        count='candidates', loop='loop us', check='check us', size='size us', speedup='speedup', passed='passed', same='same'))
+
+    orders = []
+
+    for count in arguments.candidates:
+        trades = candidates(symbols=symbols, count=count, rng=rng)
+
+        batch_symbols = [trade.symbol for trade in trades]
+        enter = np.array([trade.enter_or_exit == 'enter' for trade in trades])
+        long = np.ones(count, dtype=bool)
+        price = np.array([prices[symbol] for symbol in batch_symbols])
+
+        loop_times, check_times, size_times, loop_order_times, sized_order_times = [], [], [], [], []
+        for _ in range(arguments.repeat):
+            reset(trades=trades)
+            start = time.perf_counter()
+            expected = [trade.order_size for trade in loop_check(risk=risk, trades=trades, prices=prices)]
+            loop_times.append(time.perf_counter() - start)
+
+            reset(trades=trades)
+            start = time.perf_counter()
+            passed = risk.check(trades=trades, prices=prices)
+            check_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            quantity, reasons = risk.size(symbols=batch_symbols, enter=enter, long=long, price=price)
+            size_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            loop_orders = loop_check(risk=risk, trades=[build(symbol=symbol, number=number, enter=entry)
+                                                        for number, (symbol, entry) in enumerate(zip(batch_symbols, enter.tolist()))], prices=prices)
+            loop_order_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            sized_orders = sized_trades(risk=risk, symbols=batch_symbols, enter=enter, prices=prices)
+            sized_order_times.append(time.perf_counter() - start)
+
+        same = np.allclose(expected, [trade.order_size for trade in passed]) and np.allclose(expected, quantity[reasons == 0])
+
+        loop_us = float(np.median(loop_times)) * 1e6
+        check_us = float(np.median(check_times)) * 1e6
+        size_us = float(np.median(size_times)) * 1e6
+        print('  {count:10d} {loop:10.1f} {check:10.1f} {check_speedup:7.1f}x {size:10.1f} {size_speedup:7.1f}x {passed:7d} {same!s:>5s}'.format(
+            count=count, loop=loop_us, check=check_us, check_speedup=loop_us / check_us, size=size_us,
+            size_speedup=loop_us / size_us, passed=len(passed), same=same))
+
+        orders.append((count, float(np.median(loop_order_times)) * 1e6, float(np.median(sized_order_times)) * 1e6,
+                       np.allclose([trade.order_size for trade in loop_orders], [trade.order_size for trade in sized_orders])))
+
+    print()
+    print('  signals to orders')
+    print('  {count:>10s} {loop:>10s} {sized:>10s} {speedup:>8s} {same:>5s}'.format(
+        count='candidates', loop='loop us', sized='sized us', speedup='speedup', same='same'))
+
+    for count, loop_us, sized_us, same in orders:
+        print('  {count:10d} {loop:10.1f} {sized:10.1f} {speedup:7.1f}x {same!s:>5s}'.format(
+            count=count, loop=loop_us, sized=sized_us, speedup=loop_us / sized_us, same=same))
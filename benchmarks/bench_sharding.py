@@ -0,0 +1,72 @@
+# Streams quotes for a large universe through one process against a ShardedRuntime,
+# every tick is add_rows, a streaming RSI refresh and a signal check.
+#
+#   python -m benchmarks.bench_sharding --symbols 1000 --ticks 200 --shards 1 2 4
+#
+# The sharded rate grows with the number of cores, on a single core the shards only
+# add the cost of the queues.
+import os
+import time
+import argparse
+
+from benchmarks.bench_backtest import random_walk_columns
+from benchmarks.bench_backtest import rsi_strategy
+from benchmarks.bench_timeframes import quotes_at
+
+from essentials.sharding import ShardedRuntime
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+
+
+def single_process(columns: dict, ticks: int) -> float:
+
+    stock_frame = StockFrame(data=[], backend='ring', capacity=ticks)
+    indicators = Indicators(price_data_frame=stock_frame, streaming=True)
+    rsi_strategy(indicators)
+
+    start = time.perf_counter()
+    for position in range(ticks):
+        stock_frame.add_rows(data=quotes_at(columns=columns, position=position))
+        indicators.refresh()
+        indicators.check_signals()
+
+    return time.perf_counter() - start
+
+
+def sharded(columns: dict, ticks: int, shards: int) -> float:
+
+    with ShardedRuntime(symbols=list(columns), strategy=rsi_strategy, shards=shards, bars=ticks) as runtime:
+
+        # Let the workers start up before the clock runs.
+        runtime.publish(quotes=quotes_at(columns=columns, position=0))
+        runtime.wait()
+
+        start = time.perf_counter()
+        for position in range(1, ticks):
+            runtime.publish(quotes=quotes_at(columns=columns, position=position))
+            runtime.signals()
+        runtime.wait()
+        elapsed = time.perf_counter() - start
+
+    return elapsed * ticks / (ticks - 1)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    arguments = parser.parse_args()
+
+    columns = random_walk_columns(symbols=arguments.symbols, bars=arguments.ticks)
+    quotes = arguments.symbols * arguments.ticks
+
+    print('{symbols} symbols x {ticks} ticks on {cores} core(s)'.format(symbols=arguments.symbols, ticks=arguments.ticks, cores=os.cpu_count()))
+
+    elapsed = single_process(columns=columns, ticks=arguments.ticks)
+    print('  one process  {rate:10,.0f} quotes/s'.format(rate=quotes / elapsed))
+
+    for shards in sorted(set(arguments.shards)):
+        elapsed = sharded(columns=columns, ticks=arguments.ticks, shards=shards)
+        print('  {shards:2d} shard(s)   {rate:10,.0f} quotes/s'.format(shards=shards, rate=quotes / elapsed))
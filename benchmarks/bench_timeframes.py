@@ -0,0 +1,73 @@
+# Streams 1m quotes into a ring StockFrame that keeps 5m, 1h and 1d rollups, against
+# resampling the whole 1m history with pandas every time a batch comes in.
+#
+#   python -m benchmarks.bench_timeframes --symbols 50 --bars 10000
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_backtest import random_walk_columns
+
+from essentials.stock_frame import StockFrame
+
+
+TIMEFRAMES = {'5m': '5min', '1h': '1h', '1d': '1D'}
+
+
+def quotes_at(columns: dict, position: int) -> dict:
+
+    return {
+        symbol: {
+            'quoteTimeInLong': int(symbol_columns['datetime'][position]),
+            'openPrice': float(symbol_columns['open'][position]),
+            'closePrice': float(symbol_columns['close'][position]),
+            'highPrice': float(symbol_columns['high'][position]),
+            'lowPrice': float(symbol_columns['low'][position]),
+            'volume': float(symbol_columns['volume'][position])
+        }
+        for symbol, symbol_columns in columns.items()
+    }
+
+
+def resample(frame: pd.DataFrame, rule: str) -> pd.DataFrame:
+
+    return frame.groupby(level='symbol').resample(rule, level='datetime').agg(
+        {'open': 'first', 'close': 'last', 'high': 'max', 'low': 'min', 'volume': 'sum'}
+    )
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=10000)
+    parser.add_argument('--stream', type=int, default=500)
+    arguments = parser.parse_args()
+
+    columns = random_walk_columns(symbols=arguments.symbols, bars=arguments.bars + arguments.stream)
+    history = {symbol: {name: values[:arguments.bars] for name, values in symbol_columns.items()} for symbol, symbol_columns in columns.items()}
+
+    stock_frame = StockFrame.from_columns(columns=history, backend='ring', capacity=arguments.bars + arguments.stream)
+    for interval in TIMEFRAMES:
+        stock_frame.add_timeframe(interval=interval)
+
+    start = time.perf_counter()
+    for position in range(arguments.bars, arguments.bars + arguments.stream):
+        stock_frame.add_rows(data=quotes_at(columns=columns, position=position))
+    rollup_time = (time.perf_counter() - start) / arguments.stream
+
+    base = StockFrame.from_columns(columns=history, backend='ring', capacity=arguments.bars + arguments.stream)
+    sample = min(arguments.stream, 5)
+
+    start = time.perf_counter()
+    for position in range(arguments.bars, arguments.bars + sample):
+        base.add_rows(data=quotes_at(columns=columns, position=position))
+        frame = base.frame
+        resampled = {interval: resample(frame=frame, rule=rule) for interval, rule in TIMEFRAMES.items()}
+    resample_time = (time.perf_counter() - start) / sample
+
+    print('{symbols} symbols x {bars} 1m bars, 5m/1h/1d kept current'.format(symbols=arguments.symbols, bars=arguments.bars))
+    print('  incremental rollup  {us:12.1f} us/batch'.format(us=rollup_time * 1e6))
+    print('  pandas resample     {us:12.1f} us/batch   {speedup:7.1f}x'.format(us=resample_time * 1e6, speedup=resample_time / rollup_time))
@@ -0,0 +1,466 @@
+# Local stand-ins for the Binance endpoints, so the network facing parts of the bot
+# can be exercised and benchmarked offline.
+import hmac
+import json
+import time
+import random
+import asyncio
+import hashlib
+import itertools
+import threading
+
+from collections import deque
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+from urllib.parse import parse_qs
+
+from typing import List
+
+import websockets
+
+
+def kline_messages(symbols: List[str], bars: int, start: int = 1600000000000, interval_ms: int = 60000,
+                   ticks_per_bar: int = 1) -> List[str]:
+    """Synthetic combined-stream kline messages, `ticks_per_bar` updates of every bar."""
+
+    messages = []
+
+    for bar in range(bars):
+        open_time = start + bar * interval_ms
+        for tick in range(ticks_per_bar):
+            for number, symbol in enumerate(symbols):
+                price = 100.0 + number + bar * 0.01 + tick * 0.001
+                messages.append(json.dumps({
+                    'stream': '{symbol}@kline_1m'.format(symbol=symbol.lower()),
+                    'data': {
+                        'e': 'kline',
+                        'E': open_time + tick,
+                        's': symbol,
+                        'k': {
+                            't': open_time,
+                            'T': open_time + interval_ms - 1,
+                            's': symbol,
+                            'i': '1m',
+                            'o': '{:.4f}'.format(price),
+                            'c': '{:.4f}'.format(price + 0.005),
+                            'h': '{:.4f}'.format(price + 0.01),
+                            'l': '{:.4f}'.format(price - 0.01),
+                            'v': '{:.2f}'.format(10.0 + tick),
+                            'x': tick == ticks_per_bar - 1
+                        }
+                    }
+                }))
+
+    return messages
+
+
+def agg_trade_messages(symbols: List[str], trades: int, start: int = 1600000000000, trades_per_second: int = 100000,
+                       seed: int = 0) -> List[str]:
+    """Synthetic combined-stream aggTrade messages, `trades` in total spread over the symbols."""
+
+    rng = random.Random(seed)
+    prices = {symbol: 100.0 + number for number, symbol in enumerate(symbols)}
+    messages = []
+
+    for trade in range(trades):
+        symbol = symbols[trade % len(symbols)]
+        prices[symbol] *= 1.0 + rng.gauss(0.0, 0.0002)
+        messages.append(json.dumps({
+            'stream': '{symbol}@aggTrade'.format(symbol=symbol.lower()),
+            'data': {
+                'e': 'aggTrade',
+                'E': start + trade * 1000 // trades_per_second + 1,
+                's': symbol,
+                'a': trade,
+                'p': '{:.4f}'.format(prices[symbol]),
+                'q': '{:.5f}'.format(rng.expovariate(2.0)),
+                'f': trade,
+                'l': trade,
+                'T': start + trade * 1000 // trades_per_second,
+                'm': rng.random() < 0.5
+            }
+        }))
+
+    return messages
+
+
+def depth_messages(symbol: str, updates: int, levels: int = 1000, changes: int = 5, start: int = 1600000000000,
+                   seed: int = 0) -> tuple:
+    """
+    A REST depth snapshot and `updates` diff-depth events following on from it. Every
+    event changes, adds or removes `changes` levels near the top of a book that drifts
+    with a random walk, like the @depth@100ms stream of a busy symbol.
+
+    :return: The snapshot and the combined-stream messages.
+    """
+
+    rng = random.Random(seed)
+    tick = 0.01
+    mid = 10000
+    bids = {mid - level: round(rng.uniform(0.1, 5.0), 4) for level in range(1, levels + 1)}
+    asks = {mid + level: round(rng.uniform(0.1, 5.0), 4) for level in range(1, levels + 1)}
+    last_update_id = 1000
+
+    snapshot = {
+        'lastUpdateId': last_update_id,
+        'bids': [['{:.2f}'.format(price * tick), '{:.4f}'.format(size)] for price, size in sorted(bids.items(), reverse=True)],
+        'asks': [['{:.2f}'.format(price * tick), '{:.4f}'.format(size)] for price, size in sorted(asks.items())]
+    }
+
+    messages = []
+
+    for update in range(updates):
+        mid += rng.choice((-1, 0, 0, 1))
+        changed = {'b': [], 'a': []}
+
+        for _ in range(changes):
+            side = rng.choice(('b', 'a'))
+            book = bids if side == 'b' else asks
+            price = mid - rng.randint(1, 50) if side == 'b' else mid + rng.randint(1, 50)
+            size = 0.0 if price in book and rng.random() < 0.3 else round(rng.uniform(0.1, 5.0), 4)
+
+            if size:
+                book[price] = size
+            else:
+                book.pop(price, None)
+            changed[side].append(['{:.2f}'.format(price * tick), '{:.4f}'.format(size)])
+
+        # The walk can leave levels on the wrong side of the mid, take them out like a trade would.
+        for price in [price for price in bids if price >= mid]:
+            del bids[price]
+            changed['b'].append(['{:.2f}'.format(price * tick), '0.0000'])
+        for price in [price for price in asks if price <= mid]:
+            del asks[price]
+            changed['a'].append(['{:.2f}'.format(price * tick), '0.0000'])
+
+        messages.append(json.dumps({
+            'stream': '{symbol}@depth@100ms'.format(symbol=symbol.lower()),
+            'data': {
+                'e': 'depthUpdate',
+                'E': start + update * 100,
+                's': symbol,
+                'U': last_update_id + 1,
+                'u': last_update_id + changes,
+                'b': changed['b'],
+                'a': changed['a']
+            }
+        }))
+        last_update_id += changes
+
+    return snapshot, messages
+
+
+class FakeStreamServer:
+
+    def __init__(self, messages: List[str], host: str = '127.0.0.1', port: int = 0) -> None:
+        """
+        A WebSocket server that answers a SUBSCRIBE request and then replays `messages`
+        to the client as fast as it can read them, closing the connection at the end.
+        """
+
+        self.messages = messages
+        self.host = host
+        self.port = port
+        self.subscriptions = []
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return 'ws://{host}:{port}'.format(host=self.host, port=self.port)
+
+    async def _handle(self, connection) -> None:
+
+        request = json.loads(await connection.recv())
+        self.subscriptions.extend(request.get('params', []))
+        await connection.send(json.dumps({'result': None, 'id': request.get('id')}))
+
+        for message in self.messages:
+            await connection.send(message)
+
+        await connection.close()
+
+    async def start(self) -> None:
+
+        self._server = await websockets.serve(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+
+        self._server.close()
+        await self._server.wait_closed()
+
+
+def synthetic_klines(symbol: str, start: int, end: int, interval_ms: int = 60000, limit: int = 1000) -> List[list]:
+    """Klines in the Binance REST layout, deterministic per symbol and open time."""
+
+    first = -(-start // interval_ms) * interval_ms
+    seed = sum(ord(character) for character in symbol)
+    klines = []
+
+    for open_time in range(first, end + 1, interval_ms):
+        if len(klines) == limit:
+            break
+        price = 100.0 + seed % 50 + (open_time // interval_ms) % 1000 * 0.01
+        klines.append([
+            open_time,
+            '{:.8f}'.format(price),
+            '{:.8f}'.format(price + 0.05),
+            '{:.8f}'.format(price - 0.05),
+            '{:.8f}'.format(price + 0.01),
+            '{:.8f}'.format(10.0 + seed % 7),
+            open_time + interval_ms - 1,
+            '0', 0, '0', '0', '0'
+        ])
+
+    return klines
+
+
+class FakeRestServer:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, api_secret: str = None,
+                 error_rate: float = 0.0, fill_price: float = 100.0, balance: float = None) -> None:
+        """
+        A threaded HTTP server answering GET /api/v3/klines with synthetic klines, and the
+        order endpoints (order, orderList/oco, oto, otoco, openOrders). Every answer waits
+        `latency` seconds to stand in for the round trip to the exchange, and carries the
+        X-MBX-USED-WEIGHT-1M and X-MBX-ORDER-COUNT-10S headers like Binance does.
+
+        The next order requests can be made to fail by adding to `faults`:
+
+            - 'error': answered with a 503 before doing anything,
+            - 'lost': the order is placed but answered with a 503, as if the answer got lost,
+            - 'throttle': answered with a 429 and a Retry-After of `retry_after` seconds,
+            - 'html': answered with the HTML page of a 502.
+
+        :param api_secret: Order requests must be signed with this secret, not checked if None.
+        :param error_rate: The share of order requests answered with a 503 before doing anything.
+        :param fill_price: The price market orders fill at.
+        :param balance: Orders worth more than this at their price (market orders at
+        `fill_price`) are rejected with -2010, not checked if None.
+        """
+
+        self.latency = latency
+        self.api_secret = api_secret
+        self.error_rate = error_rate
+        self.fill_price = fill_price
+        self.balance = balance
+        self.faults = deque()
+        self.retry_after = 0.05
+        self.requests = 0
+        self.orders: dict = {}
+        self._weight = 0
+        self._order_count = 0
+        self._order_window = time.monotonic()
+        self._order_ids = itertools.count(1)
+
+        # Reentrant, rejected orders are answered while the placed orders are locked.
+        self._lock = threading.RLock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            # Headers and body go out in separate writes, without this every answer on a
+            # kept-alive connection waits for the client's delayed ACK.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                server._handle_get(self)
+
+            def do_POST(self) -> None:
+                server._handle_post(self)
+
+            def do_DELETE(self) -> None:
+                server._handle_post(self)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.host, self.port = self._httpd.server_address[:2]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return 'http://{host}:{port}'.format(host=self.host, port=self.port)
+
+    def _reply(self, handler: BaseHTTPRequestHandler, status: int, body: object, weight: int = 1) -> None:
+
+        with self._lock:
+            self.requests += 1
+            self._weight += weight
+            used = self._weight
+
+        html = isinstance(body, str)
+        payload = body.encode() if html else json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'text/html' if html else 'application/json')
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.send_header('X-MBX-USED-WEIGHT-1M', str(used))
+        handler.send_header('X-MBX-ORDER-COUNT-10S', str(self._order_count))
+        if status == 429:
+            handler.send_header('Retry-After', str(self.retry_after))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _handle_get(self, handler: BaseHTTPRequestHandler) -> None:
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(handler.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/api/v3/klines':
+            klines = synthetic_klines(
+                symbol=query['symbol'],
+                start=int(query['startTime']),
+                end=int(query['endTime']),
+                limit=int(query.get('limit', 500))
+            )
+            self._reply(handler, 200, klines, weight=2)
+        elif url.path == '/api/v3/order' and 'clientOrderId' in self.orders.get(query.get('origClientOrderId'), {}):
+            self._reply(handler, 200, self.orders[query['origClientOrderId']], weight=4)
+        elif url.path == '/api/v3/orderList' and 'listClientOrderId' in self.orders.get(query.get('origClientOrderId'), {}):
+            self._reply(handler, 200, self.orders[query['origClientOrderId']], weight=4)
+        elif url.path in ('/api/v3/order', '/api/v3/orderList'):
+            self._reply(handler, 400, {'code': -2013, 'msg': 'Order does not exist.'}, weight=4)
+        else:
+            self._reply(handler, 404, {'code': -1, 'msg': 'Unknown path.'})
+
+    def _signed(self, query_string: str) -> bool:
+
+        if self.api_secret is None:
+            return True
+
+        payload, _, signature = query_string.rpartition('&signature=')
+        expected = hmac.new(self.api_secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+        return hmac.compare_digest(expected, signature)
+
+    def _new_order(self, symbol: str, side: str, order_type: str, quantity: str, client_id: str, price: str = None) -> dict:
+
+        filled = order_type == 'MARKET'
+        order = {
+            'symbol': symbol,
+            'orderId': next(self._order_ids),
+            'clientOrderId': client_id,
+            'transactTime': int(time.time() * 1000),
+            'price': price or '0.00000000',
+            'origQty': quantity,
+            'executedQty': quantity if filled else '0.00000000',
+            'status': 'FILLED' if filled else 'NEW',
+            'type': order_type,
+            'side': side
+        }
+        if filled:
+            order['fills'] = [{'price': str(self.fill_price), 'qty': quantity, 'commission': '0', 'commissionAsset': 'BNB'}]
+
+        return order
+
+    def _handle_post(self, handler: BaseHTTPRequestHandler) -> None:
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(handler.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        # Drain a body if one was sent, Binance takes the parameters from either.
+        length = int(handler.headers.get('Content-Length') or 0)
+        if length:
+            query.update({key: values[0] for key, values in parse_qs(handler.rfile.read(length).decode()).items()})
+
+        if not self._signed(query_string=url.query):
+            self._reply(handler, 401, {'code': -1022, 'msg': 'Signature for this request is not valid.'})
+            return
+
+        try:
+            fault = self.faults.popleft()
+        except IndexError:
+            fault = None
+
+        if fault == 'error' or self.error_rate and random.random() < self.error_rate:
+            self._reply(handler, 503, {'code': -1001, 'msg': 'Internal error; unable to process your request.'})
+            return
+
+        if fault == 'throttle':
+            self._reply(handler, 429, {'code': -1003, 'msg': 'Too many requests.'})
+            return
+
+        if fault == 'html':
+            self._reply(handler, 502, '<html><body><h1>502 Bad Gateway</h1></body></html>')
+            return
+
+        if handler.command == 'DELETE':
+            self._reply(handler, 200, [])
+            return
+
+        with self._lock:
+
+            client_id = query.get('newClientOrderId') or query.get('listClientOrderId')
+            if client_id in self.orders:
+                self._reply(handler, 400, {'code': -2010, 'msg': 'Duplicate order sent.'})
+                return
+
+            symbol = query.get('symbol')
+
+            if self.balance is not None:
+                quantity = query.get('quantity') or query.get('workingQuantity')
+                price = query.get('price') or query.get('workingPrice') or self.fill_price
+                if float(quantity) * float(price) > self.balance:
+                    self._reply(handler, 400, {'code': -2010, 'msg': 'Account has insufficient balance for requested action.'})
+                    return
+
+            if url.path == '/api/v3/order':
+                answer = self._new_order(symbol, query['side'], query['type'], query['quantity'], client_id, query.get('price'))
+                placed = 1
+
+            elif url.path in ('/api/v3/orderList/oco', '/api/v3/orderList/oto', '/api/v3/orderList/otoco'):
+                reports = []
+                if 'workingType' in query:
+                    reports.append(self._new_order(symbol, query['workingSide'], query['workingType'], query['workingQuantity'],
+                                                   client_id + '-w', query.get('workingPrice')))
+                for position in ('pending', 'above', 'below', 'pendingAbove', 'pendingBelow'):
+                    if position + 'Type' in query:
+                        side = query.get('side') or query.get('pendingSide')
+                        quantity = query.get('quantity') or query.get('pendingQuantity')
+                        reports.append(self._new_order(symbol, side, query[position + 'Type'], quantity,
+                                                       client_id + '-' + position, query.get(position + 'Price')))
+                answer = {
+                    'orderListId': next(self._order_ids),
+                    'listClientOrderId': client_id,
+                    'listOrderStatus': 'EXECUTING',
+                    'orderReports': reports
+                }
+                placed = len(reports)
+
+            else:
+                self._reply(handler, 404, {'code': -1, 'msg': 'Unknown path.'})
+                return
+
+            # Like Binance, the order count header covers the last 10 seconds.
+            if time.monotonic() - self._order_window >= 10.0:
+                self._order_window = time.monotonic()
+                self._order_count = 0
+
+            self.orders[client_id] = answer
+            self._order_count += placed
+
+        if fault == 'lost':
+            self._reply(handler, 503, {'code': -1001, 'msg': 'Internal error; unable to process your request.'})
+            return
+
+        self._reply(handler, 200, answer)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,329 @@
+# One run over the hot paths of the bot on synthetic data, saved as JSON so two runs
+# can be compared. Runs offline, nothing but NumPy and pandas is needed.
+#
+#   python -m benchmarks.suite --symbols 50 --bars 2000 --output results.json
+#   python -m benchmarks.suite --output new.json --baseline results.json --tolerance 0.15
+#
+# Every case is timed at least `--repeat` times and for at least `--min-time` seconds,
+# the fastest run is kept along with the spread of the runs. Compared against a
+# baseline, the suite exits with status 1 when a case got slower than the tolerance or,
+# for the noisy cases, than twice its spread, whichever is larger.
+import sys
+import json
+import time
+import argparse
+import operator
+import platform
+
+from typing import Dict
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_backtest import random_walk_columns
+from benchmarks.bench_timeframes import quotes_at
+
+from essentials.trades import Trade
+from essentials.portfolio import Portfolio
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+
+
+# Runs per case at most, however short the case.
+MAX_RUNS = 200
+
+# A change has to be this many times the spread of the runs to count, see `compare`.
+NOISE_FACTOR = 2.0
+
+INDICATORS = {
+    'change_in_price': lambda indicators: indicators.change_in_price(),
+    'rsi': lambda indicators: indicators.rsi(period=14),
+    'sma': lambda indicators: indicators.sma(period=20),
+    'ema': lambda indicators: indicators.ema(period=20)
+}
+
+
+def bar_rows(columns: dict) -> list:
+    """The bars as the list of dicts the StockFrame constructor takes."""
+
+    rows = []
+    for symbol, symbol_columns in columns.items():
+        for position, timestamp in enumerate(symbol_columns['datetime'].tolist()):
+            rows.append({
+                'symbol': symbol,
+                'datetime': timestamp,
+                'open': float(symbol_columns['open'][position]),
+                'close': float(symbol_columns['close'][position]),
+                'high': float(symbol_columns['high'][position]),
+                'low': float(symbol_columns['low'][position]),
+                'volume': float(symbol_columns['volume'][position])
+            })
+
+    return rows
+
+
+def head(columns: dict, bars: int) -> dict:
+    return {symbol: {name: values[:bars] for name, values in symbol_columns.items()} for symbol, symbol_columns in columns.items()}
+
+
+def with_signals(indicators: Indicators) -> Indicators:
+
+    indicators.rsi(period=14)
+    indicators.sma(period=20)
+    indicators.set_indicator_signals(indicator='rsi_14', buy=30.0, sell=70.0, condition_buy=operator.lt, condition_sell=operator.gt)
+    indicators.set_indicator_signals(indicator='sma_20', buy='close', sell='close', condition_buy=operator.lt, condition_sell=operator.gt)
+
+    return indicators
+
+
+def bracket_order(symbol: str, price: float) -> Trade:
+
+    trade = Trade()
+    trade.new_trade(trade_id=symbol, order_type='lmt', side='long', enter_or_exit='enter', price=price)
+    trade.instrument(symbol=symbol, quantity=1, asset_type='CRYPTO')
+    trade.add_stop_loss(stop_size=0.01, percentage=True)
+    trade.add_take_profit(profit_size=0.02, percentage=True)
+
+    return trade
+
+
+class Suite:
+
+    def __init__(self, symbols: int, bars: int, ticks: int, repeat: int, min_time: float = 0.5) -> None:
+        """
+        :param symbols: Number of symbols in the synthetic universe.
+        :param bars: Bars of history per symbol.
+        :param ticks: Quotes streamed in by the per-tick cases.
+        :param repeat: Least number of runs per case, the fastest one counts.
+        :param min_time: Short cases are run again until they took this many seconds in total.
+        """
+
+        self.symbols = symbols
+        self.bars = bars
+        self.ticks = ticks
+        self.repeat = repeat
+        self.min_time = min_time
+
+        self.columns = random_walk_columns(symbols=symbols, bars=bars + ticks)
+        self.history = head(columns=self.columns, bars=bars)
+        self.results: Dict[str, dict] = {}
+
+    def measure(self, name: str, function: Callable, setup: Callable = None, operations: int = 1, unit: str = 'call') -> None:
+        """
+        Times `function(setup())`, leaving the setup out of the timing.
+
+        :param operations: How many `unit`s one call of `function` does, the result is per unit.
+        """
+
+        timings = []
+        spent = 0.0
+        while len(timings) < self.repeat or (spent < self.min_time and len(timings) < MAX_RUNS):
+            state = setup() if setup is not None else None
+            start = time.perf_counter()
+            function(state)
+            elapsed = time.perf_counter() - start
+            spent += elapsed
+            timings.append(elapsed / operations)
+
+        fastest = min(timings)
+        median = float(np.median(timings))
+
+        self.results[name] = {
+            'seconds': fastest,
+            'median_seconds': median,
+            'spread': median / fastest - 1.0,
+            'runs': len(timings),
+            'unit': unit
+        }
+
+        print('  {name:40s} {us:14.2f} us/{unit:6s} {spread:+7.1%} over {runs} runs'.format(
+            name=name, us=fastest * 1e6, unit=unit, spread=median / fastest - 1.0, runs=len(timings)), flush=True)
+
+    def stream(self, stock_frame: StockFrame, on_tick: Callable = None) -> None:
+
+        for position in range(self.bars, self.bars + self.ticks):
+            stock_frame.add_rows(data=quotes_at(columns=self.columns, position=position))
+            if on_tick is not None:
+                on_tick()
+
+    def run(self) -> Dict[str, dict]:
+
+        rows = bar_rows(columns=head(columns=self.columns, bars=min(self.bars, 500)))
+
+        self.measure('frame.from_rows', lambda state: StockFrame(data=rows), operations=len(rows), unit='bar')
+        self.measure('frame.from_columns.pandas', lambda state: StockFrame.from_columns(columns=self.history),
+                     operations=self.symbols * self.bars, unit='bar')
+        self.measure('frame.from_columns.ring', lambda state: StockFrame.from_columns(columns=self.history, backend='ring').frame,
+                     operations=self.symbols * self.bars, unit='bar')
+
+        for backend in ('pandas', 'ring'):
+            self.measure(
+                'append.{backend}'.format(backend=backend),
+                lambda stock_frame: self.stream(stock_frame=stock_frame),
+                setup=lambda: StockFrame.from_columns(columns=self.history, backend=backend, capacity=self.bars + self.ticks),
+                operations=self.ticks,
+                unit='tick'
+            )
+
+        for name, add in INDICATORS.items():
+            self.measure(
+                'indicators.batch.{name}'.format(name=name),
+                add,
+                setup=lambda: Indicators(price_data_frame=StockFrame.from_columns(columns=self.history)),
+                operations=self.symbols * self.bars,
+                unit='bar'
+            )
+
+        def batch_indicators() -> Indicators:
+            return with_signals(Indicators(price_data_frame=StockFrame.from_columns(columns=self.history)))
+
+        self.measure('indicators.refresh.batch', lambda indicators: indicators.refresh(), setup=batch_indicators)
+
+        def streaming_indicators() -> Indicators:
+            stock_frame = StockFrame.from_columns(columns=self.history, backend='ring', capacity=self.bars + self.ticks)
+            return with_signals(Indicators(price_data_frame=stock_frame, streaming=True))
+
+        self.measure(
+            'indicators.refresh.streaming',
+            lambda indicators: self.stream(stock_frame=indicators.stock_frame, on_tick=indicators.refresh),
+            setup=streaming_indicators,
+            operations=self.ticks,
+            unit='tick'
+        )
+
+        def refreshed_indicators() -> Indicators:
+            indicators = batch_indicators()
+            indicators.refresh()
+            return indicators
+
+        self.measure('signals.check', lambda indicators: [indicators.check_signals() for _ in range(100)],
+                     setup=refreshed_indicators, operations=100)
+        self.measure('signals.history', lambda indicators: indicators.stock_frame.signal_history(indicators=indicators.get_indicator_signals(indicator=None)),
+                     setup=refreshed_indicators, operations=self.symbols * self.bars, unit='bar')
+
+        prices = self.columns[next(iter(self.columns))]['close'][:1000].tolist()
+
+        self.measure('orders.bracket', lambda state: [bracket_order(symbol='SYM0000', price=price) for price in prices],
+                     operations=len(prices), unit='order')
+        self.measure('orders.payload', lambda trades: [trade.order for trade in trades],
+                     setup=lambda: [bracket_order(symbol='SYM0000', price=price) for price in prices],
+                     operations=len(prices), unit='order')
+
+        def portfolio() -> tuple:
+            book = Portfolio()
+            symbols = list(self.columns)
+            for symbol in symbols:
+                book.add_position(symbol=symbol, asset_type='CRYPTO', purchase_date=None, quantity=1.0,
+                                  purchase_price=float(self.columns[symbol]['close'][0]))
+            closes = np.column_stack([self.columns[symbol]['close'] for symbol in symbols])
+            return book, book.slots(symbols=symbols), closes[:self.ticks]
+
+        self.measure(
+            'portfolio.mark_to_market',
+            lambda state: [state[0].mark_to_market(prices=tick, slots=state[1]) for tick in state[2]],
+            setup=portfolio,
+            operations=self.ticks,
+            unit='tick'
+        )
+
+        return self.results
+
+    def metadata(self) -> dict:
+
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'symbols': self.symbols,
+            'bars': self.bars,
+            'ticks': self.ticks,
+            'repeat': self.repeat,
+            'min_time': self.min_time
+        }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> list:
+    """
+    Compares the fastest runs. A case only counts as slower or faster when the change
+    is beyond `tolerance` (0.1 = 10%) and beyond `NOISE_FACTOR` times the larger spread
+    of its runs in the two results.
+
+    :return: The names of the cases that got slower.
+    """
+
+    regressions = []
+
+    print('\n  {case:40s} {base:>12s} {now:>12s} {change:>9s} {threshold:>9s}'.format(
+        case='case', base='baseline us', now='now us', change='change', threshold='threshold'))
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        # Baselines saved before the spread was recorded only have the median.
+        base = baseline[name]
+        base_spread = base.get('spread', base.get('median_seconds', base['seconds']) / base['seconds'] - 1.0)
+        threshold = max(tolerance, NOISE_FACTOR * max(result['spread'], base_spread))
+
+        change = result['seconds'] / base['seconds'] - 1.0
+        flag = ''
+        if change > threshold:
+            flag = '  slower'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = '  faster'
+
+        print('  {case:40s} {base:12.2f} {now:12.2f} {change:+8.1%} {threshold:8.1%}{flag}'.format(
+            case=name,
+            base=base['seconds'] * 1e6,
+            now=result['seconds'] * 1e6,
+            change=change,
+            threshold=threshold,
+            flag=flag
+        ))
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=2000)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.5)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    arguments = parser.parse_args()
+
+    suite = Suite(symbols=arguments.symbols, bars=arguments.bars, ticks=arguments.ticks, repeat=arguments.repeat,
+                  min_time=arguments.min_time)
+
+    print('{symbols} symbols x {bars} bars, {ticks} ticks'.format(symbols=arguments.symbols, bars=arguments.bars, ticks=arguments.ticks))
+    results = suite.run()
+
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump({'meta': suite.metadata(), 'results': results}, file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+
+        if baseline['meta']['symbols'] != arguments.symbols or baseline['meta']['bars'] != arguments.bars:
+            print('\n  The baseline ran on {symbols} symbols x {bars} bars, the numbers are per unit but may not compare.'.format(
+                symbols=baseline['meta']['symbols'],
+                bars=baseline['meta']['bars']
+            ))
+
+        regressions = compare(results=results, baseline=baseline['results'], tolerance=arguments.tolerance)
+        if regressions:
+            print('\n  {count} case(s) slower than the baseline by more than {tolerance:.0%} and their noise.'.format(
+                count=len(regressions), tolerance=arguments.tolerance))
+            sys.exit(1)
@@ -0,0 +1,202 @@
+import numpy as np
+
+from typing import List
+from typing import Dict
+from typing import Callable
+from typing import Optional
+
+from essentials.stock_frame import StockFrame
+
+
+BAR_KINDS = ('time', 'volume', 'dollar')
+
+# Per symbol state, [open time, open, close, high, low, volume, dollar volume, trades].
+OPEN_TIME, OPEN, CLOSE, HIGH, LOW, VOLUME, DOLLARS, TRADES = range(8)
+
+
+class TradeAggregator:
+
+    def __init__(self, stock_frame: StockFrame, kind: str = 'time', size: float = 1000, max_pending: int = 10000,
+                 on_flush: Callable = None) -> None:
+        """
+        Folds single trades, e.g. the aggTrade stream, into bars and hands the finished
+        bars to a StockFrame in batches.
+
+            - 'time' bars close every `size` milliseconds, e.g. 1000 for 1 second bars,
+            - 'volume' bars close once `size` units were traded,
+            - 'dollar' bars close once `size` was traded in quote currency.
+
+        Only the open bar of a symbol is kept as state. Finished bars wait in a queue
+        until `flush` is called or `max_pending` of them piled up, so memory stays the
+        same however many trades come in.
+
+        :param stock_frame: The StockFrame the bars are added to.
+        :param kind: 'time', 'volume' or 'dollar'.
+        :param size: The bar length in milliseconds, or the volume that closes a bar.
+        :param max_pending: The most finished bars held before they are flushed.
+        :param on_flush: Called with the number of bars after every flush.
+        """
+
+        if kind not in BAR_KINDS:
+            raise ValueError("Kind must be one of {kinds}.".format(kinds=', '.join(BAR_KINDS)))
+
+        if size <= 0:
+            raise ValueError("Size must be positive.")
+
+        self.stock_frame = stock_frame
+        self.kind = kind
+        self.size = size
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+
+        self._states: Dict[str, list] = {}
+
+        # Finished bars per symbol, one list per field so a flush is one `load_columns`.
+        self._pending: Dict[str, List[list]] = {}
+        self._pending_count = 0
+
+        # Open time of the last bar handed out per symbol, volume bars opened in the same
+        # millisecond are moved on by one so every bar keeps its own row.
+        self._last_open: Dict[str, int] = {}
+
+        self.trades = 0
+        self.bars = 0
+
+    def add_trade(self, symbol: str, price: float, quantity: float, timestamp: int) -> None:
+        """
+        :param symbol: The symbol traded.
+        :param price: The trade price.
+        :param quantity: The quantity traded.
+        :param timestamp: The trade time in milliseconds since the epoch.
+        """
+
+        self.trades += 1
+        state = self._states.get(symbol)
+
+        if self.kind == 'time':
+            open_time = timestamp - timestamp % self.size
+
+            if state is not None and open_time > state[OPEN_TIME]:
+                self._finish(symbol=symbol, state=state)
+                state = None
+
+            if state is None:
+                self._states[symbol] = [open_time, price, price, price, price, quantity, price * quantity, 1]
+                return
+
+        elif state is None:
+            state = [timestamp, price, price, price, price, 0.0, 0.0, 0]
+            self._states[symbol] = state
+
+        state[CLOSE] = price
+        if price > state[HIGH]:
+            state[HIGH] = price
+        elif price < state[LOW]:
+            state[LOW] = price
+        state[VOLUME] += quantity
+        state[DOLLARS] += price * quantity
+        state[TRADES] += 1
+
+        if self.kind == 'volume' and state[VOLUME] >= self.size or self.kind == 'dollar' and state[DOLLARS] >= self.size:
+            self._finish(symbol=symbol, state=state)
+            del self._states[symbol]
+
+    def add_event(self, event: dict) -> None:
+        """Adds an aggTrade (or trade) event of the stream, prices and quantities still as strings."""
+
+        self.add_trade(symbol=event['s'], price=float(event['p']), quantity=float(event['q']), timestamp=event['T'])
+
+    def add_trades(self, symbol: str, prices: np.ndarray, quantities: np.ndarray, timestamps: np.ndarray) -> None:
+        """Adds many trades of one symbol at once, e.g. a replay of historical trades."""
+
+        for price, quantity, timestamp in zip(np.asarray(prices).tolist(), np.asarray(quantities).tolist(), np.asarray(timestamps).tolist()):
+            self.add_trade(symbol, price, quantity, timestamp)
+
+    def _finish(self, symbol: str, state: list) -> None:
+
+        open_time = state[OPEN_TIME]
+        last_open = self._last_open.get(symbol, -1)
+        if open_time <= last_open:
+            open_time = last_open + 1
+        self._last_open[symbol] = open_time
+
+        pending = self._pending.get(symbol)
+        if pending is None:
+            pending = self._pending[symbol] = [[] for _ in range(6)]
+
+        pending[0].append(open_time)
+        pending[1].append(state[OPEN])
+        pending[2].append(state[CLOSE])
+        pending[3].append(state[HIGH])
+        pending[4].append(state[LOW])
+        pending[5].append(state[VOLUME])
+
+        self._pending_count += 1
+        if self._pending_count >= self.max_pending:
+            self.flush()
+
+    def close_bars(self, now: int) -> None:
+        """
+        Finishes the time bars whose interval ended before `now` (ms), so quiet symbols do
+        not wait for their next trade to show the last bar.
+        """
+
+        if self.kind != 'time':
+            return
+
+        for symbol, state in list(self._states.items()):
+            if state[OPEN_TIME] + self.size <= now:
+                self._finish(symbol=symbol, state=state)
+                del self._states[symbol]
+
+    def flush(self) -> int:
+        """
+        Adds the finished bars to the StockFrame, every symbol in one go.
+
+        :return: The number of bars added.
+        """
+
+        if not self._pending_count:
+            return 0
+
+        columns = {
+            symbol: {
+                'datetime': np.array(pending[0], dtype=np.int64),
+                'open': np.array(pending[1]),
+                'close': np.array(pending[2]),
+                'high': np.array(pending[3]),
+                'low': np.array(pending[4]),
+                'volume': np.array(pending[5])
+            }
+            for symbol, pending in self._pending.items()
+        }
+
+        count = self._pending_count
+        self._pending = {}
+        self._pending_count = 0
+
+        self.stock_frame.load_columns(columns=columns)
+        self.bars += count
+
+        if self.on_flush is not None:
+            self.on_flush(count)
+
+        return count
+
+    def open_bar(self, symbol: str) -> Optional[dict]:
+        """The bar of `symbol` still being built, as a quote."""
+
+        state = self._states.get(symbol)
+        if state is None:
+            return None
+
+        return {
+            'symbol': symbol,
+            'quoteTimeInLong': state[OPEN_TIME],
+            'openPrice': state[OPEN],
+            'closePrice': state[CLOSE],
+            'highPrice': state[HIGH],
+            'lowPrice': state[LOW],
+            'volume': state[VOLUME],
+            'trades': state[TRADES]
+        }
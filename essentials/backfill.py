@@ -0,0 +1,257 @@
+import time
+import threading
+
+from itertools import chain
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Optional
+
+
+BINANCE_API_URL = 'https://api.binance.com'
+
+# Binance caps a klines request at 1000 bars.
+KLINES_LIMIT = 1000
+
+# Request weight of GET /api/v3/klines and the default weight budget per minute.
+KLINES_WEIGHT = 2
+WEIGHT_PER_MINUTE = 6000
+
+INTERVAL_MS = {
+    '1m': 60000,
+    '3m': 3 * 60000,
+    '5m': 5 * 60000,
+    '15m': 15 * 60000,
+    '30m': 30 * 60000,
+    '1h': 3600000,
+    '2h': 2 * 3600000,
+    '4h': 4 * 3600000,
+    '6h': 6 * 3600000,
+    '8h': 8 * 3600000,
+    '12h': 12 * 3600000,
+    '1d': 86400000,
+    '3d': 3 * 86400000,
+    '1w': 7 * 86400000
+}
+
+# Positions of the fields we keep in a Binance kline array.
+KLINE_FIELDS = {
+    'datetime': 0,
+    'open': 1,
+    'high': 2,
+    'low': 3,
+    'close': 4,
+    'volume': 5
+}
+
+
+class WeightRateLimiter:
+
+    def __init__(self, limit: int = WEIGHT_PER_MINUTE, window: float = 60.0) -> None:
+        """
+        Client side book keeping of the exchange's request weight so the workers slow
+        down before Binance answers with a 429 (or bans the IP with a 418).
+
+        :param limit: The weight that may be used per window.
+        :param window: The length of the window in seconds.
+        """
+
+        self.limit = limit
+        self.window = window
+        self._used = 0
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    def acquire(self, weight: int) -> None:
+        """Blocks until `weight` fits into the current window."""
+
+        while True:
+
+            with self._lock:
+
+                now = time.monotonic()
+                if now - self._window_start >= self.window:
+                    self._window_start = now
+                    self._used = 0
+
+                if self._used + weight <= self.limit:
+                    self._used += weight
+                    return
+
+                wait = self.window - (now - self._window_start)
+
+            time.sleep(max(wait, 0.001))
+
+    def update(self, used_weight: Optional[str]) -> None:
+        """Syncs with the X-MBX-USED-WEIGHT-1M header, the exchange's count wins when it is higher."""
+
+        if used_weight is None:
+            return
+
+        with self._lock:
+            self._used = max(self._used, int(used_weight))
+
+    def backoff(self, seconds: float) -> None:
+        """Uses up the rest of the window, e.g. after a 429 with Retry-After."""
+
+        with self._lock:
+            self._used = self.limit
+            self._window_start = time.monotonic() - self.window + seconds
+
+
+def parse_klines(page: List[list]) -> Dict[str, np.ndarray]:
+    """
+    Turns a page of raw klines into typed columns, datetime as int64 milliseconds and
+    the prices and volume as float64. The strings are converted while NumPy fills the
+    arrays, no intermediate object or string arrays are made.
+    """
+
+    count = len(page)
+
+    timestamps = np.fromiter((row[0] for row in page), dtype=np.int64, count=count)
+    values = np.fromiter(
+        chain.from_iterable(row[1:6] for row in page),
+        dtype=np.float64,
+        count=count * 5
+    ).reshape(count, 5)
+
+    columns = {'datetime': timestamps}
+    for name, position in KLINE_FIELDS.items():
+        if name != 'datetime':
+            columns[name] = values[:, position - 1]
+
+    return columns
+
+
+def merge_pages(pages: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Concatenates pages into one time ordered set of columns, dropping duplicate bars."""
+
+    if not pages:
+        return parse_klines([])
+
+    columns = {name: np.concatenate([page[name] for page in pages]) for name in pages[0]}
+
+    timestamps, first = np.unique(columns['datetime'], return_index=True)
+
+    return {name: values[first] if name != 'datetime' else timestamps for name, values in columns.items()}
+
+
+class KlineBackfill:
+
+    def __init__(self, base_url: str = BINANCE_API_URL, max_workers: int = 8, limiter: WeightRateLimiter = None,
+                 session: 'requests.Session' = None, retries: int = 5) -> None:
+        """
+        Downloads historical klines for many symbols at once. Every symbol's range is cut
+        into pages of `KLINES_LIMIT` bars which are fetched by a bounded pool of workers
+        sharing one keep-alive session and one rate limiter.
+
+        :param base_url: The REST endpoint, point it at a local stub for testing.
+        :param max_workers: The most requests in flight.
+        :param limiter: The weight limiter, shared with other REST users if there are any.
+        :param session: A requests session, one with a pool per worker is made by default.
+        :param retries: How often a page is retried on 429, 418 or 5xx answers.
+        """
+
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.limiter = limiter if limiter is not None else WeightRateLimiter()
+        self.retries = retries
+
+        if session is None:
+            # Imported here, the StockFrame needs this module's parsers but not the HTTP stack.
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        self.session = session
+        self.requests_made = 0
+
+    def pages(self, start: int, end: int, interval: str) -> List[Tuple[int, int]]:
+        """Splits [start, end] (milliseconds) into page sized (startTime, endTime) ranges."""
+
+        step = INTERVAL_MS[interval] * KLINES_LIMIT
+
+        return [(page_start, min(page_start + step - 1, end)) for page_start in range(start, end + 1, step)]
+
+    def fetch_page(self, symbol: str, interval: str, start: int, end: int) -> Dict[str, np.ndarray]:
+
+        params = {
+            'symbol': symbol,
+            'interval': interval,
+            'startTime': start,
+            'endTime': end,
+            'limit': KLINES_LIMIT
+        }
+
+        for attempt in range(self.retries + 1):
+
+            self.limiter.acquire(KLINES_WEIGHT)
+            response = self.session.get(self.base_url + '/api/v3/klines', params=params, timeout=30)
+            self.requests_made += 1
+            self.limiter.update(response.headers.get('X-MBX-USED-WEIGHT-1M'))
+
+            if response.status_code in (418, 429):
+                self.limiter.backoff(float(response.headers.get('Retry-After', 2 ** attempt)))
+                continue
+
+            if response.status_code >= 500 and attempt < self.retries:
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+
+            response.raise_for_status()
+
+            return parse_klines(response.json())
+
+        raise RuntimeError("Gave up on klines for {symbol} after {retries} retries.".format(
+            symbol=symbol,
+            retries=self.retries
+        ))
+
+    def fetch(self, symbols: List[str], interval: str, start: int, end: int) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        :param symbols: The symbols to download.
+        :param interval: The kline interval, e.g. 1m.
+        :param start: The first open time in milliseconds since the epoch.
+        :param end: The last open time in milliseconds since the epoch.
+        :return: The merged columns per symbol, ready for `StockFrame.from_columns`.
+        """
+
+        return self.fetch_ranges(ranges={symbol: (start, end) for symbol in symbols}, interval=interval)
+
+    def fetch_ranges(self, ranges: Dict[str, Tuple[int, int]], interval: str) -> Dict[str, Dict[str, np.ndarray]]:
+        """Like `fetch`, with its own (start, end) range in milliseconds per symbol."""
+
+        pages: Dict[str, List[Tuple[int, Dict[str, np.ndarray]]]] = {symbol: [] for symbol in ranges}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            futures = {}
+            for symbol, (start, end) in ranges.items():
+                for page_start, page_end in self.pages(start=start, end=end, interval=interval):
+                    future = executor.submit(self.fetch_page, symbol, interval, page_start, page_end)
+                    futures[future] = (symbol, page_start)
+
+            for future in as_completed(futures):
+                symbol, page_start = futures[future]
+                pages[symbol].append((page_start, future.result()))
+
+        columns = {}
+        for symbol, symbol_pages in pages.items():
+            symbol_pages.sort(key=lambda page: page[0])
+            columns[symbol] = merge_pages([page for _, page in symbol_pages])
+
+        return columns
@@ -0,0 +1,572 @@
+import heapq
+import time
+
+import numpy as np
+
+from datetime import datetime
+from datetime import timezone
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+from typing import Optional
+
+from essentials.trades import Trade
+from essentials.orders import Order
+from essentials.portfolio import Portfolio
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+
+
+# Orders touched on the same bar fill in this order, a stop before a take profit is the
+# conservative guess since a bar does not tell which extreme came first.
+FILL_PRIORITY = {
+    'MARKET': 0,
+    'STOP': 1,
+    'STOP_LIMIT': 2,
+    'LIMIT': 3
+}
+
+BUYING = {'BUY', 'BUY_TO_COVER'}
+
+
+class SimulatedOrder:
+
+    def __init__(self, order: Order, trade: Trade, role: str, active_from: int) -> None:
+        """
+        An order made by `Trade` in the form the matching model works with.
+
+        :param order: The order, `Trade.order_object` or one of its children.
+        :param trade: The Trade the order belongs to.
+        :param role: 'entry', 'exit' or 'child'.
+        :param active_from: The first bar (position in the symbol's bars) it may fill on.
+        """
+
+        if order.order_type not in FILL_PRIORITY:
+            raise ValueError("The backtest can not fill {order_type} orders.".format(order_type=order.order_type))
+
+        leg = order.legs[0]
+
+        self.trade = trade
+        self.role = role
+        self.active_from = active_from
+        self.order_type = order.order_type
+        self.symbol = leg.instrument.symbol
+        self.quantity = leg.quantity
+        self.buying = leg.instruction in BUYING
+        self.price = order.price if order.price is not None else 0.0
+        self.stop_price = order.stop_price if order.stop_price is not None else 0.0
+        self.priority = FILL_PRIORITY[self.order_type]
+        self.triggered = False
+        self.cancelled = False
+
+        # The cash set aside for an entry until it filled.
+        self.reserved = 0.0
+
+        # Children only become active once this order filled.
+        self.children = [
+            SimulatedOrder(order=child, trade=trade, role='child', active_from=-1)
+            for child in order.children
+        ]
+        self.children.sort(key=lambda child: child.priority)
+
+
+class SimulatedBroker:
+
+    def __init__(self, bars: Dict[str, Dict[str, np.ndarray]], chunk_size: int = 4096) -> None:
+        """
+        Fills orders against OHLC bars:
+
+            - MARKET fills at the open of the first bar it is active on.
+            - LIMIT fills once the bar trades through the limit, at the open if it gapped past it.
+            - STOP fills once the bar touches the stop, at the open if it gapped past it.
+            - STOP_LIMIT turns into a LIMIT once its stop was touched.
+
+        :param bars: Per symbol the time ordered datetime and OHLC arrays.
+        :param chunk_size: How many bars are matched per NumPy call when scanning ahead.
+        """
+
+        self.bars = bars
+        self.chunk_size = chunk_size
+
+    def scan(self, order: SimulatedOrder, start: int, end: int = None) -> Optional[Tuple[int, float]]:
+        """
+        Finds the first bar in [start, end) the order fills on, looking at the bars in
+        chunks so an order filling soon does not pay for the whole history.
+
+        :return: The position of the bar and the fill price, None if it does not fill.
+        """
+
+        length = len(self.bars[order.symbol]['open'])
+        end = length if end is None else min(end, length)
+        start = max(start, order.active_from)
+
+        for chunk_start in range(start, end, self.chunk_size):
+            fill = self._match(order=order, start=chunk_start, end=min(chunk_start + self.chunk_size, end))
+            if fill is not None:
+                return fill
+
+        return None
+
+    def _match(self, order: SimulatedOrder, start: int, end: int) -> Optional[Tuple[int, float]]:
+
+        bars = self.bars[order.symbol]
+
+        if order.order_type == 'MARKET':
+            return start, float(bars['open'][start])
+
+        opens = bars['open'][start:end]
+        highs = bars['high'][start:end]
+        lows = bars['low'][start:end]
+        offset = 0
+
+        if order.order_type in ('STOP', 'STOP_LIMIT') and not order.triggered:
+
+            touched = highs >= order.stop_price if order.buying else lows <= order.stop_price
+            first = int(np.argmax(touched))
+            if not touched[first]:
+                return None
+
+            if order.order_type == 'STOP':
+                gap = max if order.buying else min
+                return start + first, float(gap(opens[first], order.stop_price))
+
+            order.triggered = True
+
+            # The limit is live from the moment the stop was hit, take it on that bar if
+            # the bar reached it.
+            if lows[first] <= order.price <= highs[first]:
+                return start + first, float(order.price)
+
+            offset = first + 1
+
+        touched = lows[offset:] <= order.price if order.buying else highs[offset:] >= order.price
+        if not len(touched):
+            return None
+
+        first = int(np.argmax(touched))
+        if not touched[first]:
+            return None
+
+        gap = min if order.buying else max
+        return start + offset + first, float(gap(opens[offset + first], order.price))
+
+
+class BacktestResult:
+
+    def __init__(self, mode: str, bars: int, elapsed: float, cash: float, equity: float, fills: List[dict],
+                 round_trips: List[dict], portfolio: Portfolio) -> None:
+
+        self.mode = mode
+        self.bars = bars
+        self.elapsed = elapsed
+        self.cash = cash
+        self.equity = equity
+        self.fills = fills
+        self.round_trips = round_trips
+        self.portfolio = portfolio
+
+    @property
+    def bars_per_second(self) -> float:
+        return self.bars / self.elapsed if self.elapsed else float('inf')
+
+    def summary(self) -> dict:
+
+        profits = [trip['profit_loss'] for trip in self.round_trips]
+
+        return {
+            'mode': self.mode,
+            'bars': self.bars,
+            'elapsed_s': self.elapsed,
+            'bars_per_second': self.bars_per_second,
+            'fills': len(self.fills),
+            'round_trips': len(self.round_trips),
+            'win_rate': float(sum(profit > 0 for profit in profits) / len(profits)) if profits else 0.0,
+            'profit_loss': float(sum(profits)),
+            'cash': float(self.cash),
+            'equity': float(self.equity),
+            'open_positions': len(self.portfolio)
+        }
+
+
+class Backtest:
+
+    def __init__(self, columns: Dict[str, Dict[str, np.ndarray]], strategy: Callable[[Indicators], None],
+                 signal_mode: str = 'and', cash: float = 10000.0, allocation: float = 0.1, stop_loss: float = None,
+                 take_profit: float = None, commission: float = 0.001, slippage: float = 0.0,
+                 asset_type: str = 'CRYPTO', capacity: int = 10000, chunk_size: int = 10) -> None:
+        """
+        Replays stored bars through the bot: signals become `Trade` orders (with the stop
+        loss and take profit children), the orders are filled by a `SimulatedBroker` and
+        the fills update a `Portfolio`. Buy signals open a long position, sell signals
+        close it. Orders made on a bar's close are filled from the next bar on.
+
+        :param columns: Per symbol the time ordered bars, as returned by `BarStore.load_many`.
+        :param strategy: Called with an `Indicators` object, adds the indicators and sets
+        the signals, e.g. `indicators.rsi(period=14)` and `indicators.set_indicator_signals(...)`.
+        :param signal_mode: 'and' when every indicator has to agree, 'or' when one is enough.
+        :param cash: The starting cash.
+        :param allocation: The part of the free cash put into a new position.
+        :param stop_loss: The stop loss as a fraction of the entry price, e.g. 0.02.
+        :param take_profit: The take profit as a fraction of the entry price.
+        :param commission: The fee as a fraction of the traded value.
+        :param slippage: Fills are this fraction worse than the matched price.
+        :param asset_type: The asset type put on the orders and positions.
+        :param capacity: The ring buffer capacity per symbol in event mode.
+        :param chunk_size: How many symbols get their indicators calculated at once in fast mode.
+        """
+
+        self.columns = columns
+        self.symbols = list(columns)
+        self.strategy = strategy
+        self.signal_mode = signal_mode
+        self.starting_cash = cash
+        self.allocation = allocation
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.commission = commission
+        self.slippage = slippage
+        self.asset_type = asset_type
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+
+        self.bars = {
+            symbol: {
+                'datetime': np.asarray(symbol_columns['datetime'], dtype=np.int64),
+                'open': np.asarray(symbol_columns['open'], dtype=np.float64),
+                'high': np.asarray(symbol_columns['high'], dtype=np.float64),
+                'low': np.asarray(symbol_columns['low'], dtype=np.float64),
+                'close': np.asarray(symbol_columns['close'], dtype=np.float64),
+                'volume': np.asarray(symbol_columns['volume'], dtype=np.float64)
+            }
+            for symbol, symbol_columns in columns.items()
+        }
+
+        self.broker = SimulatedBroker(bars=self.bars)
+
+    def _reset(self) -> None:
+
+        self.portfolio = Portfolio()
+        self.cash = self.starting_cash
+        self._reserved = 0.0
+        self._trade_count = 0
+        self._pending: Dict[str, List[SimulatedOrder]] = {symbol: [] for symbol in self.symbols}
+        self._entries: Dict[str, dict] = {}
+        self._fills: List[dict] = []
+        self._round_trips: List[dict] = []
+
+    def run(self, mode: str = 'fast') -> BacktestResult:
+        """
+        :param mode: 'event' feeds every bar through `StockFrame.add_rows`, streaming
+        `Indicators.refresh` and `check_signals`, exactly like the live loop. 'fast'
+        calculates the indicators and signals of the whole history in bulk and only
+        steps from one signal or fill to the next.
+        :return: The fills, round trips and final portfolio, with the throughput.
+        """
+
+        if mode not in ('event', 'fast'):
+            raise ValueError("Mode must be either 'event' or 'fast'.")
+
+        self._reset()
+
+        start = time.perf_counter()
+        if mode == 'event':
+            self._run_events()
+        else:
+            self._run_fast()
+        elapsed = time.perf_counter() - start
+
+        equity = self.cash
+        for symbol, entry in self._entries.items():
+            equity += entry['quantity'] * self.bars[symbol]['close'][-1]
+
+        return BacktestResult(
+            mode=mode,
+            bars=sum(len(bars['datetime']) for bars in self.bars.values()),
+            elapsed=elapsed,
+            cash=self.cash,
+            equity=equity,
+            fills=self._fills,
+            round_trips=self._round_trips,
+            portfolio=self.portfolio
+        )
+
+    def _run_events(self) -> None:
+
+        stock_frame = StockFrame(data=[], backend='ring', capacity=self.capacity)
+        indicators = Indicators(price_data_frame=stock_frame, streaming=True)
+        self.strategy(indicators)
+
+        cursors = dict.fromkeys(self.symbols, 0)
+        timeline = np.unique(np.concatenate([bars['datetime'] for bars in self.bars.values()]))
+
+        for timestamp in timeline.tolist():
+
+            quotes = {}
+            positions = {}
+
+            for symbol in self.symbols:
+
+                bars = self.bars[symbol]
+                position = cursors[symbol]
+                if position == len(bars['datetime']) or bars['datetime'][position] != timestamp:
+                    continue
+
+                cursors[symbol] = position + 1
+                positions[symbol] = position
+
+                if self._pending[symbol]:
+                    self._fill_bar(symbol=symbol, position=position)
+
+                quotes[symbol] = {
+                    'quoteTimeInLong': timestamp,
+                    'openPrice': bars['open'][position],
+                    'closePrice': bars['close'][position],
+                    'highPrice': bars['high'][position],
+                    'lowPrice': bars['low'][position],
+                    'volume': bars['volume'][position]
+                }
+
+            stock_frame.add_rows(data=quotes)
+            indicators.refresh()
+
+            signals = indicators.check_signals(mode=self.signal_mode)
+            if signals is None:
+                continue
+
+            buys = dict(zip(signals.index, signals['buy'].to_numpy()))
+            sells = dict(zip(signals.index, signals['sell'].to_numpy()))
+
+            for symbol, position in positions.items():
+                self._signal(symbol=symbol, position=position, buy=buys.get(symbol, False), sell=sells.get(symbol, False))
+
+    def _fill_bar(self, symbol: str, position: int) -> None:
+
+        orders = self._pending[symbol]
+        index = 0
+
+        # An entry filling at the open hands the bar on to its children, so the list
+        # may grow while it is walked.
+        while index < len(orders):
+
+            order = orders[index]
+            index += 1
+
+            if order.cancelled or order.active_from > position:
+                continue
+
+            fill = self.broker.scan(order=order, start=position, end=position + 1)
+            if fill is not None:
+                self._fill(order=order, position=fill[0], price=fill[1])
+                orders = self._pending[symbol]
+                index = 0
+
+    def _bulk_signals(self) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+
+        signals = {}
+
+        # A few symbols at a time keeps the frame and indicator columns small.
+        for first in range(0, len(self.symbols), self.chunk_size):
+
+            chunk = self.symbols[first:first + self.chunk_size]
+            stock_frame = StockFrame.from_columns(columns={symbol: self.columns[symbol] for symbol in chunk})
+            indicators = Indicators(price_data_frame=stock_frame)
+            self.strategy(indicators)
+
+            history = stock_frame.signal_history(indicators=indicators.get_indicator_signals(None), mode=self.signal_mode)
+
+            for symbol, rows in stock_frame.symbol_slices.items():
+                if history is None:
+                    signals[symbol] = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+                else:
+                    signals[symbol] = (
+                        np.flatnonzero(history['buy'].to_numpy()[rows]),
+                        np.flatnonzero(history['sell'].to_numpy()[rows])
+                    )
+
+        return signals
+
+    def _run_fast(self) -> None:
+
+        signals = self._bulk_signals()
+        order_of = {symbol: number for number, symbol in enumerate(self.symbols)}
+
+        # Every symbol has at most one live event, fills sort before signals on the same
+        # timestamp and symbols keep the order event mode walks them in.
+        events = []
+        versions = dict.fromkeys(self.symbols, 0)
+        cursors = dict.fromkeys(self.symbols, 0)
+
+        def schedule(symbol: str) -> None:
+
+            versions[symbol] += 1
+            timestamps = self.bars[symbol]['datetime']
+            buys, sells = signals.get(symbol, (np.zeros(0, dtype=np.int64),) * 2)
+            pending = [order for order in self._pending[symbol] if not order.cancelled]
+            candidates = []
+
+            for order in pending:
+                fill = self.broker.scan(order=order, start=cursors[symbol])
+                if fill is not None:
+                    candidates.append((fill[0], 0, order.priority, order, fill[1]))
+
+            # A pending entry or exit ignores signals until it filled.
+            if not any(order.role != 'child' for order in pending):
+                candidates_signals = sells if symbol in self._entries else buys
+                next_signal = np.searchsorted(candidates_signals, cursors[symbol])
+                if next_signal < len(candidates_signals):
+                    candidates.append((int(candidates_signals[next_signal]), 1, 0, None, 0.0))
+
+            if candidates:
+                position, kind, priority, order, price = min(candidates, key=lambda candidate: candidate[:3])
+                heapq.heappush(events, (
+                    int(timestamps[position]), kind, order_of[symbol], priority, versions[symbol], symbol, position, order, price
+                ))
+
+        for symbol in self.symbols:
+            schedule(symbol=symbol)
+
+        while events:
+
+            _, kind, _, _, version, symbol, position, order, price = heapq.heappop(events)
+            if version != versions[symbol]:
+                continue
+
+            if kind == 0:
+                self._fill(order=order, position=position, price=price)
+                cursors[symbol] = position
+            else:
+                in_position = symbol in self._entries
+                self._signal(symbol=symbol, position=position, buy=not in_position, sell=in_position)
+                cursors[symbol] = position + 1
+
+            schedule(symbol=symbol)
+
+    def _signal(self, symbol: str, position: int, buy: bool, sell: bool) -> None:
+
+        # Waiting on an entry or exit to fill.
+        if any(order.role != 'child' and not order.cancelled for order in self._pending[symbol]):
+            return
+
+        if symbol not in self._entries and buy:
+            self._enter(symbol=symbol, position=position)
+        elif symbol in self._entries and sell:
+            self._exit(symbol=symbol, position=position)
+
+    def _new_trade(self, symbol: str, enter_or_exit: str, quantity: float, price: float) -> Trade:
+
+        self._trade_count += 1
+
+        trade = Trade()
+        trade.new_trade(
+            trade_id='{symbol}_{count}'.format(symbol=symbol, count=self._trade_count),
+            order_type='mkt',
+            side='long',
+            enter_or_exit=enter_or_exit,
+            price=price
+        )
+        trade.instrument(symbol=symbol, quantity=quantity, asset_type=self.asset_type)
+
+        return trade
+
+    def _enter(self, symbol: str, position: int) -> None:
+
+        close = self.bars[symbol]['close'][position]
+        value = (self.cash - self._reserved) * self.allocation
+
+        if value <= 0.0 or close <= 0.0:
+            return
+
+        trade = self._new_trade(symbol=symbol, enter_or_exit='enter', quantity=value / close, price=close)
+
+        if self.stop_loss:
+            trade.add_stop_loss(stop_size=self.stop_loss, percentage=True)
+
+        if self.take_profit:
+            trade.add_take_profit(profit_size=self.take_profit, percentage=True)
+
+        order = SimulatedOrder(order=trade.order_object, trade=trade, role='entry', active_from=position + 1)
+        order.reserved = value
+        self._reserved += value
+        self._pending[symbol] = [order]
+
+    def _exit(self, symbol: str, position: int) -> None:
+
+        for order in self._pending[symbol]:
+            order.cancelled = True
+
+        entry = self._entries[symbol]
+        trade = self._new_trade(
+            symbol=symbol,
+            enter_or_exit='exit',
+            quantity=entry['quantity'],
+            price=self.bars[symbol]['close'][position]
+        )
+
+        self._pending[symbol] = [SimulatedOrder(order=trade.order_object, trade=trade, role='exit', active_from=position + 1)]
+
+    def _fill(self, order: SimulatedOrder, position: int, price: float) -> None:
+
+        symbol = order.symbol
+        timestamp = int(self.bars[symbol]['datetime'][position])
+        price *= 1.0 + self.slippage if order.buying else 1.0 - self.slippage
+        value = order.quantity * price
+        fee = value * self.commission
+
+        order.trade.order_response = {
+            'symbol': symbol,
+            'status': 'FILLED',
+            'executedQty': order.quantity,
+            'price': price,
+            'transactTime': timestamp
+        }
+
+        self._fills.append({
+            'symbol': symbol,
+            'datetime': timestamp,
+            'role': order.role,
+            'order_type': order.order_type,
+            'buying': order.buying,
+            'quantity': order.quantity,
+            'price': price,
+            'fee': fee
+        })
+
+        if order.role == 'entry':
+
+            self._reserved -= order.reserved
+            self.cash -= value + fee
+            self._entries[symbol] = {'quantity': order.quantity, 'cost': value + fee, 'datetime': timestamp}
+
+            self.portfolio.add_position(
+                symbol=symbol,
+                asset_type=self.asset_type,
+                purchase_date=datetime.fromtimestamp(timestamp / 1000.0, tz=timezone.utc).isoformat(),
+                quantity=order.quantity,
+                purchase_price=price
+            )
+
+            for child in order.children:
+                child.active_from = position
+            self._pending[symbol] = list(order.children)
+
+            return
+
+        # An exit or one of the children closed the position, the others are void.
+        for other in self._pending[symbol]:
+            other.cancelled = True
+        self._pending[symbol] = []
+
+        entry = self._entries.pop(symbol)
+        self.cash += value - fee
+        self.portfolio.remove_position(symbol=symbol)
+
+        self._round_trips.append({
+            'symbol': symbol,
+            'entry_datetime': entry['datetime'],
+            'exit_datetime': timestamp,
+            'quantity': order.quantity,
+            'exit_type': order.order_type,
+            'profit_loss': value - fee - entry['cost']
+        })
@@ -0,0 +1,225 @@
+import os
+import glob
+
+import numpy as np
+
+from typing import List
+from typing import Dict
+from typing import Optional
+
+from essentials.backfill import KlineBackfill
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+
+EXTENSIONS = {
+    'arrow': '.arrow',
+    'parquet': '.parquet'
+}
+
+
+class BarStore:
+
+    def __init__(self, root: str, file_format: str = 'arrow') -> None:
+        """
+        A local cache of bars, one directory per interval and symbol:
+
+            <root>/<interval>/<symbol>/part-<first ms>-<last ms>.arrow
+
+        Every save writes a new part holding only the bars newer than what is cached, the
+        time range is in the file name so finding the tail needs no reads. Arrow IPC files
+        are memory-mapped on load so the columns are read without a copy, Parquet files
+        are smaller but get decoded.
+
+        :param root: The directory of the cache.
+        :param file_format: Either 'arrow' or 'parquet'.
+        """
+
+        if pa is None:
+            raise ImportError("BarStore needs the pyarrow package, pip install pyarrow.")
+
+        if file_format not in EXTENSIONS:
+            raise ValueError("File format must be either 'arrow' or 'parquet'.")
+
+        self.root = root
+        self.file_format = file_format
+
+    def _directory(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, interval, symbol)
+
+    def parts(self, symbol: str, interval: str) -> List[str]:
+        """The part files of a symbol, ordered by time."""
+
+        pattern = os.path.join(self._directory(symbol, interval), 'part-*' + EXTENSIONS[self.file_format])
+
+        return sorted(glob.glob(pattern), key=self._range)
+
+    def _range(self, path: str) -> tuple:
+
+        name = os.path.basename(path)[len('part-'):-len(EXTENSIONS[self.file_format])]
+        first, last = name.split('-')
+
+        return int(first), int(last)
+
+    def symbols(self, interval: str) -> List[str]:
+
+        directory = os.path.join(self.root, interval)
+        if not os.path.isdir(directory):
+            return []
+
+        return sorted(os.listdir(directory))
+
+    def last_timestamp(self, symbol: str, interval: str) -> Optional[int]:
+        """The open time of the newest cached bar in milliseconds, None if nothing is cached."""
+
+        parts = self.parts(symbol, interval)
+        if not parts:
+            return None
+
+        return max(self._range(path)[1] for path in parts)
+
+    def _tail_matches(self, symbol: str, interval: str, columns: Dict[str, np.ndarray], position: int) -> bool:
+
+        tail = self._read(self.parts(symbol, interval)[-1])
+        last = tail.num_rows - 1
+
+        return all(tail.column(name)[last].as_py() == columns[name][position] for name in COLUMNS)
+
+    def save(self, symbol: str, interval: str, columns: Dict[str, np.ndarray]) -> int:
+        """
+        Writes the bars of `columns` newer than the cached tail as a new part. A changed
+        copy of the newest cached bar, e.g. one cached while it was still open, goes into
+        the new part too and replaces the cached one on load.
+
+        :return: The number of bars written.
+        """
+
+        timestamps = np.asarray(columns['datetime'], dtype=np.int64)
+        last = self.last_timestamp(symbol, interval)
+
+        if last is None:
+            newer = np.ones(len(timestamps), dtype=bool)
+        else:
+            newer = timestamps > last
+
+            same = np.flatnonzero(timestamps == last)
+            if len(same) and not self._tail_matches(symbol, interval, columns, position=int(same[-1])):
+                newer[same[-1]] = True
+
+        if not newer.any():
+            return 0
+
+        self._write(symbol, interval, {
+            name: np.asarray(columns[name], dtype=np.int64 if name == 'datetime' else np.float64)[newer]
+            for name in COLUMNS
+        })
+
+        return int(newer.sum())
+
+    def _write(self, symbol: str, interval: str, columns: Dict[str, np.ndarray]) -> str:
+
+        table = pa.table({name: columns[name] for name in COLUMNS})
+
+        directory = self._directory(symbol, interval)
+        os.makedirs(directory, exist_ok=True)
+
+        kept = columns['datetime']
+        path = os.path.join(directory, 'part-{first}-{last}{extension}'.format(
+            first=int(kept[0]),
+            last=int(kept[-1]),
+            extension=EXTENSIONS[self.file_format]
+        ))
+
+        # Write next to the target and rename, a crash never leaves half a part behind.
+        temporary = path + '.tmp'
+        if self.file_format == 'arrow':
+            with pa.OSFile(temporary, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        else:
+            pq.write_table(table, temporary)
+        os.replace(temporary, path)
+
+        return path
+
+    def _read(self, path: str):
+
+        if self.file_format == 'arrow':
+            return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+        return pq.read_table(path, memory_map=True)
+
+    def load(self, symbol: str, interval: str) -> Dict[str, np.ndarray]:
+        """
+        :return: The cached bars as typed columns, datetime in milliseconds. With a single
+        Arrow part the arrays are views on the memory-mapped file.
+        """
+
+        tables = []
+        for path in self.parts(symbol, interval):
+            table = self._read(path)
+
+            # A later part replaces the bars it overlaps in the one before.
+            if tables and table.num_rows:
+                first = table.column('datetime')[0].as_py()
+                previous = tables[-1]
+                tables[-1] = previous.slice(0, int(np.searchsorted(previous.column('datetime').to_numpy(), first)))
+
+            tables.append(table)
+
+        if not tables:
+            return {name: np.zeros(0, dtype=np.int64 if name == 'datetime' else np.float64) for name in COLUMNS}
+
+        table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+
+        return {name: table.column(name).to_numpy() for name in COLUMNS}
+
+    def load_many(self, symbols: List[str], interval: str) -> Dict[str, Dict[str, np.ndarray]]:
+        """The cached bars of every symbol, ready for `StockFrame.from_columns`."""
+
+        return {symbol: self.load(symbol, interval) for symbol in symbols}
+
+    def compact(self, symbol: str, interval: str) -> None:
+        """Rewrites all parts of a symbol into one file, handy after many small top-ups."""
+
+        parts = self.parts(symbol, interval)
+        if len(parts) < 2:
+            return
+
+        columns = {name: np.array(values) for name, values in self.load(symbol, interval).items()}
+
+        # The merged part is in place before the old ones go, a crash in between only
+        # leaves bars that are cached twice.
+        merged = self._write(symbol, interval, columns)
+
+        for path in parts:
+            if path != merged:
+                os.remove(path)
+
+    def top_up(self, backfill: KlineBackfill, symbols: List[str], interval: str, start: int, end: int) -> Dict[str, int]:
+        """
+        Fetches only the bars missing since the newest cached bar of every symbol, starting
+        at `start` for symbols that are not cached yet, and saves them. The newest cached
+        bar is fetched again, it may have been cached before it closed.
+
+        :return: The number of new bars per symbol.
+        """
+
+        ranges = {}
+        for symbol in symbols:
+            last = self.last_timestamp(symbol, interval)
+            first = start if last is None else last
+            if first <= end:
+                ranges[symbol] = (first, end)
+
+        fetched = backfill.fetch_ranges(ranges=ranges, interval=interval) if ranges else {}
+
+        return {symbol: self.save(symbol, interval, columns) for symbol, columns in fetched.items()}
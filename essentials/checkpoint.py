@@ -0,0 +1,428 @@
+import os
+import json
+import time
+import shutil
+import operator
+
+import numpy as np
+
+from typing import List
+from typing import Dict
+from typing import Callable
+from typing import Optional
+
+from essentials.portfolio import Portfolio
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+
+
+LATEST = 'LATEST'
+PREFIX = 'checkpoint-'
+FORMAT_VERSION = 1
+
+
+def _operator_name(function: Callable) -> Optional[str]:
+
+    # Only the comparisons of the operator module can be written down by name.
+    name = getattr(function, '__name__', None)
+
+    if name is not None and getattr(operator, name, None) is function:
+        return name
+
+    return None
+
+
+class Checkpoint:
+
+    def __init__(self, path: str, created: float, stock_frame: StockFrame, indicators: List[Indicators], portfolio: Optional[Portfolio]) -> None:
+        """
+        What `CheckpointStore.restore` brings back.
+
+        :param path: The directory of the checkpoint.
+        :param created: When it was written, in seconds since the epoch.
+        """
+
+        self.path = path
+        self.created = created
+        self.stock_frame = stock_frame
+        self.indicators = indicators
+        self.portfolio = portfolio
+
+    @property
+    def last_timestamps(self) -> Dict[str, int]:
+        """The newest bar (ms) of every symbol, the bars after it are the ones to replay."""
+
+        if self.stock_frame.backend == 'ring':
+            return {symbol: buffer.last_timestamp for symbol, buffer in self.stock_frame.buffers.items()}
+
+        return {symbol: int(timestamps[-1]) for symbol, (timestamps, _) in self.stock_frame.symbol_columns().items() if len(timestamps)}
+
+    def replay(self, columns: Dict[str, Dict[str, np.ndarray]]) -> None:
+        """
+        Adds the bars that came in since the checkpoint and brings the indicators up to
+        date. Bars the checkpoint already holds are skipped, so `columns` may overlap it.
+
+        :param columns: Per symbol the datetime (ms) and OHLCV arrays, like `StockFrame.load_columns` takes.
+        """
+
+        self.stock_frame.load_columns(columns=columns)
+
+        for indicators in self.indicators:
+            indicators.refresh()
+
+
+class CheckpointStore:
+
+    def __init__(self, root: str, keep: int = 3, interval: float = 300.0, fsync: bool = True) -> None:
+        """
+        Snapshots of the trading state on local disk, one directory per checkpoint:
+
+            <root>/checkpoint-<us>/manifest.json
+            <root>/checkpoint-<us>/bars/timestamps.npy, column-close.npy, ...
+            <root>/checkpoint-<us>/indicators-0/rsi_14/values.npy, ...
+            <root>/checkpoint-<us>/portfolio/quantity.npy, ...
+
+        Every column is a plain .npy file, so a restore maps them into memory instead of
+        parsing them. A checkpoint is written into a temporary directory that is renamed
+        into place once complete, and LATEST names the newest one, so a crash while
+        saving leaves the previous checkpoint in use.
+
+        :param root: The directory of the checkpoints.
+        :param keep: How many checkpoints to keep, older ones are deleted.
+        :param interval: The seconds between two checkpoints of `save_if_due`.
+        :param fsync: Flush every file to the disk before the checkpoint counts as written.
+        """
+
+        if keep < 1:
+            raise ValueError("At least one checkpoint has to be kept.")
+
+        self.root = root
+        self.keep = keep
+        self.interval = interval
+        self.fsync = fsync
+        self._last_save = None
+
+        os.makedirs(root, exist_ok=True)
+
+    def checkpoints(self) -> List[str]:
+        """The complete checkpoints, oldest first."""
+
+        names = [name for name in os.listdir(self.root) if name.startswith(PREFIX) and not name.endswith('.tmp')]
+
+        return [os.path.join(self.root, name) for name in sorted(names, key=lambda name: int(name[len(PREFIX):]))]
+
+    def latest(self) -> Optional[str]:
+
+        try:
+            with open(os.path.join(self.root, LATEST)) as file:
+                path = os.path.join(self.root, file.read().strip())
+        except FileNotFoundError:
+            return None
+
+        return path if os.path.isdir(path) else None
+
+    def _save_array(self, directory: str, name: str, values: np.ndarray) -> None:
+
+        with open(os.path.join(directory, name + '.npy'), 'wb') as file:
+            np.save(file, np.ascontiguousarray(values), allow_pickle=False)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+    def _save_arrays(self, directory: str, arrays: Dict[str, np.ndarray]) -> None:
+
+        os.makedirs(directory)
+
+        for name, values in arrays.items():
+            self._save_array(directory=directory, name=name, values=values)
+
+        self._sync_directory(directory=directory)
+
+    def _sync_directory(self, directory: str) -> None:
+        """Flushes the entries of `directory`, so the files and renames in it survive a crash."""
+
+        if not self.fsync:
+            return
+
+        descriptor = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    @staticmethod
+    def _load_arrays(directory: str, names: List[str], mmap: bool) -> Dict[str, np.ndarray]:
+
+        # Copy on write, the restored buffers can be written to without touching the files.
+        mmap_mode = 'c' if mmap else None
+
+        return {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False) for name in names}
+
+    def _bar_arrays(self, stock_frame: StockFrame) -> tuple:
+
+        symbols = []
+        timestamps = []
+        columns: Dict[str, list] = {}
+        meta = []
+
+        if stock_frame.backend == 'ring':
+            names = []
+            for buffer in stock_frame.buffers.values():
+                names.extend(name for name in buffer.columns if name not in names)
+
+            dtypes = {buffer.dtype for buffer in stock_frame.buffers.values()}
+            dtype = dtypes.pop() if len(dtypes) == 1 else np.float64
+
+            for symbol, buffer in stock_frame.buffers.items():
+                symbol_timestamps, symbol_columns = buffer.tail()
+                symbols.append(symbol)
+                timestamps.append(symbol_timestamps)
+                meta.append((buffer.appended, buffer.version, buffer.dropped, np.dtype(buffer.dtype).itemsize))
+                for name in names:
+                    values = symbol_columns.get(name)
+                    if values is None:
+                        values = np.full(len(symbol_timestamps), np.nan)
+                    columns.setdefault(name, []).append(values.astype(dtype, copy=False))
+        else:
+            names = list(StockFrame.COLUMNS)
+            for symbol, (symbol_timestamps, symbol_columns) in stock_frame.symbol_columns().items():
+                symbols.append(symbol)
+                timestamps.append(symbol_timestamps)
+                meta.append((len(symbol_timestamps), 0, 0, 8))
+                for name in names:
+                    columns.setdefault(name, []).append(symbol_columns[name])
+
+        offsets = np.cumsum([0] + [len(symbol_timestamps) for symbol_timestamps in timestamps]).astype(np.int64)
+
+        arrays = {
+            'timestamps': np.concatenate(timestamps) if timestamps else np.zeros(0, dtype=np.int64),
+            'offsets': offsets,
+            'meta': np.array(meta, dtype=np.int64).reshape(-1, 4)
+        }
+        for name in names:
+            arrays['column-' + name] = np.concatenate(columns[name]) if columns.get(name) else np.zeros(0)
+
+        return symbols, names, arrays
+
+    def save(self, stock_frame: StockFrame, indicators: List[Indicators] = None, portfolio: Portfolio = None) -> str:
+        """
+        Writes a checkpoint of the bars, the running state of every indicator and the portfolio.
+        Call it from the trading loop, between two ticks, so the state is consistent.
+
+        :param indicators: Every Indicators on `stock_frame` whose state should survive a restart.
+        :return: The directory of the checkpoint.
+        """
+
+        indicators = indicators or []
+
+        for entry in indicators:
+            if entry.stock_frame is not stock_frame:
+                raise ValueError("Only indicators calculated on the saved StockFrame can be checkpointed.")
+
+        created = time.time()
+        name = PREFIX + str(time.time_ns() // 1000)
+        temporary = os.path.join(self.root, name + '.tmp')
+        os.makedirs(temporary)
+
+        symbols, names, bar_arrays = self._bar_arrays(stock_frame=stock_frame)
+        self._save_arrays(directory=os.path.join(temporary, 'bars'), arrays=bar_arrays)
+
+        manifest = {
+            'format': FORMAT_VERSION,
+            'created': created,
+            'stock_frame': {
+                'backend': stock_frame.backend,
+                'capacity': stock_frame.capacity,
+                'compact': stock_frame.compact,
+                'horizon': stock_frame.horizon,
+                'horizons': stock_frame.horizons,
+                'symbols': symbols,
+                'columns': names
+            },
+            'indicators': [],
+            'portfolio': None
+        }
+
+        for position, entry in enumerate(indicators):
+
+            streams = entry.export_streams()
+            directory = os.path.join(temporary, 'indicators-{position}'.format(position=position))
+            os.makedirs(directory)
+
+            for column_name, (stream_symbols, arrays) in streams.items():
+                self._save_arrays(directory=os.path.join(directory, column_name), arrays=arrays)
+                streams[column_name] = stream_symbols
+
+            self._sync_directory(directory=directory)
+
+            signals = {}
+            for indicator, signal in entry.get_indicator_signals(indicator=None).items():
+                buy_operator = _operator_name(signal['buy_operator'])
+                sell_operator = _operator_name(signal['sell_operator'])
+                if buy_operator is not None and sell_operator is not None:
+                    signals[indicator] = {'buy': signal['buy'], 'sell': signal['sell'], 'buy_operator': buy_operator, 'sell_operator': sell_operator}
+
+            manifest['indicators'].append({
+                'streaming': entry.streaming,
+                'registrations': entry.registrations,
+                'streams': streams,
+                'signals': signals
+            })
+
+        if portfolio is not None:
+            arrays, values = portfolio.state()
+            self._save_arrays(directory=os.path.join(temporary, 'portfolio'), arrays=arrays)
+            manifest['portfolio'] = values
+
+        with open(os.path.join(temporary, 'manifest.json'), 'w') as file:
+            json.dump(manifest, file)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        self._sync_directory(directory=temporary)
+
+        path = os.path.join(self.root, name)
+        os.rename(temporary, path)
+
+        # The checkpoint has to be on the disk under its name before LATEST can point at it.
+        self._sync_directory(directory=self.root)
+
+        latest = os.path.join(self.root, LATEST)
+        with open(latest + '.tmp', 'w') as file:
+            file.write(name)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(latest + '.tmp', latest)
+
+        self._sync_directory(directory=self.root)
+
+        self._last_save = time.monotonic()
+        self._prune()
+
+        return path
+
+    def save_if_due(self, stock_frame: StockFrame, indicators: List[Indicators] = None, portfolio: Portfolio = None) -> Optional[str]:
+        """Saves a checkpoint when `interval` seconds passed since the last one, see `save`."""
+
+        if self._last_save is not None and time.monotonic() - self._last_save < self.interval:
+            return None
+
+        return self.save(stock_frame=stock_frame, indicators=indicators, portfolio=portfolio)
+
+    def _prune(self) -> None:
+
+        latest = self.latest()
+
+        for path in self.checkpoints()[:-self.keep]:
+            if path != latest:
+                shutil.rmtree(path, ignore_errors=True)
+
+        # Left behind by saves that crashed before their rename.
+        for name in os.listdir(self.root):
+            if name.startswith(PREFIX) and name.endswith('.tmp'):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def restore(self, path: str = None, strategy: Callable = None, mmap: bool = True) -> Optional[Checkpoint]:
+        """
+        Brings back the newest checkpoint, or the one in `path`. The bars are memory-mapped,
+        a buffer that was full uses the mapped columns without a copy. The indicators get
+        their running state back, so adding the bars that came in since only calculates
+        those, see `Checkpoint.replay`.
+
+        :param strategy: Called with every restored Indicators to set up the indicators and
+        signals again, they pick up their saved state as they are added. Without it the saved
+        indicators are registered again, and the signals that compare with the operator module.
+        :param mmap: Map the files instead of reading them.
+        :return: None when there is no checkpoint.
+        """
+
+        path = path or self.latest()
+        if path is None:
+            return None
+
+        with open(os.path.join(path, 'manifest.json')) as file:
+            manifest = json.load(file)
+
+        if manifest['format'] != FORMAT_VERSION:
+            raise ValueError("Checkpoint format {found} is not supported.".format(found=manifest['format']))
+
+        settings = manifest['stock_frame']
+        stock_frame = StockFrame(data=[], backend=settings['backend'], capacity=settings['capacity'], compact=settings['compact'])
+
+        bars = self._load_arrays(
+            directory=os.path.join(path, 'bars'),
+            names=['timestamps', 'offsets', 'meta'] + ['column-' + name for name in settings['columns']],
+            mmap=mmap
+        )
+        offsets = np.asarray(bars['offsets'])
+        meta = np.asarray(bars['meta'])
+
+        if settings['backend'] == 'ring':
+            if settings['horizons']:
+                for symbol, horizon in settings['horizons'].items():
+                    stock_frame.set_horizon(bars=horizon, symbols=[symbol])
+
+            for position, symbol in enumerate(settings['symbols']):
+                rows = slice(int(offsets[position]), int(offsets[position + 1]))
+                appended, version, dropped, itemsize = (int(value) for value in meta[position])
+                dtype = np.float32 if itemsize == 4 else np.float64
+                stock_frame.adopt_buffer(
+                    symbol=symbol,
+                    timestamps=bars['timestamps'][rows],
+                    columns={name: bars['column-' + name][rows].astype(dtype, copy=False) for name in settings['columns']},
+                    appended=appended,
+                    version=version,
+                    dropped=dropped
+                )
+        else:
+            stock_frame.load_columns(columns={
+                symbol: dict(
+                    {name: bars['column-' + name][int(offsets[position]):int(offsets[position + 1])] for name in settings['columns']},
+                    datetime=bars['timestamps'][int(offsets[position]):int(offsets[position + 1])]
+                )
+                for position, symbol in enumerate(settings['symbols'])
+            })
+            if settings['horizon'] is not None:
+                stock_frame.set_horizon(bars=settings['horizon'])
+            for symbol, horizon in settings['horizons'].items():
+                stock_frame.set_horizon(bars=horizon, symbols=[symbol])
+
+        restored = []
+        for position, saved in enumerate(manifest['indicators']):
+
+            directory = os.path.join(path, 'indicators-{position}'.format(position=position))
+            streams = {
+                column_name: (stream_symbols, self._load_arrays(
+                    directory=os.path.join(directory, column_name),
+                    names=['seen', 'versions', 'offsets', 'values'],
+                    mmap=False
+                ))
+                for column_name, stream_symbols in saved['streams'].items()
+            }
+
+            entry = Indicators(price_data_frame=stock_frame, streaming=saved['streaming'])
+
+            if strategy is not None:
+                entry.load_streams(streams=streams)
+                strategy(entry)
+            else:
+                entry.load_streams(streams=streams, registrations=saved['registrations'])
+                for indicator, signal in saved['signals'].items():
+                    entry.set_indicator_signals(
+                        indicator=indicator,
+                        buy=signal['buy'],
+                        sell=signal['sell'],
+                        condition_buy=getattr(operator, signal['buy_operator']),
+                        condition_sell=getattr(operator, signal['sell_operator'])
+                    )
+
+            restored.append(entry)
+
+        portfolio = None
+        if manifest['portfolio'] is not None:
+            arrays = self._load_arrays(directory=os.path.join(path, 'portfolio'), names=['quantity', 'purchase_price', 'price', 'active'], mmap=False)
+            portfolio = Portfolio.from_state(arrays=arrays, values=manifest['portfolio'])
+
+        return Checkpoint(path=path, created=manifest['created'], stock_frame=stock_frame, indicators=restored, portfolio=portfolio)
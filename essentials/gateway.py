@@ -0,0 +1,386 @@
+import re
+import hmac
+import time
+import hashlib
+import threading
+
+from collections import deque
+from urllib.parse import urlencode
+
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Optional
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from essentials.orders import Order
+from essentials.trades import Trade
+from essentials.backfill import BINANCE_API_URL
+from essentials.backfill import WeightRateLimiter
+
+
+# Binance counts placed orders separately from the request weight.
+ORDERS_PER_10_SECONDS = 100
+ORDER_WEIGHT = 1
+
+# Spot has no short selling, entering a short sells and covering it buys.
+SIDES = {
+    'BUY': 'BUY',
+    'SELL': 'SELL',
+    'SELL_SHORT': 'SELL',
+    'BUY_TO_COVER': 'BUY'
+}
+
+# The Binance type of a standalone order and of a leg in an OCO pair.
+ORDER_TYPES = {
+    'MARKET': 'MARKET',
+    'LIMIT': 'LIMIT',
+    'STOP': 'STOP_LOSS',
+    'STOP_LIMIT': 'STOP_LOSS_LIMIT'
+}
+
+OCO_TYPES = {
+    'LIMIT': 'LIMIT_MAKER',
+    'STOP': 'STOP_LOSS',
+    'STOP_LIMIT': 'STOP_LOSS_LIMIT'
+}
+
+# Binance rejects an order with this code, e.g. for a resent client order id or a short balance.
+ORDER_REJECTED = -2010
+
+
+def _client_id(trade_id: str, suffix: str = '') -> str:
+
+    # Client order ids are limited to 36 characters out of [a-zA-Z0-9-_].
+    return re.sub(r'[^a-zA-Z0-9_-]', '-', trade_id)[:36 - len(suffix)] + suffix
+
+
+def _fields(order: Order, order_types: Dict[str, str], prefix: str = '') -> dict:
+    """The type, price and time in force fields of an order, named the way Binance wants them under `prefix`."""
+
+    def name(field: str) -> str:
+        return prefix + field[0].upper() + field[1:] if prefix else field
+
+    fields = {name('type'): order_types[order.order_type]}
+
+    if order.price is not None and order.order_type in ('LIMIT', 'STOP_LIMIT'):
+        fields[name('price')] = order.price
+        if order_types[order.order_type] != 'LIMIT_MAKER':
+            fields[name('timeInForce')] = 'GTC'
+
+    if order.stop_price is not None and order.order_type in ('STOP', 'STOP_LIMIT'):
+        fields[name('stopPrice')] = order.stop_price
+
+    return fields
+
+
+def _level(order: Order) -> float:
+    return order.stop_price if order.order_type in ('STOP', 'STOP_LIMIT') else order.price
+
+
+class GatewayError(RuntimeError):
+
+    def __init__(self, status: int, text: str) -> None:
+        """An answer the exchange sent that is not JSON, e.g. the HTML page of a 502."""
+
+        super().__init__('The exchange answered {status}: {text}'.format(status=status, text=text[:200]))
+
+        self.status = status
+        self.text = text
+
+
+class OrderGateway:
+
+    def __init__(self, api_key: str, api_secret: str, base_url: str = BINANCE_API_URL, max_workers: int = 16,
+                 limiter: WeightRateLimiter = None, order_limiter: WeightRateLimiter = None,
+                 session: requests.Session = None, retries: int = 3, recv_window: int = 5000) -> None:
+        """
+        Sends `Trade` orders to the exchange from a pool of workers sharing one keep-alive
+        session. A trade with a stop loss and take profit goes out in as few requests as
+        Binance allows:
+
+            - a limit entry with both children is one OTOCO order list,
+            - a limit entry with one child is one OTO order list,
+            - a market entry is placed first, its children follow as one OCO order list.
+
+        Every request is signed, counted against the weight and order limits and retried
+        with backoff on 418, 429 and 5xx answers. Retries reuse the client order id, when
+        a retry is rejected the order is looked up by that id and returned if an earlier
+        attempt did place it, otherwise the rejection is.
+
+        :param api_key: The API key.
+        :param api_secret: The secret the requests are signed with.
+        :param base_url: The REST endpoint, point it at a local stub for testing.
+        :param max_workers: The most requests in flight.
+        :param limiter: The request weight limiter, share it with the other REST users.
+        :param order_limiter: The order count limiter, `ORDERS_PER_10_SECONDS` by default.
+        :param session: A requests session, one with a pool per worker is made by default.
+        :param retries: How often a request is retried.
+        :param recv_window: Milliseconds a signed request stays valid.
+        """
+
+        if not api_key or not api_secret:
+            raise ValueError('The gateway needs an API key and secret to sign its requests.')
+
+        self.api_key = api_key
+        self.api_secret = api_secret.encode()
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.limiter = limiter if limiter is not None else WeightRateLimiter()
+        self.order_limiter = order_limiter if order_limiter is not None else WeightRateLimiter(limit=ORDERS_PER_10_SECONDS, window=10.0)
+        self.retries = retries
+        self.recv_window = recv_window
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        session.headers['X-MBX-APIKEY'] = api_key
+        self.session = session
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='order-gateway')
+        self._lock = threading.Lock()
+
+        self.requests_made = 0
+
+        # Submit to response time of every trade in seconds.
+        self.latencies = deque(maxlen=100000)
+
+    def close(self) -> None:
+
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self) -> 'OrderGateway':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def sign(self, params: dict) -> str:
+        """The query string of `params` with a timestamp and its HMAC SHA256 signature."""
+
+        params = dict(params, recvWindow=self.recv_window, timestamp=int(time.time() * 1000))
+        query = urlencode(params)
+        signature = hmac.new(self.api_secret, query.encode(), hashlib.sha256).hexdigest()
+
+        return query + '&signature=' + signature
+
+    def request(self, method: str, path: str, params: dict, orders: int = 1) -> Tuple[int, dict]:
+        """
+        Sends one signed request.
+
+        :param orders: How many orders the request places, counted against the order limit.
+        :return: The HTTP status and the decoded answer.
+        :raises GatewayError: When the answer is not JSON.
+        """
+
+        for attempt in range(self.retries + 1):
+
+            self.limiter.acquire(ORDER_WEIGHT)
+            if orders:
+                self.order_limiter.acquire(orders)
+
+            try:
+                response = self.session.request(method, self.base_url + path + '?' + self.sign(params=params), timeout=10)
+            except requests.ConnectionError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+                continue
+
+            with self._lock:
+                self.requests_made += 1
+
+            self.limiter.update(response.headers.get('X-MBX-USED-WEIGHT-1M'))
+            self.order_limiter.update(response.headers.get('X-MBX-ORDER-COUNT-10S'))
+
+            if response.status_code in (418, 429):
+                self.limiter.backoff(float(response.headers.get('Retry-After', 2 ** attempt)))
+                continue
+
+            if response.status_code >= 500 and attempt < self.retries:
+                time.sleep(0.05 * 2 ** attempt)
+                continue
+
+            try:
+                answer = response.json()
+            except ValueError:
+                raise GatewayError(status=response.status_code, text=response.text) from None
+
+            # An earlier attempt may have got through before its answer was lost.
+            if attempt and isinstance(answer, dict) and answer.get('code') == ORDER_REJECTED:
+                placed = self._placed(params=params)
+                if placed is not None:
+                    return 200, placed
+
+            return response.status_code, answer
+
+        raise RuntimeError("Gave up on {method} {path} after {retries} retries.".format(
+            method=method,
+            path=path,
+            retries=self.retries
+        ))
+
+    def _placed(self, params: dict) -> Optional[dict]:
+        """The order or order list placed with the client order id in `params`, None if there is none."""
+
+        if 'newClientOrderId' in params:
+            client_id, field = params['newClientOrderId'], 'clientOrderId'
+            status, answer = self.request('GET', '/api/v3/order', {'symbol': params['symbol'], 'origClientOrderId': client_id}, orders=0)
+        elif 'listClientOrderId' in params:
+            client_id, field = params['listClientOrderId'], 'listClientOrderId'
+            status, answer = self.request('GET', '/api/v3/orderList', {'origClientOrderId': client_id}, orders=0)
+        else:
+            return None
+
+        if status != 200 or not isinstance(answer, dict) or answer.get(field) != client_id:
+            return None
+
+        return answer
+
+    def _order_params(self, trade: Trade, order: Order, suffix: str) -> dict:
+
+        leg = order.legs[0]
+        params = {
+            'symbol': leg.instrument.symbol,
+            'side': SIDES[leg.instruction],
+            'quantity': leg.quantity,
+            'newClientOrderId': _client_id(trade_id=trade.trade_id, suffix=suffix)
+        }
+        params.update(_fields(order=order, order_types=ORDER_TYPES))
+
+        return params
+
+    def _oco_params(self, trade: Trade, children: List[Order], prefix: str) -> dict:
+        """The fields of a pair of exit orders, the one with the higher price goes above."""
+
+        below, above = sorted(children, key=_level)
+
+        params = {}
+        params.update(_fields(order=above, order_types=OCO_TYPES, prefix=prefix + 'Above' if prefix else 'above'))
+        params.update(_fields(order=below, order_types=OCO_TYPES, prefix=prefix + 'Below' if prefix else 'below'))
+
+        return params
+
+    def _execute(self, trade: Trade) -> dict:
+
+        order = trade.order_object
+        leg = order.legs[0]
+        children = order.children if order.strategy_type == 'TRIGGER' else []
+
+        if not children:
+            status, answer = self.request('POST', '/api/v3/order', self._order_params(trade=trade, order=order, suffix=''))
+            return answer
+
+        child_leg = children[0].legs[0]
+
+        # Order lists need a resting working order, a limit entry and its exits go out as one.
+        if order.order_type == 'LIMIT':
+
+            params = {
+                'symbol': leg.instrument.symbol,
+                'listClientOrderId': _client_id(trade_id=trade.trade_id),
+                'workingType': 'LIMIT',
+                'workingSide': SIDES[leg.instruction],
+                'workingQuantity': leg.quantity,
+                'workingPrice': order.price,
+                'workingTimeInForce': 'GTC',
+                'pendingSide': SIDES[child_leg.instruction],
+                'pendingQuantity': child_leg.quantity
+            }
+
+            if len(children) == 1:
+                params.update(_fields(order=children[0], order_types=ORDER_TYPES, prefix='pending'))
+                status, answer = self.request('POST', '/api/v3/orderList/oto', params, orders=2)
+            else:
+                params.update(self._oco_params(trade=trade, children=children[:2], prefix='pending'))
+                status, answer = self.request('POST', '/api/v3/orderList/otoco', params, orders=3)
+
+            return answer
+
+        status, answer = self.request('POST', '/api/v3/order', self._order_params(trade=trade, order=order, suffix=''))
+        if status != 200 or answer.get('status') != 'FILLED':
+            return answer
+
+        if len(children) == 1:
+            status, exits = self.request('POST', '/api/v3/order', self._order_params(trade=trade, order=children[0], suffix='-x'))
+        else:
+            params = {
+                'symbol': child_leg.instrument.symbol,
+                'side': SIDES[child_leg.instruction],
+                'quantity': child_leg.quantity,
+                'listClientOrderId': _client_id(trade_id=trade.trade_id, suffix='-x')
+            }
+            params.update(self._oco_params(trade=trade, children=children[:2], prefix=''))
+            status, exits = self.request('POST', '/api/v3/orderList/oco', params, orders=2)
+
+        answer = dict(answer)
+        answer['childOrders'] = exits
+
+        return answer
+
+    def _run(self, trade: Trade, submitted: float) -> dict:
+
+        try:
+            answer = self._execute(trade=trade)
+        except Exception as error:
+            trade.order_response = {'status': 'ERROR', 'msg': str(error)}
+            raise
+
+        trade.order_response = answer
+        self.latencies.append(time.perf_counter() - submitted)
+
+        return answer
+
+    def submit(self, trade: Trade) -> Future:
+        """
+        Queues a trade for sending. `trade.order_response` is filled in by the worker once
+        the exchange answered, the future resolves to the same answer.
+        """
+
+        return self._executor.submit(self._run, trade, time.perf_counter())
+
+    def submit_many(self, trades: List[Trade]) -> List[Future]:
+        """Queues many trades at once, e.g. every signal of a refresh."""
+
+        submitted = time.perf_counter()
+
+        return [self._executor.submit(self._run, trade, submitted) for trade in trades]
+
+    def wait(self, futures: List[Future], timeout: float = None) -> List[dict]:
+        """Blocks until the trades were answered and returns the answers in order."""
+
+        wait(futures, timeout=timeout)
+
+        return [future.result() for future in futures]
+
+    def cancel_open_orders(self, symbol: str) -> Future:
+
+        return self._executor.submit(lambda: self.request('DELETE', '/api/v3/openOrders', {'symbol': symbol}, orders=0)[1])
+
+    def latency_stats(self) -> Dict[str, float]:
+        """Submit to response latency percentiles in milliseconds."""
+
+        if not self.latencies:
+            return {}
+
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+
+        return {
+            'count': count,
+            'p50_ms': ordered[count // 2] * 1e3,
+            'p90_ms': ordered[int(count * 0.9)] * 1e3,
+            'p99_ms': ordered[min(int(count * 0.99), count - 1)] * 1e3,
+            'max_ms': ordered[-1] * 1e3
+        }
@@ -2,23 +2,64 @@ import operator
 import numpy as np
 import pandas as pd
 
+from time import perf_counter_ns
+
 from typing import List, Tuple, Any
 from typing import Dict
 from typing import Union
 from typing import Optional
+from typing import Callable
 
+from essentials import kernels
 from essentials.stock_frame import StockFrame
+from essentials.instrumentation import INSTRUMENTATION
+from essentials.streaming import DiffState
+from essentials.streaming import EmaState
+from essentials.streaming import RollingMeanState
+from essentials.streaming import RsiState
+from essentials.streaming import IndicatorStream
 
 
 class Indicators:
 
-    def __init__(self, price_data_frame: StockFrame) -> None:
+    def __init__(self, price_data_frame: StockFrame, streaming: bool = False, timeframe: str = None) -> None:
+        """
+        :param price_data_frame: The StockFrame the indicators are calculated on.
+        :param streaming: Keep a running state per indicator and symbol so that `refresh`
+        only processes the bars added since the last refresh. Needs a StockFrame
+        using the 'ring' backend.
+        :param timeframe: Calculate the indicators on the bars of this interval instead,
+        rolled up from the StockFrame as its bars come in, e.g. 1h. See `StockFrame.add_timeframe`.
+        """
+
+        if timeframe is not None:
+            price_data_frame = price_data_frame.timeframe(interval=timeframe)
+
+        if streaming and price_data_frame.backend != 'ring':
+            raise ValueError("Streaming indicators need a StockFrame with the 'ring' backend.")
 
         self._stock_frame: StockFrame = price_data_frame
-        self._price_groups = self._stock_frame.symbol_groups
-        self._current_indicators = {}
+        self._timeframe = timeframe
+        self._streaming = streaming
+        self._streams: Dict[str, IndicatorStream] = {}
+
+        # Stream states of a checkpoint, taken up as their indicators are registered again.
+        self._saved_streams: Dict[str, tuple] = {}
+        self._current_indicators: Dict[Tuple[str, tuple], dict] = {}
         self._indicator_signals = {}
-        self._frame = self._stock_frame.frame
+
+        # A compact StockFrame keeps the intermediates of the kernels out of the frame.
+        self._compact = price_data_frame.compact
+        self._scratch = kernels.Scratch()
+
+        # Streaming indicators work on the ring buffers, building the frame of a freshly
+        # loaded bar cache here would only slow down the start.
+        if streaming:
+            self._price_groups = None
+            self._frame = None
+        else:
+            self._price_groups = self._stock_frame.symbol_groups
+            self._frame = self._stock_frame.frame
 
     def set_indicator_signals(self, indicator: str, buy: float, sell: float, condition_buy: Any, condition_sell: Any) -> None:
 
@@ -39,9 +80,27 @@ class Indicators:
         else:
             return self._indicator_signals
 
+    @property
+    def streaming(self) -> bool:
+        return self._streaming
+
+    @property
+    def timeframe(self) -> Optional[str]:
+        return self._timeframe
+
+    @property
+    def stock_frame(self) -> StockFrame:
+        """The StockFrame the indicators are calculated on, the one of the timeframe if one was given."""
+
+        return self._stock_frame
+
     @property
     def price_data_frame(self) -> pd.DataFrame:
 
+        # Streaming values live in the ring buffers, the frame is built on demand.
+        if self._streaming:
+            return self._stock_frame.frame
+
         return self._frame
 
     @price_data_frame.setter
@@ -49,6 +108,184 @@ class Indicators:
 
         self._frame = price_data_frame
 
+    @property
+    def current_indicators(self) -> Dict[str, dict]:
+        """The registered indicators keyed by the column they write to."""
+
+        return {entry['column']: entry for entry in self._current_indicators.values()}
+
+    def _group_starts(self) -> np.ndarray:
+
+        # Cached by the StockFrame until its layout changes.
+        if self._frame is self._stock_frame.frame:
+            return self._stock_frame.group_starts
+
+        return kernels.group_starts(index=self._frame.index)
+
+    def _store(self, column_name: str, values: np.ndarray) -> None:
+
+        # The indicators of a compact frame are as precise as its prices.
+        if self._compact:
+            values = values.astype(np.float32)
+
+        self._frame[column_name] = values
+
+    @property
+    def registrations(self) -> List[dict]:
+        """The registered indicators as plain values, in the order they were added."""
+
+        return [
+            {
+                'name': entry['name'],
+                'column': entry['column'],
+                'args': dict(entry['args']),
+                'depends_on': [{'name': name, 'args': dict(args)} for name, args in entry['depends_on']],
+                'explicit': entry['explicit']
+            }
+            for entry in self._current_indicators.values()
+        ]
+
+    def export_streams(self) -> Dict[str, Tuple[List[str], Dict[str, np.ndarray]]]:
+        """The running state of every streaming indicator keyed by its column, see `IndicatorStream.export`."""
+
+        return {column_name: stream.export() for column_name, stream in self._streams.items()}
+
+    def load_streams(self, streams: Dict[str, Tuple[List[str], Dict[str, np.ndarray]]], registrations: List[dict] = None) -> None:
+        """
+        Takes back the states of `export_streams`. Every indicator picks up its state when
+        it is registered again, which is done here for `registrations` and otherwise left
+        to the strategy setting up the indicators.
+        """
+
+        self._saved_streams.update(streams)
+
+        # Registered in their original order, so dependencies come first. Going around the
+        # public methods saves building the frame they return.
+        for registration in registrations or []:
+            func = getattr(self, '_' + registration['name'])
+            _, is_new = self._register(
+                name=registration['name'],
+                column_name=registration['column'],
+                func=func,
+                args=registration['args'],
+                depends_on=[(dependency['name'], tuple(sorted(dependency['args'].items()))) for dependency in registration['depends_on']],
+                explicit=registration['explicit']
+            )
+            if is_new:
+                func(column_name=registration['column'], **registration['args'])
+
+    @property
+    def scratch_bytes(self) -> int:
+        """The memory of the work arrays reused between refreshes."""
+
+        return self._scratch.nbytes
+
+    def _add_stream(self, column_name: str, factory: Any) -> None:
+
+        replaced = column_name in self._streams
+        if replaced:
+            self._streams[column_name].remove(buffers=self._stock_frame.buffers)
+
+        self._streams[column_name] = IndicatorStream(column_name=column_name, factory=factory)
+
+        # Restored states only replay the bars added after the checkpoint, and leave the
+        # frame alone when there are none.
+        saved = self._saved_streams.pop(column_name, None)
+        if saved is not None:
+            self._streams[column_name].load(symbols=saved[0], arrays=saved[1])
+
+        if self._streams[column_name].update(buffers=self._stock_frame.buffers) or replaced:
+            self._stock_frame.mark_dirty()
+
+    def _register(self, name: str, column_name: str, func: Callable, args: dict, depends_on: List[Tuple] = None, explicit: bool = True) -> Tuple[Tuple, bool]:
+        """
+        Adds an indicator to the registry, which is keyed by the indicator name and its
+        parameters so `sma(20)` and `sma(50)` live side by side in `sma_20` and `sma_50`.
+
+        :param name: The name of the indicator, e.g. sma.
+        :param column_name: The column the indicator writes to.
+        :param func: The function calculating the column, called with `column_name` and `args`.
+        :param args: The parameters of the indicator.
+        :param depends_on: Registry keys of the indicators whose columns this one reads.
+        :param explicit: False when the indicator was only added as a dependency.
+        :return: The registry key and whether the indicator was new.
+        """
+
+        key = (name, tuple(sorted(args.items())))
+
+        if key in self._current_indicators:
+            self._current_indicators[key]['explicit'] |= explicit
+            return key, False
+
+        self._current_indicators[key] = {
+            'name': name,
+            'column': column_name,
+            'args': args,
+            'func': func,
+            'depends_on': depends_on or [],
+            'explicit': explicit
+        }
+
+        return key, True
+
+    def _require_change_in_price(self) -> Tuple:
+
+        # Shared by every indicator built on price changes, calculated once per refresh.
+        key, is_new = self._register(
+            name='change_in_price',
+            column_name='change_in_price',
+            func=self._change_in_price,
+            args={},
+            explicit=False
+        )
+
+        if is_new:
+            self._change_in_price(column_name='change_in_price')
+
+        return key
+
+    def remove_indicator(self, column_name: str) -> None:
+        """
+        Removes an indicator and drops its column. Indicators it depended on are removed
+        too unless they were added explicitly or another indicator still needs them.
+
+        :param column_name: The column of the indicator, e.g. sma_20.
+        """
+
+        for key, entry in self._current_indicators.items():
+            if entry['column'] == column_name:
+                entry['explicit'] = False
+                self._release(key=key)
+                return
+
+        raise KeyError("No indicator writes to the column {column}.".format(column=column_name))
+
+    def _release(self, key: Tuple) -> None:
+
+        entry = self._current_indicators[key]
+
+        if entry['explicit']:
+            return
+
+        for other in self._current_indicators.values():
+            if key in other['depends_on']:
+                return
+
+        del self._current_indicators[key]
+
+        if self._streaming:
+            self._streams.pop(entry['column']).remove(buffers=self._stock_frame.buffers)
+            self._stock_frame.mark_dirty()
+        else:
+            self._frame.drop(columns=[entry['column']], errors='ignore', inplace=True)
+
+        # Rolling views are memoized per window, let go of the one this indicator used.
+        if entry['name'] == 'sma':
+            self._stock_frame.release_rolling_groups(size=entry['args']['period'])
+
+        for dependency in entry['depends_on']:
+            self._release(key=dependency)
+
     def change_in_price(self) -> pd.DataFrame:
         """
         Locals() is called here which shows us all the arguments passed in the function change_in_price()
@@ -66,109 +303,157 @@ class Indicators:
         del locals_data['self']
 
         column_name = 'change_in_price'
-        self._current_indicators[column_name] = {}
-        self._current_indicators['args'] = locals_data
-        self._current_indicators['func'] = self.change_in_price
+        self._register(name='change_in_price', column_name=column_name, func=self._change_in_price, args=locals_data)
+        self._change_in_price(column_name=column_name, **locals_data)
 
-        self._frame[column_name] = self._price_groups['close'].transform(
-            lambda x: x.diff()
-        )
-
-    def rsi(self, period: int, method: str = "wilders") -> pd.DataFrame:
-        locals_data = locals()  # Shows me every argument that was passed in the function.
-        del locals_data['self']
+        return self.price_data_frame
 
-        column_name = 'rsi'
-        self._current_indicators[column_name] = {}
-        self._current_indicators['args'] = locals_data
-        self._current_indicators['func'] = self.rsi
+    def _change_in_price(self, column_name: str) -> None:
 
-        if 'change_in_price' not in self._frame.columns:
-            self.change_in_price()
+        if self._streaming:
+            self._add_stream(column_name=column_name, factory=DiffState)
+            return
 
-        # Define the up days.
-        self._frame['up_day'] = self._price_groups['change_in_price'].transform(
-            lambda x: np.where(x >= 0, x, 0)
-        )
+        self._store(column_name, kernels.grouped_diff(
+            values=self._frame['close'].to_numpy(dtype=float),
+            starts=self._group_starts()
+        ))
 
-        self._frame['down_day'] = self._price_groups['change_in_price'].transform(
-            lambda x: np.where(x < 0, x.abs(), 0)
-        )
-        """
-        EWMA = Exponentially weighted averages
-        Vt = Bvt-1 + (1-B)0t
-        """
-        self._frame['ewma_up'] = self._price_groups['change_in_price'].transform(
-            lambda x: x.ewm(span=period).mean()
-        )
+    def rsi(self, period: int, method: str = "wilders") -> pd.DataFrame:
+        locals_data = locals()  # Shows me every argument that was passed in the function.
+        del locals_data['self']
 
-        self._frame['ewma_down '] = self._price_groups['change_in_price'].transform(
-            lambda x: x.ewm(span=period).mean()
+        column_name = 'rsi_{period}'.format(period=period)
+        if method != 'wilders':
+            column_name += '_{method}'.format(method=method)
+
+        # The RSI state works out the price changes itself, a compact frame keeps them in
+        # scratch memory instead of a change_in_price column.
+        self._register(
+            name='rsi',
+            column_name=column_name,
+            func=self._rsi,
+            args=locals_data,
+            depends_on=[] if self._compact else [self._require_change_in_price()]
         )
+        self._rsi(column_name=column_name, **locals_data)
 
-        relative_strength = self._frame['ewma_up'] / self._frame['ewma_down']
+        return self.price_data_frame
 
-        # VT BVT 0 1-B0t
-        relative_strength_index = 100.0 - (100.0 / (1.0 + relative_strength))
+    def _rsi(self, column_name: str, period: int, method: str) -> None:
 
-        self._frame['rsi'] = np.where(relative_strength_index == 0, 100,100.0 - (100.0 / (1.0 + relative_strength)))
+        if self._streaming:
+            self._add_stream(column_name=column_name, factory=lambda: RsiState(period=period, method=method))
+            return
 
-        self._frame.drop(
-            labels=['ewma_up', 'ewma_down', 'down_day', 'up_day', 'change_in_price'],
-            axis=1,
-            inplace=True
-        )
+        change = None
+        if 'change_in_price' in self._frame.columns:
+            change = self._frame['change_in_price'].to_numpy(dtype=float)
 
-        return self._frame
+        # One pass over every symbol, Wilder's smoothing is an EWMA with alpha = 1 / period.
+        self._store(column_name, kernels.grouped_rsi(
+            values=self._frame['close'].to_numpy(dtype=float),
+            starts=self._group_starts(),
+            period=period,
+            method=method,
+            change=change,
+            scratch=self._scratch
+        ))
 
     def sma(self, period: int) -> pd.DataFrame:
         locals_data = locals()  # Shows me every argument that was passed in the function.
         del locals_data['self']
 
-        column_name = 'sma'
-        self._current_indicators[column_name] = {}
-        self._current_indicators['args'] = locals_data
-        self._current_indicators['func'] = self.sma
+        column_name = 'sma_{period}'.format(period=period)
+        self._register(name='sma', column_name=column_name, func=self._sma, args=locals_data)
+        self._sma(column_name=column_name, **locals_data)
 
-        # Adding SMA
-        self._frame[column_name] = self._price_groups['close'].transform(
-            lambda x: x.rolling(window=period).mean()
-        )
+        return self.price_data_frame
 
-        return self._frame
+    def _sma(self, column_name: str, period: int) -> None:
+
+        if self._streaming:
+            self._add_stream(column_name=column_name, factory=lambda: RollingMeanState(period=period))
+            return
+
+        # Adding SMA
+        self._store(column_name, kernels.grouped_rolling_mean(
+            values=self._frame['close'].to_numpy(dtype=float),
+            starts=self._group_starts(),
+            window=period
+        ))
 
     def ema(self, period: int, alpha: float = 0.0) -> pd.DataFrame:
         locals_data = locals()  # Shows me every argument that was passed in the function.
         del locals_data['self']
 
-        column_name = 'ema'
-        self._current_indicators[column_name] = {}
-        self._current_indicators['args'] = locals_data
-        self._current_indicators['func'] = self.ema
+        column_name = 'ema_{period}'.format(period=period)
+        self._register(name='ema', column_name=column_name, func=self._ema, args=locals_data)
+        self._ema(column_name=column_name, **locals_data)
 
-        self._frame[column_name] = self._price_groups['close'].transform(
-            lambda x: x.ewm(span=period).mean()
-        )
+        return self.price_data_frame
 
-        return self._frame
+    def _ema(self, column_name: str, period: int, alpha: float = 0.0) -> None:
+
+        if self._streaming:
+            self._add_stream(column_name=column_name, factory=lambda: EmaState(period=period))
+            return
+
+        self._store(column_name, kernels.grouped_ewm_mean(
+            values=self._frame['close'].to_numpy(dtype=float),
+            starts=self._group_starts(),
+            alpha=2.0 / (period + 1.0)
+        ))
 
     def refresh(self):
 
-        # First update the groups
+        # The registry holds bound methods, so each indicator is timed here rather than
+        # by patching the class.
+        timed = INSTRUMENTATION.enabled
+
+        # Streaming indicators only look at the bars added since the last refresh.
+        if self._streaming:
+            processed = 0
+            for indicator in self._current_indicators.values():
+                stream = self._streams.get(indicator['column'])
+                if stream is None:
+                    continue
+                if timed:
+                    start = perf_counter_ns()
+                    processed += stream.update(buffers=self._stock_frame.buffers)
+                    INSTRUMENTATION.record(name='indicators.' + indicator['name'], nanoseconds=perf_counter_ns() - start)
+                else:
+                    processed += stream.update(buffers=self._stock_frame.buffers)
+            if processed:
+                self._stock_frame.mark_dirty()
+            return
+
+        # First update the groups, the ring backend may have rebuilt its frame.
+        self._frame = self._stock_frame.frame
         self._price_groups = self._stock_frame.symbol_groups
 
-        # Loop through all the stored indicators
-        for indicator in self._current_indicators:
-
-            indicator_arguments = self._current_indicators[indicator]['args']
-            indicator_function = self._current_indicators[indicator]['func']
+        # Dependencies are registered before the indicators using them, so walking the
+        # registry in order calculates every column exactly once.
+        for indicator in self._current_indicators.values():
 
-            # Update the coulmuns
+            indicator_arguments = indicator['args']
+            indicator_function = indicator['func']
 
-            indicator_function(**indicator_arguments)
+            # Update the columns
+            if timed:
+                start = perf_counter_ns()
+                indicator_function(column_name=indicator['column'], **indicator_arguments)
+                INSTRUMENTATION.record(name='indicators.' + indicator['name'], nanoseconds=perf_counter_ns() - start)
+            else:
+                indicator_function(column_name=indicator['column'], **indicator_arguments)
             # the ** is unpacked and will unfold a dict
-    def check_signals(self) -> Union[pd.DataFrame, None]:
 
-        signals_df = self._stock_frame._check_signals(indicators=self._indicator_signals)
+    def check_signals(self, mode: str = 'and') -> Union[pd.DataFrame, None]:
+        """
+        :param mode: 'and' when every indicator has to agree, 'or' when one is enough.
+        :return: A boolean frame with a buy and a sell column indexed by symbol.
+        """
+
+        signals_df = self._stock_frame._check_signals(indicators=self._indicator_signals, mode=mode)
 
         return signals_df
\ No newline at end of file
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import functools
+import importlib
+import threading
+
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+from typing import Iterator
+
+
+# Every power of two is split into this many buckets, so a recorded value is off by under 1%.
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# Values above about 18 minutes land in the last bucket.
+MAX_VALUE_BITS = 40
+
+# The hot paths timed by `Instrumentation.enable`, as (module, class, method, name).
+HOT_PATHS: List[Tuple[str, str, str, str]] = [
+    ('essentials.stock_frame', 'StockFrame', 'add_rows', 'stock_frame.add_rows'),
+    ('essentials.stock_frame', 'StockFrame', '_check_signals', 'stock_frame.check_signals'),
+    ('essentials.indicators', 'Indicators', 'refresh', 'indicators.refresh'),
+    ('essentials.trades', 'Trade', 'new_trade', 'trade.new_trade'),
+    ('essentials.trades', 'Trade', 'add_stop_loss', 'trade.add_stop_loss'),
+    ('essentials.trades', 'Trade', 'add_take_profit', 'trade.add_take_profit'),
+    ('essentials.risk', 'RiskManager', 'check', 'risk.check'),
+    ('essentials.gateway', 'OrderGateway', 'submit', 'gateway.submit'),
+    ('essentials.gateway', 'OrderGateway', 'submit_many', 'gateway.submit_many'),
+    ('essentials.gateway', 'OrderGateway', '_run', 'gateway.round_trip')
+]
+
+
+class LatencyHistogram:
+
+    __slots__ = ('name', '_counts', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self, name: str = '') -> None:
+        """
+        A log-linear histogram of durations in nanoseconds, in the spirit of HdrHistogram:
+        recording is an increment of one bucket and the memory use is fixed.
+
+        :param name: What is timed, e.g. stock_frame.add_rows.
+        """
+
+        self.name = name
+        self._counts = [0] * ((MAX_VALUE_BITS - SUB_BUCKET_BITS + 1) * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            return value
+
+        return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def _value(index: int) -> int:
+        """The highest value that lands in bucket `index`."""
+
+        if index < 2 * SUB_BUCKETS:
+            return index
+
+        shift = (index >> SUB_BUCKET_BITS) - 1
+        mantissa = index - (shift << SUB_BUCKET_BITS)
+
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+
+        if value < 0:
+            value = 0
+
+        self._counts[min(self._index(value), len(self._counts) - 1)] += 1
+        self.count += 1
+        self.total += value
+
+        if value > self.maximum:
+            self.maximum = value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        """Adds the values of another histogram, e.g. one kept by a worker process."""
+
+        self._counts = [mine + theirs for mine, theirs in zip(self._counts, other._counts)]
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        if other.minimum is not None:
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+
+    def reset(self) -> None:
+
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    def percentile(self, percentile: float) -> int:
+        """The value `percentile` percent of the recorded values are at or below, in nanoseconds."""
+
+        if not self.count:
+            return 0
+
+        target = max(1, int(round(percentile / 100.0 * self.count)))
+        seen = 0
+
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index), self.maximum)
+
+        return self.maximum
+
+    def summary(self) -> Dict[str, float]:
+        """Count, mean and percentiles in microseconds."""
+
+        if not self.count:
+            return {'count': 0}
+
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1e3,
+            'min_us': self.minimum / 1e3,
+            'p50_us': self.percentile(50) / 1e3,
+            'p90_us': self.percentile(90) / 1e3,
+            'p99_us': self.percentile(99) / 1e3,
+            'p999_us': self.percentile(99.9) / 1e3,
+            'max_us': self.maximum / 1e3,
+            'total_ms': self.total / 1e6
+        }
+
+
+def _timed(function: Callable, histogram: LatencyHistogram) -> Callable:
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.record(perf_counter_ns() - start)
+
+    timed.__wrapped_by_instrumentation__ = True
+
+    return timed
+
+
+class Instrumentation:
+
+    def __init__(self) -> None:
+        """
+        Latency histograms for the hot paths of the trading loop.
+
+        Nothing is timed until `enable` is called, which swaps the methods listed in
+        `HOT_PATHS` for timed wrappers. `disable` puts the originals back, so a
+        disabled instrumentation costs nothing at all on the hot path. Every indicator
+        is also timed on its own by `Indicators.refresh` while enabled.
+        """
+
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._patched: List[Tuple[type, str, Callable]] = []
+        self._lock = threading.Lock()
+        self._dump_thread: threading.Thread = None
+        self._dump_stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._patched)
+
+    def histogram(self, name: str) -> LatencyHistogram:
+
+        histogram = self.histograms.get(name)
+
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram(name=name))
+
+        return histogram
+
+    def record(self, name: str, nanoseconds: int) -> None:
+
+        self.histogram(name=name).record(nanoseconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Times the body of a `with` block under `name`, only while enabled."""
+
+        if not self._patched:
+            yield
+            return
+
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.histogram(name=name).record(perf_counter_ns() - start)
+
+    def wrap(self, owner: type, attribute: str, name: str = None) -> None:
+        """Times every call of `owner.attribute` under `name` until `disable` is called."""
+
+        function = owner.__dict__[attribute]
+
+        if getattr(function, '__wrapped_by_instrumentation__', False):
+            return
+
+        histogram = self.histogram(name=name or '{owner}.{attribute}'.format(owner=owner.__name__, attribute=attribute))
+        setattr(owner, attribute, _timed(function=function, histogram=histogram))
+        self._patched.append((owner, attribute, function))
+
+    def enable(self, targets: List[Tuple[str, str, str, str]] = None) -> None:
+        """
+        :param targets: The methods to time as (module, class, method, name), `HOT_PATHS` by default.
+        """
+
+        for module_name, class_name, attribute, name in targets if targets is not None else HOT_PATHS:
+            owner = getattr(importlib.import_module(module_name), class_name)
+            self.wrap(owner=owner, attribute=attribute, name=name)
+
+    def disable(self) -> None:
+
+        for owner, attribute, function in reversed(self._patched):
+            setattr(owner, attribute, function)
+
+        self._patched = []
+
+    def reset(self) -> None:
+
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """The summary of every histogram that recorded something, see `LatencyHistogram.summary`."""
+
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items()) if histogram.count}
+
+    def dump(self, path: str) -> None:
+        """Writes the stats to `path` as JSON, replacing the old file in one step."""
+
+        payload = {'time': time.time(), 'stats': self.stats()}
+        temporary = path + '.tmp'
+
+        with open(temporary, 'w') as file:
+            json.dump(payload, file, indent=2)
+
+        os.replace(temporary, path)
+
+    def start_dumping(self, path: str, interval: float = 60.0) -> None:
+        """Dumps the stats to `path` every `interval` seconds from a background thread."""
+
+        self.stop_dumping()
+        self._dump_stop.clear()
+
+        def run() -> None:
+            while not self._dump_stop.wait(interval):
+                self.dump(path=path)
+
+        self._dump_thread = threading.Thread(target=run, name='instrumentation-dump', daemon=True)
+        self._dump_thread.start()
+
+    def stop_dumping(self) -> None:
+
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+
+
+# Patching is process wide, so is the instrumentation.
+INSTRUMENTATION = Instrumentation()
@@ -0,0 +1,254 @@
+"""
+Vectorized indicator kernels working on every symbol at once.
+
+The price frame is sorted by (symbol, datetime) so each symbol is one contiguous
+run of rows. Instead of handing every run to a Python lambda the kernels take the
+flat column plus the offsets where each symbol starts and do the work in NumPy,
+or in a Numba loop when Numba is installed.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Keeps the scale factors of the block-wise EWM well inside the float64 range.
+_MAX_SCALE_EXPONENT = 250.0
+
+
+class Scratch:
+
+    def __init__(self) -> None:
+        """
+        Named float64 work arrays that are kept between calls, so the intermediates of a
+        kernel are written into the same memory on every refresh instead of new arrays.
+        An array only grows, a shorter request gets a view of its front.
+        """
+
+        self._arrays = {}
+
+    def get(self, name: str, length: int) -> np.ndarray:
+
+        array = self._arrays.get(name)
+
+        if array is None or len(array) < length:
+            array = np.empty(length, dtype=np.float64)
+            self._arrays[name] = array
+
+        return array[:length]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._arrays.values())
+
+
+def _work_array(scratch: Scratch, name: str, length: int) -> np.ndarray:
+
+    if scratch is None:
+        return np.empty(length, dtype=np.float64)
+
+    return scratch.get(name, length)
+
+
+def group_starts(index: pd.MultiIndex) -> np.ndarray:
+    """
+    :param index: The (symbol, datetime) index of a frame sorted by symbol.
+    :return: The position of the first row of every symbol.
+    """
+
+    if len(index) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    codes = np.asarray(index.codes[0])
+
+    return np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1)).astype(np.int64)
+
+
+def _group_ends(starts: np.ndarray, length: int) -> np.ndarray:
+    return np.append(starts[1:], length).astype(np.int64)
+
+
+def grouped_diff(values: np.ndarray, starts: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+
+    result = out if out is not None else np.empty(len(values), dtype=np.float64)
+
+    if len(values) == 0:
+        return result
+
+    np.subtract(values[1:], values[:-1], out=result[1:])
+    result[starts] = np.nan
+
+    return result
+
+
+def grouped_rolling_mean(values: np.ndarray, starts: np.ndarray, window: int) -> np.ndarray:
+
+    length = len(values)
+    result = np.full(length, np.nan)
+
+    if length == 0:
+        return result
+
+    # Summing the distance to the first price of each symbol keeps the running
+    # sum small, so the cumulative sum does not lose precision on long series.
+    group_sizes = _group_ends(starts, length) - starts
+    first = np.repeat(values[starts], group_sizes)
+    cumulative = np.concatenate(([0.0], np.cumsum(values - first)))
+
+    if length >= window:
+        result[window - 1:] = (cumulative[window:] - cumulative[:-window]) / window + first[window - 1:]
+
+    # Windows reaching back into the previous symbol are not full yet.
+    for start, size in zip(starts, group_sizes):
+        result[start:start + min(window - 1, size)] = np.nan
+
+    return result
+
+
+def _ewm_numpy(values: np.ndarray, starts: np.ndarray, ends: np.ndarray, alpha: float, adjust: bool, result: np.ndarray) -> np.ndarray:
+
+    decay = 1.0 - alpha
+
+    # Split every symbol into blocks short enough that decay ** -block stays finite,
+    # each block is then a scaled cumulative sum carrying the state of the one before.
+    if decay > 0.0:
+        block = max(int(_MAX_SCALE_EXPONENT * np.log(10.0) / -np.log(decay)), 1)
+    else:
+        block = 1
+
+    for start, end in zip(starts, ends):
+
+        numerator = 0.0
+        denominator = 0.0
+        average = np.nan
+
+        for block_start in range(start, end, block):
+
+            block_end = min(block_start + block, end)
+            steps = np.arange(block_end - block_start)
+            powers = decay ** steps
+            decayed_sum = np.cumsum(values[block_start:block_end] / powers) * powers
+
+            if adjust:
+                # The first value of a symbol starts both sums, as in pandas.
+                block_numerator = decayed_sum + decay * powers * numerator
+                block_denominator = np.cumsum(1.0 / powers) * powers + decay * powers * denominator
+                result[block_start:block_end] = block_numerator / block_denominator
+                numerator = block_numerator[-1]
+                denominator = block_denominator[-1]
+            else:
+                if np.isnan(average):
+                    # y0 = x0, after that y_t = decay * y_t-1 + alpha * x_t.
+                    block_average = values[block_start] * powers + alpha * (decayed_sum - values[block_start] * powers)
+                else:
+                    block_average = decay * powers * average + alpha * decayed_sum
+                result[block_start:block_end] = block_average
+                average = block_average[-1]
+
+    return result
+
+
+if numba is not None:
+
+    @numba.njit(cache=True)
+    def _ewm_numba(values, starts, ends, alpha, adjust, result):
+
+        decay = 1.0 - alpha
+
+        for group in range(len(starts)):
+
+            numerator = 0.0
+            denominator = 0.0
+
+            for row in range(starts[group], ends[group]):
+
+                if adjust:
+                    numerator = values[row] + decay * numerator
+                    denominator = 1.0 + decay * denominator
+                    result[row] = numerator / denominator
+                elif row == starts[group]:
+                    numerator = values[row]
+                    result[row] = numerator
+                else:
+                    numerator = decay * numerator + alpha * values[row]
+                    result[row] = numerator
+
+        return result
+
+else:
+    _ewm_numba = None
+
+
+def grouped_ewm_mean(values: np.ndarray, starts: np.ndarray, alpha: float, adjust: bool = True, out: np.ndarray = None) -> np.ndarray:
+    """
+    Exponentially weighted mean per symbol, matching `ewm(alpha=alpha, adjust=adjust).mean()`.
+
+    :param values: The flat column, without NaNs.
+    :param starts: The position of the first row of every symbol.
+    :param alpha: The smoothing factor, 2 / (span + 1) for a span.
+    :param adjust: Use the adjusted (ratio of decaying sums) form like pandas does by default.
+    :param out: A float64 array of the length of `values` to write the result into.
+    """
+
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    ends = _group_ends(starts, len(values))
+    result = out if out is not None else np.empty(len(values), dtype=np.float64)
+
+    if _ewm_numba is not None:
+        return _ewm_numba(values, starts, ends, alpha, adjust, result)
+
+    return _ewm_numpy(values, starts, ends, alpha, adjust, result)
+
+
+def grouped_rsi(values: np.ndarray, starts: np.ndarray, period: int, method: str = 'wilders', change: np.ndarray = None,
+                scratch: Scratch = None) -> np.ndarray:
+    """
+    :param change: The already calculated `grouped_diff` of `values`, when available.
+    :param scratch: Keep the price changes and running averages in these work arrays.
+    """
+
+    length = len(values)
+    result = np.full(length, np.nan)
+
+    if change is None:
+        change = grouped_diff(values, starts, out=_work_array(scratch, 'change', length))
+
+    # The first row of every symbol has no change, so the averages start one row later.
+    valid = ~np.isnan(change)
+    count = int(np.count_nonzero(valid))
+    moves = np.compress(valid, change, out=_work_array(scratch, 'moves', count))
+
+    if count == 0:
+        return result
+
+    valid_starts = starts - np.arange(len(starts))
+    valid_starts = np.unique(valid_starts[valid_starts < len(moves)])
+
+    if method == 'wilders':
+        alpha, adjust = 1.0 / period, False
+    else:
+        alpha, adjust = 2.0 / (period + 1.0), True
+
+    up = np.maximum(moves, 0.0, out=_work_array(scratch, 'up', count))
+    average_up = grouped_ewm_mean(up, valid_starts, alpha=alpha, adjust=adjust, out=_work_array(scratch, 'average_up', count))
+
+    # The moves are not needed any more, the down moves take their place.
+    down = np.maximum(np.negative(moves, out=moves), 0.0, out=moves)
+    average_down = grouped_ewm_mean(down, valid_starts, alpha=alpha, adjust=adjust, out=_work_array(scratch, 'average_down', count))
+
+    # 100 - 100 / (1 + up / down), worked out in place in the array of the up averages.
+    relative_strength_index = average_up
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(average_up, average_down, out=relative_strength_index)
+    np.add(relative_strength_index, 1.0, out=relative_strength_index)
+    np.divide(100.0, relative_strength_index, out=relative_strength_index)
+    np.subtract(100.0, relative_strength_index, out=relative_strength_index)
+
+    # No down moves at all means the RSI is pinned at 100.
+    relative_strength_index[average_down == 0] = 100.0
+    result[valid] = relative_strength_index
+
+    return result
@@ -0,0 +1,444 @@
+import json
+import time
+import asyncio
+import logging
+
+from collections import deque
+
+from typing import List
+from typing import Dict
+from typing import Union
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+
+from essentials.stock_frame import StockFrame
+from essentials.order_book import OrderBooks
+from essentials.aggregator import TradeAggregator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+
+BINANCE_STREAM_URL = 'wss://stream.binance.com:9443/ws'
+
+logger = logging.getLogger(__name__)
+
+
+def _loads(message: Union[str, bytes]) -> dict:
+
+    if orjson is not None:
+        return orjson.loads(message)
+
+    return json.loads(message)
+
+
+class Transport:
+    """
+    Where the raw stream messages come from. The pipeline only talks to this interface
+    so a live WebSocket can be swapped for a recording or a local fake server.
+    """
+
+    async def connect(self) -> None:
+        pass
+
+    async def send(self, message: str) -> None:
+        pass
+
+    async def receive(self) -> Optional[Union[str, bytes]]:
+        """Returns the next message, or None once the stream has ended."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class WebSocketTransport(Transport):
+
+    def __init__(self, url: str = BINANCE_STREAM_URL) -> None:
+
+        if websockets is None:
+            raise ImportError("WebSocketTransport needs the websockets package, pip install websockets.")
+
+        self.url = url
+        self._connection = None
+
+    async def connect(self) -> None:
+
+        self._connection = await websockets.connect(self.url, max_size=None)
+
+    async def send(self, message: str) -> None:
+
+        await self._connection.send(message)
+
+    async def receive(self) -> Optional[Union[str, bytes]]:
+
+        try:
+            return await self._connection.recv()
+        except websockets.ConnectionClosed:
+            return None
+
+    async def close(self) -> None:
+
+        if self._connection is not None:
+            await self._connection.close()
+
+
+class ReplayTransport(Transport):
+
+    def __init__(self, messages: Iterable[Union[str, bytes]], delay: float = 0.0) -> None:
+        """
+        Replays recorded stream messages, e.g. the lines of a file written by `record`.
+
+        :param messages: The raw messages in the order they were received.
+        :param delay: Seconds to wait between messages, 0 replays as fast as possible.
+        """
+
+        self._messages = iter(messages)
+        self._delay = delay
+        self.sent: List[str] = []
+
+    async def send(self, message: str) -> None:
+
+        self.sent.append(message)
+
+    async def receive(self) -> Optional[Union[str, bytes]]:
+
+        if self._delay:
+            await asyncio.sleep(self._delay)
+        else:
+            # Still give the strategy loop a chance to run between messages.
+            await asyncio.sleep(0)
+
+        return next(self._messages, None)
+
+
+class MarketDataPipeline:
+
+    def __init__(self, stock_frame: StockFrame, symbols: List[str], interval: str = '1m', transport: Transport = None,
+                 book_ticker: bool = True, max_batch: int = 500, max_delay: float = 0.0, on_batch: Callable = None,
+                 order_books: OrderBooks = None, trade_bars: TradeAggregator = None) -> None:
+        """
+        Subscribes to the kline (and book ticker) streams of many symbols over a single
+        connection and feeds the bars into a StockFrame in micro-batches.
+
+        Messages are read off the transport by one task and queued, a second task drains
+        whatever is queued, decodes it in one go and hands it to `StockFrame.add_rows`.
+        Both run on the event loop so the strategy loop only has to await.
+
+        :param stock_frame: The StockFrame the bars are added to.
+        :param symbols: The symbols to subscribe to, e.g. ['BTCUSDT', 'ETHUSDT'].
+        :param interval: The kline interval, e.g. 1m.
+        :param transport: Where the messages come from, a WebSocketTransport by default.
+        :param book_ticker: Also subscribe to the best bid/ask of every symbol.
+        :param max_batch: The most messages decoded in one batch.
+        :param max_delay: The longest a burst of messages is collected into one batch, in
+        seconds. With 0 a batch is whatever queued up while the last one was added. A
+        message that comes alone is always added right away.
+        :param on_batch: Called with the quotes dict after every batch was added.
+        :param order_books: Keep a local order book per symbol off the diff-depth stream. While
+        a book is in sync the bars of its symbol are made of its mid prices and its book
+        volume instead of the traded prices and volume of the kline.
+        :param trade_bars: Also subscribe to the aggTrade stream and build bars from the
+        trades with this aggregator, flushed into its StockFrame after every batch.
+        """
+
+        self.stock_frame = stock_frame
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.interval = interval
+        self.transport = transport if transport is not None else WebSocketTransport()
+        self.book_ticker = book_ticker
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_batch = on_batch
+        self.order_books = order_books
+        self.trade_bars = trade_bars
+
+        # The newest best bid/ask per symbol, from the book ticker stream.
+        self.book: Dict[str, dict] = {}
+
+        # The newest quote added to the StockFrame per symbol.
+        self.quotes: Dict[str, dict] = {}
+
+        self.messages_received = 0
+        self.bars_added = 0
+        self.batches = 0
+
+        # Messages that could not be decoded or applied, they are logged and skipped.
+        self.bad_messages = 0
+
+        # Tick-to-frame latency in seconds, from the message arriving to add_rows returning.
+        self.latencies = deque(maxlen=100000)
+
+        self._queue: asyncio.Queue = None
+        self._tasks: List[asyncio.Task] = []
+        self._batch_event: asyncio.Event = None
+        self._running = False
+
+    @property
+    def streams(self) -> List[str]:
+
+        streams = []
+        for symbol in self.symbols:
+            streams.append('{symbol}@kline_{interval}'.format(symbol=symbol.lower(), interval=self.interval))
+            if self.book_ticker:
+                streams.append('{symbol}@bookTicker'.format(symbol=symbol.lower()))
+            if self.order_books is not None:
+                streams.append('{symbol}@depth@100ms'.format(symbol=symbol.lower()))
+            if self.trade_bars is not None:
+                streams.append('{symbol}@aggTrade'.format(symbol=symbol.lower()))
+
+        return streams
+
+    def subscribe_message(self, request_id: int = 1) -> str:
+
+        return json.dumps({'method': 'SUBSCRIBE', 'params': self.streams, 'id': request_id})
+
+    async def start(self) -> None:
+
+        self._queue = asyncio.Queue()
+        self._batch_event = asyncio.Event()
+        self._running = True
+
+        await self.transport.connect()
+        await self.transport.send(self.subscribe_message())
+
+        self._tasks = [
+            asyncio.ensure_future(self._read()),
+            asyncio.ensure_future(self._drain())
+        ]
+
+    async def stop(self) -> None:
+
+        self._running = False
+
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.transport.close()
+
+    async def run(self) -> None:
+        """Runs until the transport runs out of messages and every message was added."""
+
+        await self.start()
+        await asyncio.gather(*self._tasks)
+        await self.transport.close()
+
+    async def wait_for_batch(self) -> None:
+        """Lets the strategy loop sleep until the next batch landed in the StockFrame."""
+
+        await self._batch_event.wait()
+        self._batch_event.clear()
+
+    async def _read(self) -> None:
+
+        while self._running:
+
+            message = await self.transport.receive()
+
+            # None marks the end of the stream for the drain task as well.
+            await self._queue.put((time.perf_counter(), message))
+
+            if message is None:
+                return
+
+    async def _drain(self) -> None:
+
+        while True:
+
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_delay
+
+            # Keep taking messages while a burst is coming in, up to `max_delay`. The reader
+            # gets one turn of the loop per round, a lone tick is flushed after the first.
+            while len(batch) < self.max_batch:
+
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                if len(batch) == 1 or time.perf_counter() >= deadline:
+                    break
+
+                await asyncio.sleep(0)
+
+                if self._queue.empty():
+                    break
+
+            finished = batch[-1][1] is None
+            if finished:
+                batch.pop()
+
+            if batch:
+                self._process(batch=batch)
+
+            if finished:
+                return
+
+    def _process(self, batch: List[tuple]) -> None:
+
+        self.messages_received += len(batch)
+        received_times = []
+        quotes = {}
+
+        for received, message in batch:
+
+            # One bad message must not end the drain task, it is counted and skipped.
+            try:
+                payload = _loads(message)
+
+                # Combined streams wrap the event in {'stream': ..., 'data': ...}.
+                data = payload.get('data', payload)
+
+                if 'k' in data:
+                    quote = self._decode_kline(data['k'])
+                    symbol = quote['symbol']
+
+                    # add_rows takes one bar per symbol, push what we have when a new bar starts.
+                    if symbol in quotes and quotes[symbol]['quoteTimeInLong'] != quote['quoteTimeInLong']:
+                        self._add(quotes=quotes, received_times=received_times)
+                        quotes = {}
+                        received_times = []
+
+                    quotes[symbol] = quote
+                    received_times.append(received)
+
+                elif data.get('e') == 'aggTrade':
+                    if self.trade_bars is not None:
+                        self.trade_bars.add_event(event=data)
+
+                elif data.get('e') == 'depthUpdate':
+                    if self.order_books is not None:
+                        self.order_books.apply(event=data)
+
+                elif 'b' in data and 'a' in data and 's' in data:
+                    self.book[data['s']] = {
+                        'bidPrice': float(data['b']),
+                        'bidSize': float(data['B']),
+                        'askPrice': float(data['a']),
+                        'askSize': float(data['A'])
+                    }
+
+            except Exception:
+                self.bad_messages += 1
+                logger.exception("Skipped a stream message that could not be processed: %.200r", message)
+
+        if quotes:
+            self._add(quotes=quotes, received_times=received_times)
+
+        if self.trade_bars is not None:
+            try:
+                flushed = self.trade_bars.flush()
+            except Exception:
+                flushed = False
+                logger.exception("Could not flush the trade bars.")
+
+            if flushed and self._batch_event is not None:
+                self._batch_event.set()
+
+    def _decode_kline(self, kline: dict) -> dict:
+
+        quote = {
+            'symbol': kline['s'],
+            'quoteTimeInLong': int(kline['t']),
+            'openPrice': float(kline['o']),
+            'closePrice': float(kline['c']),
+            'highPrice': float(kline['h']),
+            'lowPrice': float(kline['l']),
+            'volume': float(kline['v']),
+            'closed': kline.get('x', False)
+        }
+
+        book = self.book.get(kline['s'])
+        if book:
+            quote.update(book)
+
+        if self.order_books is not None and kline['s'] in self.order_books.books:
+            order_book = self.order_books[kline['s']]
+            book_quote = order_book.quote() if order_book.synced else None
+
+            if book_quote is not None:
+                # The mid price bar of the book when it covers the same interval, the
+                # current mid price while the book has not moved in this interval yet.
+                if book_quote['quoteTimeInLong'] != quote['quoteTimeInLong']:
+                    for name in ('openPrice', 'highPrice', 'lowPrice', 'closePrice'):
+                        book_quote[name] = book_quote['midPrice']
+
+                quote.update(
+                    openPrice=book_quote['openPrice'],
+                    highPrice=book_quote['highPrice'],
+                    lowPrice=book_quote['lowPrice'],
+                    closePrice=book_quote['closePrice'],
+                    midPrice=book_quote['midPrice'],
+                    bookVolume=book_quote['bookVolume']
+                )
+
+        return quote
+
+    def _add(self, quotes: dict, received_times: List[float]) -> None:
+
+        try:
+            self.stock_frame.add_rows(data=quotes)
+        except Exception:
+            self.bad_messages += len(received_times)
+            logger.exception("Could not add the bars of %s to the StockFrame.", ', '.join(quotes))
+            return
+
+        done = time.perf_counter()
+        self.latencies.extend(done - received for received in received_times)
+
+        self.quotes.update(quotes)
+        self.bars_added += len(quotes)
+        self.batches += 1
+
+        if self.on_batch is not None:
+            try:
+                self.on_batch(quotes)
+            except Exception:
+                logger.exception("on_batch raised on the bars of %s.", ', '.join(quotes))
+
+        if self._batch_event is not None:
+            self._batch_event.set()
+
+    def latency_stats(self) -> Dict[str, float]:
+        """Tick-to-frame latency percentiles in microseconds."""
+
+        if not self.latencies:
+            return {}
+
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+
+        return {
+            'count': count,
+            'p50_us': ordered[count // 2] * 1e6,
+            'p90_us': ordered[int(count * 0.9)] * 1e6,
+            'p99_us': ordered[min(int(count * 0.99), count - 1)] * 1e6,
+            'max_us': ordered[-1] * 1e6
+        }
+
+
+async def record(url: str, streams: List[str], path: str, count: int) -> None:
+    """Writes `count` raw messages of the given streams to `path`, one per line, for replaying later."""
+
+    transport = WebSocketTransport(url=url)
+    await transport.connect()
+    await transport.send(json.dumps({'method': 'SUBSCRIBE', 'params': streams, 'id': 1}))
+
+    with open(path, 'w') as recording:
+        for _ in range(count):
+            message = await transport.receive()
+            if message is None:
+                break
+            if isinstance(message, bytes):
+                message = message.decode()
+            recording.write(message.strip() + '\n')
+
+    await transport.close()
@@ -0,0 +1,282 @@
+import os
+import json
+import shutil
+import inspect
+import tempfile
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+from typing import Optional
+
+from essentials.backtest import Backtest
+
+
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+
+# Grid keys that are arguments of Backtest, everything else goes to the strategy.
+BACKTEST_ARGUMENTS = set(inspect.signature(Backtest.__init__).parameters) - {'self', 'columns', 'strategy'}
+
+
+class SharedBars:
+    """
+    Bars written once to .npy files and memory-mapped by every worker, the OS shares the
+    pages so nothing is pickled or copied per process.
+
+        <directory>/symbols.json
+        <directory>/<symbol>.datetime.npy   int64 milliseconds
+        <directory>/<symbol>.ohlcv.npy      float64, one column per field
+    """
+
+    def __init__(self, directory: str) -> None:
+
+        self.directory = directory
+
+        with open(os.path.join(directory, 'symbols.json')) as symbols_file:
+            self.symbols: List[str] = json.load(symbols_file)
+
+    @classmethod
+    def write(cls, columns: Dict[str, Dict[str, np.ndarray]], directory: str) -> 'SharedBars':
+
+        os.makedirs(directory, exist_ok=True)
+
+        for symbol, symbol_columns in columns.items():
+            np.save(os.path.join(directory, symbol + '.datetime.npy'), np.asarray(symbol_columns['datetime'], dtype=np.int64))
+            np.save(
+                os.path.join(directory, symbol + '.ohlcv.npy'),
+                np.column_stack([np.asarray(symbol_columns[name], dtype=np.float64) for name in OHLCV])
+            )
+
+        with open(os.path.join(directory, 'symbols.json'), 'w') as symbols_file:
+            json.dump(list(columns), symbols_file)
+
+        return cls(directory=directory)
+
+    def load(self, start: int = None, end: int = None) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        :param start: The first open time in milliseconds to keep, inclusive.
+        :param end: The last open time in milliseconds to keep, exclusive.
+        :return: The bars per symbol as views on the mapped files.
+        """
+
+        columns = {}
+
+        for symbol in self.symbols:
+
+            timestamps = np.load(os.path.join(self.directory, symbol + '.datetime.npy'), mmap_mode='r')
+            values = np.load(os.path.join(self.directory, symbol + '.ohlcv.npy'), mmap_mode='r')
+
+            first = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+            last = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='left'))
+
+            columns[symbol] = {'datetime': timestamps[first:last]}
+            for position, name in enumerate(OHLCV):
+                columns[symbol][name] = values[first:last, position]
+
+        return columns
+
+
+def parameter_grid(grid: Dict[str, list]) -> List[dict]:
+    """Every combination of the values in `grid`, e.g. {'period': [7, 14], 'buy': [20, 30]}."""
+
+    names = list(grid)
+
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def walk_forward_windows(start: int, end: int, train: int, test: int, step: int = None) -> List[Tuple[int, int, int, int]]:
+    """
+    Rolling (train start, train end, test start, test end) windows in milliseconds, every
+    test window directly follows its training window.
+
+    :param train: The length of a training window in milliseconds.
+    :param test: The length of a test window in milliseconds.
+    :param step: How far the windows move each time, the test length by default.
+    """
+
+    step = test if step is None else step
+    windows = []
+
+    train_start = start
+    while train_start + train + test <= end:
+        windows.append((train_start, train_start + train, train_start + train, train_start + train + test))
+        train_start += step
+
+    return windows
+
+
+def _python_value(value):
+
+    # Values read back from the results table are NumPy scalars.
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# Set once per worker process by `_initialize`.
+_shared_bars: Optional[SharedBars] = None
+
+
+def _initialize(directory: str) -> None:
+
+    global _shared_bars
+    _shared_bars = SharedBars(directory=directory)
+
+
+def _run_task(task: dict, strategy: Callable, backtest_args: dict) -> dict:
+
+    parameters = task['parameters']
+    arguments = dict(backtest_args)
+    arguments.update({name: value for name, value in parameters.items() if name in BACKTEST_ARGUMENTS})
+    strategy_parameters = {name: value for name, value in parameters.items() if name not in BACKTEST_ARGUMENTS}
+
+    backtest = Backtest(
+        columns=_shared_bars.load(start=task['start'], end=task['end']),
+        strategy=partial(strategy, parameters=strategy_parameters),
+        **arguments
+    )
+
+    row = {'window': task['window'], 'phase': task['phase']}
+    row.update(parameters)
+    row.update(backtest.run(mode='fast').summary())
+    del row['mode']
+
+    return row
+
+
+class Optimizer:
+
+    def __init__(self, columns: Dict[str, Dict[str, np.ndarray]], strategy: Callable, grid: Dict[str, list],
+                 metric: str = 'equity', max_workers: int = None, directory: str = None, backtest_args: dict = None) -> None:
+        """
+        Sweeps a parameter grid with fast mode backtests spread over a process pool.
+
+        :param columns: Per symbol the time ordered bars, as returned by `BarStore.load_many`.
+        :param strategy: A module level function `strategy(indicators, parameters)` adding the
+        indicators and signals for one combination, it is pickled to the workers by name.
+        :param grid: The values to try per parameter. Names of `Backtest` arguments, like
+        stop_loss, go to the backtest, the rest to the strategy.
+        :param metric: The column of `BacktestResult.summary` the results are ranked by, higher is better.
+        :param max_workers: The number of processes, one per core by default.
+        :param directory: Where the shared bar files go, a temporary directory by default.
+        :param backtest_args: Fixed `Backtest` arguments, e.g. {'commission': 0.001}.
+        """
+
+        self.strategy = strategy
+        self.grid = grid
+        self.metric = metric
+        self.max_workers = max_workers or os.cpu_count()
+        self.backtest_args = backtest_args or {}
+
+        self._temporary = directory is None
+        self.directory = tempfile.mkdtemp(prefix='tradebot-bars-') if directory is None else directory
+        self.shared_bars = SharedBars.write(columns=columns, directory=self.directory)
+
+        self._bounds = (
+            min(int(bars['datetime'][0]) for bars in columns.values() if len(bars['datetime'])),
+            max(int(bars['datetime'][-1]) for bars in columns.values() if len(bars['datetime'])) + 1
+        )
+
+    def close(self) -> None:
+        """Removes the shared bar files if the optimizer made the directory."""
+
+        if self._temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self) -> 'Optimizer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _execute(self, tasks: List[dict]) -> List[dict]:
+
+        if self.max_workers == 1:
+            _initialize(directory=self.directory)
+            return [_run_task(task, strategy=self.strategy, backtest_args=self.backtest_args) for task in tasks]
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_initialize, initargs=(self.directory,)) as executor:
+            return list(executor.map(
+                partial(_run_task, strategy=self.strategy, backtest_args=self.backtest_args),
+                tasks,
+                chunksize=max(1, len(tasks) // (self.max_workers * 4))
+            ))
+
+    def _rank(self, rows: List[dict]) -> pd.DataFrame:
+
+        results = pd.DataFrame(rows)
+        if results.empty:
+            return results
+
+        results = results.sort_values(by=['window', 'phase', self.metric], ascending=[True, False, False], kind='stable')
+        results['rank'] = results.groupby(['window', 'phase']).cumcount() + 1
+
+        return results.reset_index(drop=True)
+
+    def run(self, output: str = None) -> pd.DataFrame:
+        """
+        Backtests every combination of the grid over the whole history.
+
+        :param output: A CSV file the ranked table is written to.
+        :return: One row per combination, best first.
+        """
+
+        tasks = [
+            {'window': 0, 'phase': 'full', 'start': None, 'end': None, 'parameters': parameters}
+            for parameters in parameter_grid(self.grid)
+        ]
+
+        results = self._rank(rows=self._execute(tasks=tasks))
+
+        if output:
+            results.to_csv(output, index=False)
+
+        return results
+
+    def walk_forward(self, train: int, test: int, step: int = None, output: str = None) -> pd.DataFrame:
+        """
+        Optimizes on every training window, then backtests the winner on the window after
+        it. Every window starts without open positions or warmed up indicators.
+
+        :param train: The length of a training window in milliseconds.
+        :param test: The length of a test window in milliseconds.
+        :param step: How far the windows move each time, the test length by default.
+        :param output: A CSV file the ranked table is written to.
+        :return: The ranked 'train' rows of every window and the 'test' row of its winner.
+        """
+
+        windows = walk_forward_windows(start=self._bounds[0], end=self._bounds[1], train=train, test=test, step=step)
+        combinations = parameter_grid(self.grid)
+
+        train_tasks = [
+            {'window': number, 'phase': 'train', 'start': window[0], 'end': window[1], 'parameters': parameters}
+            for number, window in enumerate(windows)
+            for parameters in combinations
+        ]
+
+        train_results = self._rank(rows=self._execute(tasks=train_tasks))
+
+        test_tasks = []
+        for number, window in enumerate(windows):
+            best = train_results[(train_results['window'] == number) & (train_results['rank'] == 1)]
+            if len(best):
+                test_tasks.append({
+                    'window': number,
+                    'phase': 'test',
+                    'start': window[2],
+                    'end': window[3],
+                    'parameters': {name: _python_value(best[name].iloc[0]) for name in self.grid}
+                })
+
+        results = self._rank(rows=train_results.drop(columns='rank').to_dict('records') + self._execute(tasks=test_tasks))
+
+        if output:
+            results.to_csv(output, index=False)
+
+        return results
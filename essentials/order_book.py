@@ -0,0 +1,578 @@
+import math
+import time
+import threading
+
+from concurrent.futures import wait
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+
+from decimal import Decimal
+
+import numpy as np
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+from typing import Optional
+
+
+# A side of the book keeps the levels within this many ticks of the best level in a Fenwick tree,
+# levels further out are kept aside and only summed when a query reaches them.
+MIN_SLOTS = 1 << 10
+MAX_SLOTS = 1 << 16
+
+
+def _decimals(price) -> int:
+    """How many decimals a price needs, e.g. 2 for '10000.01000000'."""
+
+    return max(0, -Decimal(str(price)).normalize().as_tuple().exponent)
+
+
+class BookSide:
+
+    def __init__(self, bids: bool) -> None:
+        """
+        The price levels of one side of the book, indexed by their distance in ticks from
+        a base price. The sizes and the number of levels are kept in two Fenwick trees over
+        that index, so a level changes and the size up to a price or over the best n levels
+        is summed in O(log n). Bid prices are negated so both sides count up from the best
+        price. The tick is the smallest decimal the prices seen so far use.
+
+        :param bids: True for the bid side, False for the ask side.
+        """
+
+        self._sign = -1 if bids else 1
+        self._scale = 1.0
+        self._decimals = 0
+
+        # Every level by its key, the price in ticks (negated for bids).
+        self._levels: Dict[int, float] = {}
+
+        # The tree covers the keys from `_base` to `_base + _slots - 1`, the rest are `_outside`.
+        self._base = 0
+        self._slots = MIN_SLOTS
+        self._sizes: List[float] = [0.0] * (MIN_SLOTS + 1)
+        self._counts: List[int] = [0] * (MIN_SLOTS + 1)
+        self._inside = 0
+        self._outside: Dict[int, float] = {}
+        self._best: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+    def load(self, levels: List[list]) -> None:
+        """Replaces every level, e.g. with the levels of a snapshot as [price, size] pairs."""
+
+        levels = [(price, float(size)) for price, size in levels if float(size) > 0.0]
+        if levels:
+            self._decimals = max(_decimals(price) for price, _ in levels)
+            self._scale = float(10 ** self._decimals)
+
+        self._levels = {self._key(price=float(price)): size for price, size in levels}
+        self._rebuild()
+
+    def _key(self, price: float) -> int:
+        return round(self._sign * price * self._scale)
+
+    def _rebuild(self) -> None:
+
+        levels = self._levels
+        self._outside = {}
+        self._inside = 0
+
+        if not levels:
+            self._best = None
+            self._slots = MIN_SLOTS
+            self._sizes = [0.0] * (MIN_SLOTS + 1)
+            self._counts = [0] * (MIN_SLOTS + 1)
+            return
+
+        best = min(levels)
+        span = max(levels) - best + 1
+        slots = MIN_SLOTS
+        while slots < 2 * span and slots < MAX_SLOTS:
+            slots <<= 1
+
+        # Room on the better side so a drifting price does not rebuild the tree at once.
+        self._base = base = best - slots // 4
+        self._slots = slots
+        self._best = best
+
+        sizes = [0.0] * (slots + 1)
+        counts = [0] * (slots + 1)
+
+        for key, size in levels.items():
+            index = key - base
+            if index < slots:
+                sizes[index + 1] = size
+                counts[index + 1] = 1
+                self._inside += 1
+            else:
+                self._outside[key] = size
+
+        for index in range(1, slots + 1):
+            parent = index + (index & -index)
+            if parent <= slots:
+                sizes[parent] += sizes[index]
+                counts[parent] += counts[index]
+
+        self._sizes = sizes
+        self._counts = counts
+
+    def _refine(self, price: float) -> None:
+
+        decimals = _decimals(price)
+        if decimals <= self._decimals:
+            return
+
+        factor = 10 ** (decimals - self._decimals)
+        self._levels = {key * factor: size for key, size in self._levels.items()}
+        self._decimals = decimals
+        self._scale = float(10 ** decimals)
+        self._rebuild()
+
+    def update(self, price: float, size: float) -> None:
+        """Sets the size of a level, a size of 0 removes it."""
+
+        scaled = self._sign * price * self._scale
+        key = round(scaled)
+
+        # A price off the tick, the book moves to the finer tick.
+        if abs(scaled - key) > 1e-9 * abs(scaled):
+            self._refine(price=price)
+            key = self._key(price=price)
+
+        levels = self._levels
+        previous = levels.get(key)
+
+        if size == 0.0:
+            if previous is None:
+                return
+            del levels[key]
+            size_change, count_change = -previous, -1
+        else:
+            levels[key] = size
+            if previous is None:
+                size_change, count_change = size, 1
+            else:
+                size_change, count_change = size - previous, 0
+
+        index = key - self._base
+
+        if 0 <= index < self._slots:
+            sizes, counts, slots = self._sizes, self._counts, self._slots
+            position = index + 1
+
+            if not count_change:
+                while position <= slots:
+                    sizes[position] += size_change
+                    position += position & -position
+            else:
+                while position <= slots:
+                    sizes[position] += size_change
+                    counts[position] += count_change
+                    position += position & -position
+
+                self._inside += count_change
+                if count_change > 0:
+                    if self._best is None or key < self._best:
+                        self._best = key
+                elif key == self._best:
+                    if self._inside:
+                        self._best = self._base + self._kth(count=1)
+                    else:
+                        self._rebuild()
+
+        elif index >= self._slots and self._inside:
+            if size == 0.0:
+                del self._outside[key]
+            else:
+                self._outside[key] = size
+
+        else:
+            self._rebuild()
+
+    def _prefix(self, index: int) -> float:
+        """The total size of the tree's first `index + 1` slots."""
+
+        sizes = self._sizes
+        total = 0.0
+        position = index + 1
+        while position:
+            total += sizes[position]
+            position &= position - 1
+
+        return total
+
+    def _kth(self, count: int) -> int:
+        """The slot of the `count`-th level in the tree, counted from 1."""
+
+        counts, slots = self._counts, self._slots
+        position = 0
+        step = slots
+        while step:
+            following = position + step
+            if following <= slots and counts[following] < count:
+                position = following
+                count -= counts[following]
+            step >>= 1
+
+        return position
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        """The best price and its size, None if the side is empty."""
+
+        if self._best is None:
+            return None
+
+        return self._sign * self._best / self._scale, self._levels[self._best]
+
+    def depth(self, price: float) -> float:
+        """The total size of the levels at `price` or better."""
+
+        scaled = self._sign * price * self._scale
+        bound = round(scaled)
+        if abs(scaled - bound) > 1e-9 * abs(scaled):
+            bound = math.floor(scaled)
+
+        index = bound - self._base
+        if index < 0 or not self._levels:
+            return 0.0
+
+        if index < self._slots:
+            return self._prefix(index=index)
+
+        return self._prefix(index=self._slots - 1) + sum(size for key, size in self._outside.items() if key <= bound)
+
+    def volume(self, levels: int) -> float:
+        """The total size of the best `levels` levels."""
+
+        count = min(levels, len(self._levels))
+        if count <= 0:
+            return 0.0
+
+        if count <= self._inside:
+            return self._prefix(index=self._kth(count=count))
+
+        outside = sorted(self._outside.items())[:count - self._inside]
+        return self._prefix(index=self._slots - 1) + sum(size for _, size in outside)
+
+    def levels(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The prices and sizes of the best `count` levels."""
+
+        keys = [self._base + self._kth(count=level) for level in range(1, min(count, self._inside) + 1)]
+        if count > self._inside:
+            keys += sorted(self._outside)[:count - self._inside]
+
+        return (self._sign * np.array(keys, dtype=float) / self._scale,
+                np.array([self._levels[key] for key in keys], dtype=float))
+
+
+class OrderBook:
+
+    def __init__(self, symbol: str, interval_ms: int = 60000, volume_levels: int = 10, max_buffer: int = 10000) -> None:
+        """
+        A local copy of a symbol's order book, seeded from a REST snapshot and kept
+        current with the diff-depth stream. Updates must follow on from the last one
+        applied, a gap leaves the book out of sync until it is seeded again.
+
+        :param symbol: The symbol, e.g. BNBBTC.
+        :param interval_ms: The bar length the mid price is sampled into for the StockFrame.
+        :param volume_levels: How many levels per side count towards the book volume.
+        :param max_buffer: The most events kept while the book is out of sync. Past it the
+        buffer is dropped, the snapshot the book waits for is then newer than what is lost.
+        """
+
+        self.symbol = symbol
+        self.interval_ms = interval_ms
+        self.volume_levels = volume_levels
+        self.max_buffer = max_buffer
+
+        self.bids = BookSide(bids=True)
+        self.asks = BookSide(bids=False)
+
+        self.last_update_id = 0
+        self.synced = False
+        self.updates_applied = 0
+        self.gaps = 0
+        self.buffer_drops = 0
+
+        # Events that arrived before the snapshot (or after a gap), replayed on the next seed.
+        self._buffer: List[dict] = []
+
+        # The mid price bar being built, [open time, open, high, low, close].
+        self._bar: Optional[list] = None
+
+    def seed(self, snapshot: dict) -> None:
+        """
+        :param snapshot: The answer of GET /api/v3/depth, with lastUpdateId, bids and asks.
+        """
+
+        self.bids.load(levels=snapshot['bids'])
+        self.asks.load(levels=snapshot['asks'])
+        self.last_update_id = int(snapshot['lastUpdateId'])
+        self.synced = True
+
+        buffered, self._buffer = self._buffer, []
+        for event in buffered:
+            self.apply(event=event)
+
+    def apply(self, event: dict) -> bool:
+        """
+        Applies a depthUpdate event.
+
+        :return: True if the book changed, False if the event was old, buffered or showed a gap.
+        """
+
+        if not self.synced:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer = []
+                self.buffer_drops += 1
+
+            self._buffer.append(event)
+            return False
+
+        first, last = event['U'], event['u']
+
+        if last <= self.last_update_id:
+            return False
+
+        if first > self.last_update_id + 1:
+            self.synced = False
+            self.gaps += 1
+            self._buffer = [event]
+            return False
+
+        for price, size in event['b']:
+            self.bids.update(price=float(price), size=float(size))
+
+        for price, size in event['a']:
+            self.asks.update(price=float(price), size=float(size))
+
+        self.last_update_id = last
+        self.updates_applied += 1
+
+        if 'E' in event:
+            self._sample(timestamp=event['E'])
+
+        return True
+
+    def _sample(self, timestamp: int) -> None:
+
+        mid = self.mid_price
+        if mid is None:
+            return
+
+        open_time = timestamp - timestamp % self.interval_ms
+        bar = self._bar
+
+        if bar is None or bar[0] != open_time:
+            self._bar = [open_time, mid, mid, mid, mid]
+        else:
+            bar[2] = max(bar[2], mid)
+            bar[3] = min(bar[3], mid)
+            bar[4] = mid
+
+    @property
+    def best_bid(self) -> Optional[Tuple[float, float]]:
+        return self.bids.best()
+
+    @property
+    def best_ask(self) -> Optional[Tuple[float, float]]:
+        return self.asks.best()
+
+    @property
+    def spread(self) -> Optional[float]:
+
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+
+        return ask[0] - bid[0]
+
+    @property
+    def mid_price(self) -> Optional[float]:
+
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+
+        return (ask[0] + bid[0]) / 2.0
+
+    @property
+    def book_volume(self) -> float:
+        """The size resting on the best `volume_levels` levels of both sides."""
+
+        return self.bids.volume(levels=self.volume_levels) + self.asks.volume(levels=self.volume_levels)
+
+    def depth(self, side: str, price: float) -> float:
+        """
+        :param side: 'bid' or 'ask'.
+        :param price: The price to go down (bids) or up (asks) to.
+        :return: The size resting at `price` or better.
+        """
+
+        return self.bids.depth(price=price) if side == 'bid' else self.asks.depth(price=price)
+
+    def quote(self) -> Optional[dict]:
+        """
+        The book as a quote for `StockFrame.add_rows`: the bar of mid prices sampled so far
+        and the size resting on the best `volume_levels` levels of both sides.
+        """
+
+        bid, ask = self.bids.best(), self.asks.best()
+        if self._bar is None or bid is None or ask is None:
+            return None
+
+        open_time, open_price, high, low, close = self._bar
+
+        return {
+            'symbol': self.symbol,
+            'quoteTimeInLong': open_time,
+            'openPrice': open_price,
+            'highPrice': high,
+            'lowPrice': low,
+            'closePrice': close,
+            'midPrice': close,
+            'bidPrice': bid[0],
+            'bidSize': bid[1],
+            'askPrice': ask[0],
+            'askSize': ask[1],
+            'bookVolume': self.book_volume
+        }
+
+
+class OrderBooks:
+
+    def __init__(self, snapshot_source: Callable[[str], dict] = None, interval_ms: int = 60000, volume_levels: int = 10,
+                 resync_interval: float = 1.0, max_buffer: int = 10000, max_workers: int = 4) -> None:
+        """
+        The order books of many symbols, fed with the raw depthUpdate events of the stream.
+
+        :param snapshot_source: Called with a symbol to fetch a fresh snapshot when its book
+        fell out of sync, e.g. `lambda symbol: client.get_order_book(symbol=symbol, limit=1000)`.
+        It runs on a thread pool so the stream of the other symbols keeps flowing, the
+        snapshot seeds the book on the first `apply` or `quotes` after it arrived. Without
+        it the book waits for `seed` to be called.
+        :param interval_ms: The bar length the mid price is sampled into.
+        :param volume_levels: How many levels per side count towards the book volume.
+        :param resync_interval: The fewest seconds between two snapshots of a symbol, events
+        are buffered in between so a snapshot older than the stream is not fetched in a loop.
+        :param max_buffer: The most events buffered per book while it is out of sync.
+        :param max_workers: How many snapshots are fetched at the same time.
+        """
+
+        self.snapshot_source = snapshot_source
+        self.resync_interval = resync_interval
+        self.max_buffer = max_buffer
+        self.max_workers = max_workers
+        self.snapshots = 0
+        self.snapshot_errors = 0
+        self._last_snapshot: Dict[str, float] = {}
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.interval_ms = interval_ms
+        self.volume_levels = volume_levels
+        self.books: Dict[str, OrderBook] = {}
+
+    def __getitem__(self, symbol: str) -> OrderBook:
+        return self.books[symbol]
+
+    def book(self, symbol: str) -> OrderBook:
+
+        if symbol not in self.books:
+            self.books[symbol] = OrderBook(symbol=symbol, interval_ms=self.interval_ms, volume_levels=self.volume_levels,
+                                           max_buffer=self.max_buffer)
+
+        return self.books[symbol]
+
+    def seed(self, symbol: str, snapshot: dict) -> OrderBook:
+
+        book = self.book(symbol=symbol)
+        book.seed(snapshot=snapshot)
+
+        return book
+
+    def apply(self, event: dict) -> bool:
+
+        if self._pending:
+            self._seed_arrived()
+
+        book = self.book(symbol=event['s'])
+        applied = book.apply(event=event)
+
+        if not book.synced and self.snapshot_source is not None and book.symbol not in self._pending:
+            now = time.monotonic()
+            if now - self._last_snapshot.get(book.symbol, -self.resync_interval) >= self.resync_interval:
+                self._last_snapshot[book.symbol] = now
+                self.snapshots += 1
+
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='snapshot')
+
+                future = self._executor.submit(self.snapshot_source, book.symbol)
+                with self._pending_lock:
+                    self._pending[book.symbol] = future
+
+        return applied
+
+    def hand_over(self, symbol: str, snapshot: dict) -> None:
+        """
+        Seeds a book with a snapshot fetched on another thread. The book is only touched on
+        the thread feeding the stream, on its next `apply` or `quotes`, or by `wait`.
+        """
+
+        future = Future()
+        future.set_result(snapshot)
+
+        with self._pending_lock:
+            self._pending[symbol] = future
+
+    def _seed_arrived(self) -> None:
+
+        with self._pending_lock:
+            arrived = [(symbol, future) for symbol, future in self._pending.items() if future.done()]
+            for symbol, _ in arrived:
+                del self._pending[symbol]
+
+        for symbol, future in arrived:
+
+            # A failed fetch is tried again on the next event after `resync_interval`.
+            if future.exception() is not None:
+                self.snapshot_errors += 1
+                continue
+
+            self.book(symbol=symbol).seed(snapshot=future.result())
+
+    def wait(self, timeout: float = None) -> None:
+        """Blocks until the snapshots being fetched arrived and seeds them, not for use on the event loop."""
+
+        with self._pending_lock:
+            pending = list(self._pending.values())
+
+        wait(pending, timeout=timeout)
+        self._seed_arrived()
+
+    def close(self) -> None:
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def quotes(self, symbols: List[str] = None) -> Dict[str, dict]:
+        """The quote of every synced book, ready for `StockFrame.add_rows`."""
+
+        if self._pending:
+            self._seed_arrived()
+
+        quotes = {}
+        for symbol in symbols if symbols is not None else self.books:
+            book = self.books.get(symbol)
+            if book is not None and book.synced:
+                quote = book.quote()
+                if quote is not None:
+                    quotes[symbol] = quote
+
+        return quotes
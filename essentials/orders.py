@@ -0,0 +1,142 @@
+from typing import List
+from typing import Optional
+
+
+ORDER_TYPES = {
+    'mkt': 'MARKET',
+    'lmt': 'LIMIT',
+    'stop': 'STOP',
+    'stop_lmt': 'STOP_LIMIT',
+    'trailing_stop': 'TRAILING_STOP'
+}
+
+ORDER_INSTRUCTIONS = {
+    'enter': {
+        'long': 'BUY',
+        'short': 'SELL_SHORT'
+    },
+    'exit': {
+        'long': 'SELL',
+        'short': 'BUY_TO_COVER'
+    }
+}
+
+OPPOSITE_SIDE = {
+    'long': 'short',
+    'short': 'long'
+}
+
+OPPOSITE_ENTER_OR_EXIT = {
+    'enter': 'exit',
+    'exit': 'enter'
+}
+
+
+class Instrument:
+
+    __slots__ = ('symbol', 'asset_type', 'sub_asset_type')
+
+    def __init__(self, symbol: Optional[str] = None, asset_type: Optional[str] = None, sub_asset_type: Optional[str] = None) -> None:
+
+        self.symbol = symbol
+        self.asset_type = asset_type
+        self.sub_asset_type = sub_asset_type
+
+    def to_dict(self) -> dict:
+
+        instrument = {'symbol': self.symbol, 'assetType': self.asset_type}
+        if self.sub_asset_type:
+            instrument['subAssetType'] = self.sub_asset_type
+
+        return instrument
+
+
+class Leg:
+
+    __slots__ = ('instruction', 'quantity', 'instrument')
+
+    def __init__(self, instruction: str, quantity: float = 0, instrument: Instrument = None) -> None:
+        """
+        :param instruction: The exchange instruction, e.g. BUY.
+        :param quantity: The quantity to trade.
+        :param instrument: What is traded, legs of child orders share it with the parent.
+        """
+
+        self.instruction = instruction
+        self.quantity = quantity
+        self.instrument = instrument if instrument is not None else Instrument()
+
+    def to_dict(self) -> dict:
+
+        return {
+            'instruction': self.instruction,
+            'quantity': self.quantity,
+            'instrument': self.instrument.to_dict()
+        }
+
+
+class Order:
+
+    __slots__ = ('order_type', 'session', 'duration', 'strategy_type', 'legs', 'price', 'stop_price', 'cancel_time', 'children')
+
+    def __init__(self, order_type: str, legs: List[Leg], price: float = None, stop_price: float = None,
+                 session: str = 'NORMAL', duration: str = 'DAY', strategy_type: str = 'SINGLE') -> None:
+        """
+        An order in a compact form, turned into the exchange payload only when `to_dict`
+        is called.
+
+        :param order_type: The exchange order type, e.g. LIMIT, see `ORDER_TYPES`.
+        :param legs: The legs of the order.
+        :param price: The limit price, None when the order type has none.
+        :param stop_price: The stop price, None when the order type has none.
+        """
+
+        self.order_type = order_type
+        self.session = session
+        self.duration = duration
+        self.strategy_type = strategy_type
+        self.legs = legs
+        self.price = price
+        self.stop_price = stop_price
+        self.cancel_time = None
+        self.children: List['Order'] = []
+
+    def to_dict(self) -> dict:
+        """The order in the nested layout the exchange expects, built in one pass."""
+
+        legs = []
+        for leg in self.legs:
+            instrument = leg.instrument
+            if instrument.sub_asset_type:
+                instrument = instrument.to_dict()
+            else:
+                instrument = {'symbol': instrument.symbol, 'assetType': instrument.asset_type}
+            legs.append({'instruction': leg.instruction, 'quantity': leg.quantity, 'instrument': instrument})
+
+        payload = {
+            'orderStrategyType': self.strategy_type,
+            'orderType': self.order_type,
+            'session': self.session,
+            'duration': self.duration,
+            'orderLegCollection': legs
+        }
+
+        if self.price is not None:
+            payload['price'] = self.price
+
+        if self.stop_price is not None:
+            payload['stopPrice'] = self.stop_price
+
+        if self.order_type == 'TRAILING_STOP':
+            payload['stopPriceLinkBasis'] = ''
+            payload['stopPriceLinkType'] = ''
+            payload['stopPriceOffset'] = 0.00
+            payload['stopType'] = 'STANDARD'
+
+        if self.cancel_time is not None:
+            payload['cancelTime'] = self.cancel_time
+
+        if self.strategy_type == 'TRIGGER':
+            payload['childOrderStrategies'] = [child.to_dict() for child in self.children]
+
+        return payload
@@ -1,3 +1,7 @@
+import numpy as np
+
+from itertools import repeat
+
 from typing import List, Tuple
 from typing import Dict
 from typing import Union
@@ -5,25 +9,164 @@ from typing import Optional
 
 
 class Portfolio:
-    def __init(self, account_number: Optional[str]):
+    def __init__(self, account_number: Optional[str] = None, capacity: int = 64):
+        """
+        The positions live in NumPy arrays, one slot per position, with a map from the
+        symbol to its slot. That way the whole book is revalued in one go from a vector
+        of prices, see `mark_to_market`.
+
+        :param account_number: The account the portfolio belongs to.
+        :param capacity: The number of slots to start with, grows when it runs out.
+        """
 
-        self.positions = {}
         self.positions_count = 0
         self.market_value = 0.0
         self.profit_loss = 0.0
         self.risk_tolerance = 0.0
         self.account_number = account_number
 
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self._symbols: List[Optional[str]] = [None] * capacity
+        self._asset_types: List[Optional[str]] = [None] * capacity
+        self._purchase_dates: List[Optional[str]] = [None] * capacity
+
+        self._quantity = np.zeros(capacity, dtype=np.float64)
+        self._purchase_price = np.zeros(capacity, dtype=np.float64)
+        self._price = np.full(capacity, np.nan)
+        self._active = np.zeros(capacity, dtype=bool)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._quantity)
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._slots)
+
+    @property
+    def positions(self) -> Dict[str, dict]:
+        """The positions as a dict per symbol, built on every call."""
+
+        return {symbol: self._position(slot=slot) for symbol, slot in self._slots.items()}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def state(self) -> Tuple[Dict[str, np.ndarray], dict]:
+        """The arrays of the book and the rest of it as plain values, `from_state` takes both back."""
+
+        arrays = {
+            'quantity': self._quantity,
+            'purchase_price': self._purchase_price,
+            'price': self._price,
+            'active': self._active
+        }
+
+        values = {
+            'account_number': self.account_number,
+            'positions_count': self.positions_count,
+            'market_value': self.market_value,
+            'profit_loss': self.profit_loss,
+            'risk_tolerance': self.risk_tolerance,
+            'slots': dict(self._slots),
+            'free': list(self._free),
+            'symbols': list(self._symbols),
+            'asset_types': list(self._asset_types),
+            'purchase_dates': list(self._purchase_dates)
+        }
+
+        return arrays, values
+
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], values: dict) -> 'Portfolio':
+
+        portfolio = cls(account_number=values['account_number'], capacity=0)
+
+        portfolio.positions_count = values['positions_count']
+        portfolio.market_value = values['market_value']
+        portfolio.profit_loss = values['profit_loss']
+        portfolio.risk_tolerance = values['risk_tolerance']
+
+        portfolio._slots = dict(values['slots'])
+        portfolio._free = list(values['free'])
+        portfolio._symbols = list(values['symbols'])
+        portfolio._asset_types = list(values['asset_types'])
+        portfolio._purchase_dates = list(values['purchase_dates'])
+
+        portfolio._quantity = np.array(arrays['quantity'], dtype=np.float64)
+        portfolio._purchase_price = np.array(arrays['purchase_price'], dtype=np.float64)
+        portfolio._price = np.array(arrays['price'], dtype=np.float64)
+        portfolio._active = np.array(arrays['active'], dtype=bool)
+
+        return portfolio
+
+    def _position(self, slot: int) -> dict:
+
+        return {
+            'symbol': self._symbols[slot],
+            'quantity': float(self._quantity[slot]),
+            'purchase_price': float(self._purchase_price[slot]),
+            'purchase_date': self._purchase_dates[slot],
+            'asset_type': self._asset_types[slot]
+        }
+
+    def _grow(self) -> None:
+
+        capacity = self.capacity
+        extra = max(capacity, 1)
+
+        self._symbols.extend([None] * extra)
+        self._asset_types.extend([None] * extra)
+        self._purchase_dates.extend([None] * extra)
+
+        self._quantity = np.concatenate((self._quantity, np.zeros(extra)))
+        self._purchase_price = np.concatenate((self._purchase_price, np.zeros(extra)))
+        self._price = np.concatenate((self._price, np.full(extra, np.nan)))
+        self._active = np.concatenate((self._active, np.zeros(extra, dtype=bool)))
+
+        self._free.extend(range(capacity + extra - 1, capacity - 1, -1))
+
+    def slot(self, symbol: str) -> int:
+        """The slot of a position, the index into the arrays `mark_to_market` works on."""
+
+        return self._slots[symbol]
+
+    def slots(self, symbols: List[str], missing: Optional[int] = None) -> np.ndarray:
+        """
+        The slots of many positions, look them up once and reuse them for every tick.
+
+        :param symbols: The symbols to look up.
+        :param missing: The slot given to symbols without a position, e.g. -1. They raise a
+        KeyError when left out.
+        """
+
+        if missing is None:
+            return np.fromiter(map(self._slots.__getitem__, symbols), dtype=np.int64, count=len(symbols))
+
+        return np.fromiter(map(self._slots.get, symbols, repeat(missing)), dtype=np.int64, count=len(symbols))
+
     def add_position(self, symbol: str, asset_type: str, purchase_date: Optional[str], quantity: int = 0, purchase_price: float = 0.0) -> dict:
 
-        self.positions[symbol] = {}
-        self.positions[symbol]['symbol'] = symbol
-        self.positions[symbol]['quantity'] = quantity
-        self.positions[symbol]['purchase_price'] = purchase_price
-        self.positions[symbol]['purchase_date'] = purchase_date
-        self.positions[symbol]['asset_type'] = asset_type
+        slot = self._slots.get(symbol)
 
-        return self.positions
+        if slot is None:
+            if not self._free:
+                self._grow()
+            slot = self._free.pop()
+            self._slots[symbol] = slot
+
+        self._symbols[slot] = symbol
+        self._asset_types[slot] = asset_type
+        self._purchase_dates[slot] = purchase_date
+        self._quantity[slot] = quantity
+        self._purchase_price[slot] = purchase_price
+        self._price[slot] = np.nan
+        self._active[slot] = True
+
+        self.positions_count = len(self._slots)
+
+        return self._position(slot=slot)
 
     def add_positions(self, positions: List[dict]) -> dict:
 
@@ -40,36 +183,130 @@ class Portfolio:
         else:
             raise TypeError("Positions must be a list of dictionaries.")
 
+        return self.positions
+
     def remove_position(self, symbol: str) -> Tuple[bool, str]:
-        if symbol in self.positions:
-            del self.positions[symbol]
+        if symbol in self._slots:
+            slot = self._slots.pop(symbol)
+
+            self._symbols[slot] = None
+            self._asset_types[slot] = None
+            self._purchase_dates[slot] = None
+            self._quantity[slot] = 0.0
+            self._purchase_price[slot] = 0.0
+            self._price[slot] = np.nan
+            self._active[slot] = False
+            self._free.append(slot)
+
+            self.positions_count = len(self._slots)
+
             return True, '{symbol} was successfully removed.'.format(symbol=symbol)
         else:
             return False, '{symbol} did not exist in the portfolio.'.format(symbol=symbol)
 
     def in_portfolio(self, symbol) -> bool:
 
-        if symbol in self.positions:
-            return True
-        else:
-            return False
+        return symbol in self._slots
 
-    def is_profitable(self, symbol: str, current_price: float) -> float:
+    def is_profitable(self, symbol: str, current_price: float) -> bool:
 
         # Grab the purchase price
-        purchase_price = self.positions[symbol]['purchase_price']
+        purchase_price = self._purchase_price[self._slots[symbol]]
+
+        return bool(purchase_price <= current_price)
+
+    def update_prices(self, prices: Union[np.ndarray, Dict[str, float]], slots: np.ndarray = None) -> None:
+        """
+        Stores the current prices the positions are valued at.
+
+        :param prices: A price per slot (the whole capacity), the prices of `slots`, or a
+        dict of prices per symbol.
+        :param slots: The slots `prices` belong to, from `slots`.
+        """
+
+        if isinstance(prices, dict):
+            known = [symbol for symbol in prices if symbol in self._slots]
+            slots = self.slots(symbols=known)
+            prices = np.fromiter((prices[symbol] for symbol in known), dtype=np.float64, count=len(known))
+
+        if slots is None:
+            self._price[:len(prices)] = prices
+        else:
+            self._price[slots] = prices
+
+    def mark_to_market(self, prices: Union[np.ndarray, Dict[str, float]] = None, slots: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """
+        Revalues every position at once. Slots without a position or without a price are
+        zero in the per slot arrays.
+
+        :param prices: New prices, see `update_prices`. The stored prices are used if left out.
+        :param slots: The slots `prices` belong to.
+        :return: The market value, unrealized profit and loss and allocation weight per
+        slot, plus the totals.
+        """
+
+        if prices is not None:
+            self.update_prices(prices=prices, slots=slots)
+
+        priced = self._active & ~np.isnan(self._price)
+        price = np.where(priced, self._price, 0.0)
+
+        market_value = self._quantity * price
+        profit_loss = np.where(priced, (price - self._purchase_price) * self._quantity, 0.0)
+
+        gross = np.abs(market_value).sum()
+        allocation = np.abs(market_value) / gross if gross else np.zeros_like(market_value)
+
+        self.market_value = float(market_value.sum())
+        self.profit_loss = float(profit_loss.sum())
+
+        return {
+            'market_value': market_value,
+            'profit_loss': profit_loss,
+            'allocation': allocation,
+            'total_market_value': self.market_value,
+            'total_profit_loss': self.profit_loss,
+            'gross_exposure': float(gross)
+        }
+
+    @property
+    def quantities(self) -> np.ndarray:
+        """The quantity per slot, negative for short positions and zero for free slots."""
+
+        return self._quantity
+
+    def exposure(self) -> np.ndarray:
+        """
+        The signed market value per slot at the stored prices. Positions without a price
+        yet are valued at their purchase price, so they still count against risk limits.
+        """
+
+        price = np.where(np.isnan(self._price), self._purchase_price, self._price)
+
+        return np.where(self._active, self._quantity * price, 0.0)
+
+    def total_market_value(self) -> float:
+
+        return self.mark_to_market()['total_market_value']
+
+    def total_allocation(self) -> Dict[str, float]:
+        """The share of the gross market value per symbol, at the stored prices."""
+
+        allocation = self.mark_to_market()['allocation']
 
-        if purchase_price <= current_price:
-            return True
-        elif purchase_price > current_price:
-            return False
+        return {symbol: float(allocation[slot]) for symbol, slot in self._slots.items()}
 
-    def total_allocation(self):
-        pass
+    def risk_exposure(self) -> Dict[str, float]:
+        """The long, short, gross and net market value at the stored prices, short positions have a negative quantity."""
 
-    def risk_exposure(self):
-        pass
+        market_value = self.mark_to_market()['market_value']
 
-    def total_market_value(self):
-        pass
+        long = float(market_value[market_value > 0.0].sum())
+        short = float(-market_value[market_value < 0.0].sum())
 
+        return {
+            'long': long,
+            'short': short,
+            'gross': long + short,
+            'net': long - short
+        }
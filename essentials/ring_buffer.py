@@ -0,0 +1,400 @@
+import numpy as np
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Sequence
+from typing import Optional
+
+
+class LatestTable:
+
+    def __init__(self) -> None:
+        """
+        The newest value of every column for every symbol, one row per RingBuffer. The
+        buffers write through to it so the newest bar of the whole universe can be read
+        as a handful of NumPy arrays instead of visiting every buffer.
+        """
+
+        self._rows = 0
+        self._size = 16
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns.values())
+
+    def add_row(self) -> int:
+
+        if self._rows == self._size:
+            self._size *= 2
+            for name, values in self._columns.items():
+                grown = np.full(self._size, np.nan)
+                grown[:self._rows] = values[:self._rows]
+                self._columns[name] = grown
+
+        self._rows += 1
+
+        return self._rows - 1
+
+    def column(self, name: str) -> np.ndarray:
+
+        if name not in self._columns:
+            self._columns[name] = np.full(self._size, np.nan)
+
+        return self._columns[name]
+
+    def values(self, names: List[str]) -> np.ndarray:
+        """A (rows x names) array of the newest values."""
+
+        values = np.empty((self._rows, len(names)), dtype=np.float64)
+
+        for position, name in enumerate(names):
+            values[:, position] = self._columns[name][:self._rows]
+
+        return values
+
+
+class RingBuffer:
+
+    def __init__(self, capacity: int, columns: List[str], dtype: type = np.float64, latest: LatestTable = None) -> None:
+        """
+        Fixed-capacity columnar storage for the bars of a single symbol.
+
+        Every column is preallocated up front, appending a bar only writes one
+        slot per column so the cost of an append does not depend on how many
+        bars are already stored. Once the buffer is full the oldest bar is
+        overwritten.
+
+        :param capacity: The maximum number of bars held in the buffer.
+        :param columns: The names of the value columns, e.g. open, close, ...
+        :param dtype: The dtype used for the value columns.
+        :param latest: A LatestTable shared between buffers that gets the newest bar.
+        """
+
+        if capacity <= 0:
+            raise ValueError("Capacity must be a positive integer.")
+
+        self._capacity = capacity
+        self._dtype = dtype
+        self._timestamps = np.zeros(capacity, dtype=np.int64)
+        self._columns: Dict[str, np.ndarray] = {}
+
+        for column in columns:
+            self._columns[column] = np.full(capacity, np.nan, dtype=dtype)
+
+        # Slot the next bar is written to.
+        self._head = 0
+        self._size = 0
+
+        # Total number of bars ever appended, never wraps.
+        self._appended = 0
+
+        # Bars that arrived older than the newest bar and did not match one.
+        self._dropped = 0
+
+        # Bumped on every write so readers can tell when a bar was revised.
+        self._version = 0
+
+        self._latest = latest
+        self._latest_row = latest.add_row() if latest is not None else -1
+
+    def __len__(self) -> int:
+        return self._size
+
+    @classmethod
+    def from_arrays(cls, capacity: int, timestamps: np.ndarray, columns: Dict[str, np.ndarray], latest: LatestTable = None,
+                    appended: int = None, version: int = 0, dropped: int = 0) -> 'RingBuffer':
+        """
+        Rebuilds a buffer from its bars, oldest first, e.g. out of a checkpoint. A buffer that
+        was full takes the arrays as they are, so memory-mapped arrays are not copied.
+
+        :param appended: The bars ever appended, the number of bars given by default.
+        """
+
+        dtype = next(iter(columns.values())).dtype if columns else np.float64
+        count = min(len(timestamps), capacity)
+
+        buffer = cls(capacity=capacity, columns=[], dtype=dtype, latest=latest)
+
+        if len(timestamps) == capacity:
+            buffer._timestamps = timestamps
+            buffer._columns = dict(columns)
+        else:
+            buffer._timestamps[:count] = timestamps[len(timestamps) - count:]
+            for name, values in columns.items():
+                buffer._columns[name] = np.full(capacity, np.nan, dtype=dtype)
+                buffer._columns[name][:count] = values[len(values) - count:]
+
+        buffer._head = count % capacity
+        buffer._size = count
+        buffer._appended = appended if appended is not None else count
+        buffer._version = version
+        buffer._dropped = dropped
+        buffer._publish()
+
+        return buffer
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    @property
+    def dtype(self) -> type:
+        return self._dtype
+
+    @property
+    def nbytes(self) -> int:
+        """The memory held by the buffer, allocated slots included."""
+
+        return self._timestamps.nbytes + sum(column.nbytes for column in self._columns.values())
+
+    @property
+    def appended(self) -> int:
+        return self._appended
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def last_timestamp(self) -> int:
+
+        if self._size == 0:
+            return -1
+
+        return int(self._timestamps[(self._head - 1) % self._capacity])
+
+    def _slot(self, offset: int) -> int:
+        """Physical slot of the bar `offset` positions back from the newest (0 = newest)."""
+        return (self._head - 1 - offset) % self._capacity
+
+    def append(self, timestamp: int, values: Sequence[float]) -> bool:
+        """
+        Appends a bar, or overwrites the newest bar when the timestamp matches it.
+
+        :param timestamp: The bar time in milliseconds since the epoch.
+        :param values: One value per column, in the order of `columns`.
+        :return: True if a new bar was added, False if an existing bar was updated
+        or the bar was dropped.
+        """
+
+        last_timestamp = self.last_timestamp
+        self._version += 1
+
+        if timestamp == last_timestamp:
+            self._write(self._slot(0), values)
+            self._publish()
+            return False
+
+        elif timestamp < last_timestamp:
+            # Late bar, only update it if we still hold it.
+            offset = self._find(timestamp)
+            if offset is None:
+                self._dropped += 1
+            else:
+                self._write(self._slot(offset), values)
+            return False
+
+        slot = self._head
+        self._timestamps[slot] = timestamp
+        self._write(slot, values, clear=True)
+
+        self._head = (self._head + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+        self._appended += 1
+        self._publish()
+
+        return True
+
+    def extend(self, timestamps: np.ndarray, columns: Dict[str, np.ndarray]) -> int:
+        """
+        Appends many bars at once, e.g. a historical backfill.
+
+        :param timestamps: Increasing bar times in milliseconds since the epoch.
+        :param columns: The values per column, columns that are left out are set to NaN.
+        :return: The number of bars added. A bar matching the newest bar revises it like
+        `append` does, older bars are skipped.
+        """
+
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        last_timestamp = self.last_timestamp
+
+        if self._size and len(timestamps) and timestamps[0] == last_timestamp:
+            slot = self._slot(0)
+            for name, column in self._columns.items():
+                if name in columns:
+                    column[slot] = np.asarray(columns[name])[0]
+            self._version += 1
+            self._publish()
+
+        newer = timestamps > last_timestamp
+        timestamps = timestamps[newer]
+        count = len(timestamps)
+
+        if count == 0:
+            return 0
+
+        # Only the newest `capacity` bars survive, skip writing the rest.
+        kept = min(count, self._capacity)
+        slots = (self._head + np.arange(count - kept, count)) % self._capacity
+
+        self._timestamps[slots] = timestamps[count - kept:]
+        for name, column in self._columns.items():
+            if name in columns:
+                column[slots] = np.asarray(columns[name])[newer][count - kept:]
+            else:
+                column[slots] = np.nan
+
+        self._head = (self._head + count) % self._capacity
+        self._size = min(self._size + count, self._capacity)
+        self._appended += count
+        self._version += 1
+        self._publish()
+
+        return count
+
+    def _publish(self) -> None:
+
+        if self._latest is None:
+            return
+
+        slot = (self._head - 1) % self._capacity
+        for name, column in self._columns.items():
+            self._latest.column(name)[self._latest_row] = column[slot]
+
+    def _write(self, slot: int, values: Sequence[float], clear: bool = False) -> None:
+
+        columns = list(self._columns.values())
+
+        for column, value in zip(columns, values):
+            column[slot] = value
+
+        # A fresh slot may still hold derived values (indicators) of the bar it replaced.
+        if clear:
+            for column in columns[len(values):]:
+                column[slot] = np.nan
+
+    def _find(self, timestamp: int) -> Optional[int]:
+        """Offset from the newest bar of the bar with `timestamp`, None if it is not held."""
+
+        timestamps = self._ordered(self._timestamps, self._size)
+        position = int(np.searchsorted(timestamps, timestamp))
+
+        if position < self._size and timestamps[position] == timestamp:
+            return self._size - 1 - position
+
+        return None
+
+    def resize(self, capacity: int) -> None:
+        """
+        Changes the number of bars the buffer holds, a smaller capacity evicts the oldest bars.
+
+        :param capacity: The new maximum number of bars.
+        """
+
+        if capacity <= 0:
+            raise ValueError("Capacity must be a positive integer.")
+
+        if capacity == self._capacity:
+            return
+
+        count = min(self._size, capacity)
+        timestamps, columns = self.tail(count)
+
+        self._timestamps = np.zeros(capacity, dtype=np.int64)
+        self._timestamps[:count] = timestamps
+
+        for name, values in columns.items():
+            self._columns[name] = np.full(capacity, np.nan, dtype=self._dtype)
+            self._columns[name][:count] = values
+
+        self._capacity = capacity
+        self._head = count % capacity
+        self._size = count
+        self._version += 1
+
+    def astype(self, dtype: type) -> None:
+        """Converts the value columns to `dtype`, e.g. back to float64 when float32 is too coarse."""
+
+        if dtype == self._dtype:
+            return
+
+        for name, column in self._columns.items():
+            self._columns[name] = column.astype(dtype)
+
+        self._dtype = dtype
+        self._version += 1
+
+    def add_column(self, name: str, fill_value: float = np.nan) -> np.ndarray:
+
+        if name not in self._columns:
+            self._columns[name] = np.full(self._capacity, fill_value, dtype=self._dtype)
+
+            if self._latest is not None and self._size:
+                self._latest.column(name)[self._latest_row] = fill_value
+
+        return self._columns[name]
+
+    def remove_column(self, name: str) -> None:
+
+        self._columns.pop(name, None)
+
+        if self._latest is not None and name in self._latest.columns:
+            self._latest.column(name)[self._latest_row] = np.nan
+
+    def set_value(self, column: str, value: float, offset: int = 0) -> None:
+        """Writes `value` into `column` for the bar `offset` positions back from the newest."""
+
+        self._columns[column][self._slot(offset)] = value
+
+        if offset == 0 and self._latest is not None:
+            self._latest.column(column)[self._latest_row] = value
+
+    def _ordered(self, array: np.ndarray, count: int) -> np.ndarray:
+
+        start = (self._head - count) % self._capacity
+
+        if start + count <= self._capacity:
+            return array[start:start + count].copy()
+
+        return np.concatenate((array[start:], array[:self._head]))
+
+    def values(self, column: str, count: int = None) -> np.ndarray:
+        """Returns the newest `count` values of a single column ordered from oldest to newest."""
+
+        if count is None or count > self._size:
+            count = self._size
+
+        return self._ordered(self._columns[column], count)
+
+    def tail(self, count: int = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Returns the newest `count` bars ordered from oldest to newest.
+
+        :param count: Number of bars to return, defaults to every stored bar.
+        :return: The timestamps and a dictionary of column arrays.
+        """
+
+        if count is None or count > self._size:
+            count = self._size
+
+        timestamps = self._ordered(self._timestamps, count)
+        columns = {name: self._ordered(array, count) for name, array in self._columns.items()}
+
+        return timestamps, columns
@@ -0,0 +1,398 @@
+import math
+import operator
+
+import numpy as np
+
+from itertools import repeat
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Union
+from typing import Sequence
+
+from essentials.trades import Trade
+from essentials.portfolio import Portfolio
+
+
+SIZING_RULES = ('fixed_fraction', 'volatility')
+
+# Why a candidate was dropped, indexed by the reason codes below.
+REJECT_REASONS = (
+    None,
+    'no price',
+    'no volatility',
+    'symbol limit',
+    'gross limit',
+    'below minimum',
+    'no position'
+)
+
+NO_PRICE = 1
+NO_VOLATILITY = 2
+SYMBOL_LIMIT = 3
+GROSS_LIMIT = 4
+BELOW_MINIMUM = 5
+NO_POSITION = 6
+
+# The fields of a candidate `check` reads, in one pass over the batch.
+TRADE_FIELDS = operator.attrgetter('symbol', 'order_size', 'price', 'enter_or_exit', 'side')
+
+# Below this many candidates the fixed cost of the array operations outweighs the
+# per candidate cost of Python, so `size` checks them one by one instead.
+VECTOR_BATCH = 40
+
+
+class RiskManager:
+
+    def __init__(self, portfolio: Portfolio, equity: float, sizing: str = 'fixed_fraction', fraction: float = 0.02,
+                 risk_per_trade: float = 0.005, max_position: float = 0.1, max_gross: float = 1.0,
+                 min_notional: float = 0.0, lot_size: float = None) -> None:
+        """
+        The pre-trade stage between the signals and the gateway: sizes a batch of candidate
+        trades and holds them to the exposure limits against the live `Portfolio`, in one
+        pass over arrays, or one candidate after the other for batches below `VECTOR_BATCH`.
+
+        Entries with a quantity of zero are sized by the sizing rule, entries with a
+        quantity are cut down to the limits. Exits are cut to the position held and do not
+        count against the limits. Within a batch the earlier candidates are served first,
+        so order the batch by priority. `size` does the same on plain arrays, so candidates
+        coming straight from the signals are checked before any Trade is made for them,
+        see `Robot.trades_from_signals`.
+
+        :param portfolio: The positions the limits are checked against, at their stored prices.
+        :param equity: The account value the fractions and limits are taken of.
+        :param sizing: 'fixed_fraction' puts `fraction` of the equity in every entry,
+        'volatility' sizes the entry so one standard deviation moves `risk_per_trade` of the equity.
+        :param fraction: The share of the equity per entry for fixed fraction sizing.
+        :param risk_per_trade: The share of the equity one standard deviation may cost for volatility sizing.
+        :param max_position: The largest market value of one symbol, as a share of the equity.
+        :param max_gross: The largest long plus short market value, as a share of the equity.
+        :param min_notional: Trades worth less than this after the checks are dropped.
+        :param lot_size: Quantities are rounded down to a multiple of this.
+        """
+
+        if sizing not in SIZING_RULES:
+            raise ValueError("The sizing has to be one of {rules}.".format(rules=', '.join(SIZING_RULES)))
+
+        self.portfolio = portfolio
+        self.equity = equity
+        self.sizing = sizing
+        self.fraction = fraction
+        self.risk_per_trade = risk_per_trade
+        self.max_position = max_position
+        self.max_gross = max_gross
+        self.min_notional = min_notional
+        self.lot_size = lot_size
+
+        # The candidates dropped by the last check, with the reason.
+        self.rejected: List[Tuple[Trade, str]] = []
+
+    @staticmethod
+    def _per_trade(values: Union[np.ndarray, Dict[str, float], None], symbols: Sequence[str]) -> np.ndarray:
+
+        if values is None:
+            return np.full(len(symbols), np.nan)
+
+        if isinstance(values, dict):
+            return np.fromiter(map(values.get, symbols, repeat(np.nan)), dtype=np.float64, count=len(symbols))
+
+        return np.asarray(values, dtype=np.float64)
+
+    def check(self, trades: List[Trade], prices: Union[np.ndarray, Dict[str, float]] = None,
+              volatility: Union[np.ndarray, Dict[str, float]] = None) -> List[Trade]:
+        """
+        :param trades: The candidates, every one with its instrument set.
+        :param prices: The current price per trade, or a dict of prices per symbol. Used
+        for trades without a price of their own, e.g. market orders, before falling back
+        to the price stored in the portfolio.
+        :param volatility: The standard deviation of the returns per trade, or a dict per
+        symbol, for volatility sizing.
+        :return: The trades that passed, in their order in the batch, with the quantity
+        changed where the sizing or the limits asked for it.
+        """
+
+        self.rejected = []
+
+        if not trades:
+            return []
+
+        count = len(trades)
+        symbols, quantity, price, enter_or_exit, side = zip(*map(TRADE_FIELDS, trades))
+        enter = list(map('enter'.__eq__, enter_or_exit))
+        long = list(map('long'.__eq__, side))
+
+        if count < VECTOR_BATCH:
+            final, reasons = self._size_each(symbols=symbols, enter=enter, long=long, quantity=quantity, price=price,
+                                             prices=prices, volatility=volatility)
+        else:
+            final, reasons = self._size_all(
+                symbols=symbols,
+                enter=np.array(enter, dtype=bool),
+                long=np.array(long, dtype=bool),
+                quantity=np.fromiter(quantity, dtype=np.float64, count=count),
+                price=np.fromiter(price, dtype=np.float64, count=count),
+                prices=prices,
+                volatility=volatility
+            )
+            final, reasons = final.tolist(), reasons.tolist()
+
+        passed = []
+        for trade, wanted, size, reason in zip(trades, quantity, final, reasons):
+            if reason:
+                self.rejected.append((trade, REJECT_REASONS[reason]))
+                continue
+            if size != wanted:
+                trade.modify_quantity(quantity=size)
+            passed.append(trade)
+
+        return passed
+
+    def size(self, symbols: Sequence[str], enter: np.ndarray, long: np.ndarray, quantity: np.ndarray = None,
+             price: np.ndarray = None, prices: Union[np.ndarray, Dict[str, float]] = None,
+             volatility: Union[np.ndarray, Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The checks of `check` on candidates given as arrays, e.g. straight from the signals
+        before any Trade is made for them.
+
+        :param symbols: The symbol per candidate.
+        :param enter: True for an entry, False for an exit.
+        :param long: True for the long side.
+        :param quantity: The quantity asked for, zero to have it sized. Left out, all are sized.
+        :param price: The price per candidate, zero where it has none.
+        :param prices: See `check`.
+        :param volatility: See `check`.
+        :return: The quantity per candidate and the reason code per candidate, zero when
+        it passed and the index into `REJECT_REASONS` when it did not.
+        """
+
+        count = len(symbols)
+
+        if count == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+        enter = np.asarray(enter, dtype=bool)
+        long = np.asarray(long, dtype=bool)
+        quantity = np.zeros(count) if quantity is None else np.asarray(quantity, dtype=np.float64)
+        price = np.zeros(count) if price is None else np.asarray(price, dtype=np.float64)
+
+        if count < VECTOR_BATCH:
+            final, reasons = self._size_each(symbols=symbols, enter=enter.tolist(), long=long.tolist(), quantity=quantity.tolist(),
+                                             price=price.tolist(), prices=prices, volatility=volatility)
+            return np.array(final), np.array(reasons, dtype=np.int64)
+
+        return self._size_all(symbols=symbols, enter=enter, long=long, quantity=quantity, price=price,
+                              prices=prices, volatility=volatility)
+
+    def _size_all(self, symbols: Sequence[str], enter: np.ndarray, long: np.ndarray, quantity: np.ndarray,
+                  price: np.ndarray, prices: Union[np.ndarray, Dict[str, float], None],
+                  volatility: Union[np.ndarray, Dict[str, float], None]) -> Tuple[np.ndarray, np.ndarray]:
+        """`size` for a large batch, every rule one array operation over the batch."""
+
+        count = len(symbols)
+
+        direction = np.where(long, 1.0, -1.0)
+
+        book = self.portfolio.exposure()
+        slots = self.portfolio.slots(symbols=symbols, missing=-1)
+        held = slots >= 0
+        exposure = np.where(held, book[slots], 0.0)
+        position = np.where(held, self.portfolio.quantities[slots], 0.0)
+
+        # Candidate price, then the given price, then the portfolio's.
+        if prices is not None:
+            price = np.where(price > 0.0, price, self._per_trade(values=prices, symbols=symbols))
+
+        missing = ~(price > 0.0) & held
+        if missing.any():
+            price = price.copy()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                price[missing] = np.abs(exposure[missing] / position[missing])
+
+        priced = np.isfinite(price) & (price > 0.0)
+        price = np.where(priced, price, 1.0)
+
+        # Size the entries left at zero.
+        unsized = enter & (quantity <= 0.0)
+        valid = enter & priced
+
+        if self.sizing == 'volatility':
+            sigma = self._per_trade(values=volatility, symbols=symbols)
+            known = np.isfinite(sigma) & (sigma > 0.0)
+            valid &= known | ~unsized
+            target = self.risk_per_trade * self.equity / np.where(known, sigma, np.inf)
+        else:
+            target = self.fraction * self.equity
+
+        requested = np.where(valid, np.where(unsized, target, quantity * price), 0.0)
+
+        # Per symbol and side, the room left under the limit is handed out in batch order.
+        room = np.maximum(self.max_position * self.equity - direction * exposure, 0.0)
+
+        if len(set(symbols)) == count:
+            approved = np.minimum(requested, room)
+        else:
+            codes = {symbol: code for code, symbol in enumerate(dict.fromkeys(symbols))}
+            key = np.fromiter(map(codes.__getitem__, symbols), dtype=np.int64, count=count) * 2 + (direction > 0.0)
+            approved = self._hand_out(key=key, requested=requested, room=room)
+
+        # The same over the whole book for the gross exposure.
+        gross_room = max(self.max_gross * self.equity - float(np.abs(book).sum()), 0.0)
+
+        total = np.cumsum(approved)
+        if total[-1] <= gross_room:
+            capped = approved
+        else:
+            # Left alone up to the limit, the difference of the sums would round them.
+            capped = np.where(total <= gross_room, approved, np.maximum(gross_room - (total - approved), 0.0))
+
+        # Exits close at most the position held on their side.
+        open_quantity = np.maximum(direction * position, 0.0)
+        closing = np.minimum(np.where(quantity > 0.0, quantity, open_quantity), open_quantity)
+
+        # Left alone where nothing was cut, so the quantity is not rounded by the sums.
+        kept = ~unsized & (capped == requested)
+        final = np.where(enter, np.where(kept, quantity, capped / price), closing)
+
+        if self.lot_size:
+            final = np.floor(final / self.lot_size + 1e-9) * self.lot_size
+
+        passed = (final > 0.0) & ~(enter & (final * price < self.min_notional))
+
+        if passed.all():
+            return final, np.zeros(count, dtype=np.int64)
+
+        # The first reason that applies wins, so they are written from the last to the first.
+        reasons = np.full(count, BELOW_MINIMUM, dtype=np.int64)
+        reasons[capped < approved] = GROSS_LIMIT
+        reasons[approved < requested] = SYMBOL_LIMIT
+        reasons[~valid] = NO_VOLATILITY
+        reasons[~priced] = NO_PRICE
+        reasons[~enter] = BELOW_MINIMUM
+        reasons[~enter & (open_quantity <= 0.0)] = NO_POSITION
+        reasons[passed] = 0
+
+        return np.where(passed, final, 0.0), reasons
+
+    def _size_each(self, symbols: Sequence[str], enter: Sequence[bool], long: Sequence[bool], quantity: Sequence[float],
+                   price: Sequence[float], prices: Union[np.ndarray, Dict[str, float], None],
+                   volatility: Union[np.ndarray, Dict[str, float], None]) -> Tuple[List[float], List[int]]:
+        """`size` for a small batch, the same rules one candidate after the other on plain lists."""
+
+        count = len(symbols)
+        equity = self.equity
+
+        book = self.portfolio.exposure()
+        slots = self.portfolio.slots(symbols=symbols, missing=-1).tolist()
+        quantities = self.portfolio.quantities
+
+        by_symbol = isinstance(prices, dict)
+        sigmas = self._per_trade(values=volatility, symbols=symbols).tolist() if self.sizing == 'volatility' else None
+        fixed_target = self.fraction * equity
+        symbol_limit = self.max_position * equity
+
+        gross_room = max(self.max_gross * equity - float(np.abs(book).sum()), 0.0)
+        total = 0.0
+        used: Dict[Tuple[str, bool], float] = {}
+
+        final = [0.0] * count
+        reasons = [0] * count
+
+        for index, (symbol, slot, entry, is_long, wanted, candidate_price) in enumerate(
+                zip(symbols, slots, enter, long, quantity, price)):
+
+            direction = 1.0 if is_long else -1.0
+            held = slot >= 0
+            exposure = float(book[slot]) if held else 0.0
+            position = float(quantities[slot]) if held else 0.0
+
+            # Candidate price, then the given price, then the portfolio's.
+            if prices is not None and not candidate_price > 0.0:
+                candidate_price = prices.get(symbol, math.nan) if by_symbol else float(prices[index])
+
+            if not candidate_price > 0.0 and held:
+                candidate_price = abs(exposure / position) if position else math.nan
+
+            priced = math.isfinite(candidate_price) and candidate_price > 0.0
+            if not priced:
+                candidate_price = 1.0
+
+            unsized = entry and wanted <= 0.0
+            valid = entry and priced
+
+            if sigmas is not None:
+                sigma = sigmas[index]
+                known = math.isfinite(sigma) and sigma > 0.0
+                valid = valid and (known or not unsized)
+                target = self.risk_per_trade * equity / sigma if known else 0.0
+            else:
+                target = fixed_target
+
+            requested = (target if unsized else wanted * candidate_price) if valid else 0.0
+
+            # The room under the symbol limit the earlier candidates of this symbol and side left.
+            key = (symbol, is_long)
+            room = max(symbol_limit - direction * exposure, 0.0)
+            taken = used.get(key, 0.0)
+            approved = requested if taken + requested <= room else max(room - taken, 0.0)
+            used[key] = taken + requested
+
+            before = total
+            total += approved
+            capped = approved if total <= gross_room else max(gross_room - before, 0.0)
+
+            open_quantity = max(direction * position, 0.0)
+
+            if entry:
+                size = wanted if not unsized and capped == requested else capped / candidate_price
+            else:
+                size = min(wanted if wanted > 0.0 else open_quantity, open_quantity)
+
+            if self.lot_size:
+                size = math.floor(size / self.lot_size + 1e-9) * self.lot_size
+
+            if size > 0.0 and not (entry and size * candidate_price < self.min_notional):
+                final[index] = size
+            elif not entry:
+                reasons[index] = NO_POSITION if open_quantity <= 0.0 else BELOW_MINIMUM
+            elif not priced:
+                reasons[index] = NO_PRICE
+            elif not valid:
+                reasons[index] = NO_VOLATILITY
+            elif approved < requested:
+                reasons[index] = SYMBOL_LIMIT
+            elif capped < approved:
+                reasons[index] = GROSS_LIMIT
+            else:
+                reasons[index] = BELOW_MINIMUM
+
+        return final, reasons
+
+    @staticmethod
+    def _hand_out(key: np.ndarray, requested: np.ndarray, room: np.ndarray) -> np.ndarray:
+        """
+        Caps the running sum of `requested` per `key` at the `room` of that key, the
+        earlier requests get theirs first.
+        """
+
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        sorted_requested = requested[order]
+
+        first = np.empty(len(key), dtype=bool)
+        first[0] = True
+        np.not_equal(sorted_key[1:], sorted_key[:-1], out=first[1:])
+
+        total = np.cumsum(sorted_requested)
+        before = np.maximum.accumulate(np.where(first, total - sorted_requested, 0.0))
+        allowed = np.minimum(total - before, room[order])
+
+        previous = np.empty(len(key))
+        previous[0] = 0.0
+        previous[1:] = allowed[:-1]
+        previous[first] = 0.0
+
+        approved = np.empty(len(key))
+        approved[order] = np.where(total - before <= room[order], sorted_requested, allowed - previous)
+
+        return approved
@@ -0,0 +1,447 @@
+import os
+import time
+import multiprocessing
+
+import numpy as np
+
+from multiprocessing import shared_memory
+
+from typing import Any
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+from typing import Optional
+
+from essentials.indicators import Indicators
+from essentials.stock_frame import StockFrame
+
+
+# A quote sent to a shard, one float64 per field. Millisecond timestamps fit a float64 exactly.
+QUOTE_FIELDS = ['symbol', 'datetime', 'open', 'close', 'high', 'low', 'volume']
+
+# A signal sent back to the coordinator.
+SIGNAL_FIELDS = ['symbol', 'datetime', 'buy', 'sell', 'close']
+
+# A quote with this symbol number tells the worker to stop.
+STOP = -1.0
+
+# The ring header is one cache line, [written, read, processed] record counts.
+HEADER_BYTES = 64
+WRITTEN, READ, PROCESSED = range(3)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+
+    try:
+        return shared_memory.SharedMemory(name=name, create=False, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach is tracked. The workers share the resource tracker
+        # of the coordinator, which already tracks the segment, so this adds nothing.
+        return shared_memory.SharedMemory(name=name, create=False)
+
+
+class SharedRing:
+
+    def __init__(self, width: int, capacity: int = 65536, name: str = None, lock: 'multiprocessing.synchronize.Lock' = None) -> None:
+        """
+        A single producer, single consumer queue of fixed-width float64 records in shared
+        memory. Records are copied in and out as NumPy blocks, nothing is pickled.
+
+        The producer only writes the `written` count and the consumer only the `read` and
+        `processed` counts. The counts are read and written under a process shared lock,
+        once per push or pop. Its acquire and release are the memory barriers that make the
+        records copied before a count changed visible to the other side, which plain NumPy
+        stores only guarantee on x86, not on ARM.
+
+        :param width: The number of float64 fields of a record.
+        :param capacity: The most records queued at once.
+        :param name: Attach to the ring of this name instead of creating a new one.
+        :param lock: The lock of the ring, a new `multiprocessing.Lock` for a new ring. It
+        has to be handed to the process attaching to the ring, e.g. as a `Process` argument.
+        """
+
+        if name is not None and lock is None:
+            raise ValueError("Attaching to ring {name} needs the lock of the ring.".format(name=name))
+
+        self.width = width
+        self.capacity = capacity
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        self._owner = name is None
+
+        size = HEADER_BYTES + capacity * width * 8
+
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._memory = _attach(name=name)
+
+        self._header = np.ndarray(3, dtype=np.int64, buffer=self._memory.buf)
+        self._records = np.ndarray((capacity, width), dtype=np.float64, buffer=self._memory.buf, offset=HEADER_BYTES)
+
+        if self._owner:
+            self._header[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def __len__(self) -> int:
+
+        with self.lock:
+            return int(self._header[WRITTEN] - self._header[READ])
+
+    @property
+    def written(self) -> int:
+
+        with self.lock:
+            return int(self._header[WRITTEN])
+
+    @property
+    def processed(self) -> int:
+
+        with self.lock:
+            return int(self._header[PROCESSED])
+
+    def push(self, records: np.ndarray) -> int:
+        """
+        Queues as many of `records` as fit.
+
+        :return: The number of records queued.
+        """
+
+        with self.lock:
+            written = int(self._header[WRITTEN])
+            read = int(self._header[READ])
+
+        count = min(len(records), self.capacity - (written - read))
+
+        if count <= 0:
+            return 0
+
+        start = written % self.capacity
+        first = min(count, self.capacity - start)
+
+        self._records[start:start + first] = records[:first]
+        if first < count:
+            self._records[:count - first] = records[first:count]
+
+        with self.lock:
+            self._header[WRITTEN] = written + count
+
+        return count
+
+    def push_all(self, records: np.ndarray, timeout: float = None) -> None:
+        """Queues every record, waiting for the consumer while the ring is full."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while len(records):
+            pushed = self.push(records=records)
+            records = records[pushed:]
+
+            if len(records):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise RuntimeError("The consumer of ring {name} fell behind.".format(name=self.name))
+                time.sleep(0.0001)
+
+    def pop(self, limit: int = None) -> np.ndarray:
+        """Takes up to `limit` queued records, oldest first, as a copy."""
+
+        with self.lock:
+            read = int(self._header[READ])
+            count = int(self._header[WRITTEN]) - read
+
+        if limit is not None:
+            count = min(count, limit)
+
+        if count <= 0:
+            return self._records[:0].copy()
+
+        start = read % self.capacity
+        first = min(count, self.capacity - start)
+
+        if first == count:
+            records = self._records[start:start + count].copy()
+        else:
+            records = np.concatenate((self._records[start:], self._records[:count - first]))
+
+        with self.lock:
+            self._header[READ] = read + count
+
+        return records
+
+    def done(self, count: int) -> None:
+        """Marks `count` popped records as processed, see `processed`."""
+
+        with self.lock:
+            self._header[PROCESSED] += count
+
+    def close(self) -> None:
+
+        # Views on the buffer have to go before it can be closed.
+        self._header = None
+        self._records = None
+        self._memory.close()
+
+        if self._owner:
+            self._memory.unlink()
+
+
+def _quote_batches(records: np.ndarray, symbols: List[str]) -> List[dict]:
+    """Turns quote records into `add_rows` dicts, a new dict whenever a symbol repeats."""
+
+    batches = [{}]
+
+    for symbol_number, timestamp, open_price, close, high, low, volume in records.tolist():
+        symbol = symbols[int(symbol_number)]
+        batch = batches[-1]
+
+        if symbol in batch:
+            batch = {}
+            batches.append(batch)
+
+        batch[symbol] = {
+            'quoteTimeInLong': int(timestamp),
+            'openPrice': open_price,
+            'closePrice': close,
+            'highPrice': high,
+            'lowPrice': low,
+            'volume': volume
+        }
+
+    return batches
+
+
+def _run_shard(symbols: List[str], strategy: Callable, quotes_ring: Tuple[str, Any], signals_ring: Tuple[str, Any],
+               capacity: int, bars: int, signal_mode: str, batch_size: int) -> None:
+    """The loop of a worker process: quotes in, StockFrame and Indicators, signal records out."""
+
+    quotes = SharedRing(width=len(QUOTE_FIELDS), capacity=capacity, name=quotes_ring[0], lock=quotes_ring[1])
+    signals = SharedRing(width=len(SIGNAL_FIELDS), capacity=capacity, name=signals_ring[0], lock=signals_ring[1])
+
+    stock_frame = StockFrame(data=[], backend='ring', capacity=bars)
+    indicators = Indicators(price_data_frame=stock_frame, streaming=True)
+    strategy(indicators)
+
+    # Quotes and signals carry the position of the symbol in this shard's slice.
+    positions = {symbol: position for position, symbol in enumerate(symbols)}
+    idle = 0
+
+    try:
+        while True:
+
+            records = quotes.pop(limit=batch_size)
+
+            if not len(records):
+                # Spin briefly before backing off, quotes tend to come in bursts.
+                idle += 1
+                time.sleep(0 if idle < 100 else 0.0005)
+                continue
+
+            idle = 0
+            stop = records[:, 0] == STOP
+            if stop.any():
+                records = records[:np.argmax(stop)]
+
+            updated = set()
+            for batch in _quote_batches(records=records, symbols=symbols) if len(records) else []:
+                stock_frame.add_rows(data=batch)
+                updated.update(batch)
+
+            if updated:
+                indicators.refresh()
+                checked = indicators.check_signals(mode=signal_mode)
+
+                if checked is not None:
+                    active = checked[(checked['buy'] | checked['sell']) & checked.index.isin(updated)]
+                    if len(active):
+                        latest = stock_frame.latest_rows(column_names=['close'])
+                        closes = dict(zip(latest[0], latest[1][:, 0]))
+                        signals.push_all(np.array([
+                            [positions[symbol], stock_frame.buffers[symbol].last_timestamp, buy, sell, closes[symbol]]
+                            for symbol, buy, sell in zip(active.index, active['buy'], active['sell'])
+                        ], dtype=np.float64))
+
+            quotes.done(len(records) + int(stop.any()))
+
+            if stop.any():
+                return
+    finally:
+        quotes.close()
+        signals.close()
+
+
+class ShardedRuntime:
+
+    def __init__(self, symbols: List[str], strategy: Callable, shards: int = None, capacity: int = 65536, bars: int = 5000,
+                 signal_mode: str = 'and', batch_size: int = 4096, start_method: str = 'spawn') -> None:
+        """
+        Splits the symbols over worker processes, each with its own StockFrame and streaming
+        Indicators for its slice, so the indicator math of a large universe runs on every
+        core. Quotes go to the workers and signals come back as float64 records through
+        `SharedRing`s, the coordinator keeps the Portfolio and the order gateway.
+
+        :param symbols: The symbol universe.
+        :param strategy: Called with the Indicators of every shard to set up indicators and
+        signals, e.g. `lambda indicators: indicators.rsi(14)`. It has to be picklable, so a
+        module level function, with the 'spawn' start method.
+        :param shards: The number of worker processes, one per core by default.
+        :param capacity: Records per ring.
+        :param bars: Bars kept per symbol by the workers.
+        :param signal_mode: 'and' or 'or', see `Indicators.check_signals`.
+        :param batch_size: The most quotes a worker takes in one go.
+        :param start_method: The multiprocessing start method, 'spawn' is safe with the
+        gateway's threads around, 'fork' starts faster.
+        """
+
+        self.symbols = list(symbols)
+        self.shards = shards or os.cpu_count() or 1
+        self.capacity = capacity
+
+        # Symbol number -> shard, round robin so every shard gets a share of the busy symbols.
+        self._shard_of = np.arange(len(self.symbols)) % self.shards
+        self._local_of = np.arange(len(self.symbols)) // self.shards
+        self._members = [np.arange(shard, len(self.symbols), self.shards) for shard in range(self.shards)]
+        self._numbers = {symbol: number for number, symbol in enumerate(self.symbols)}
+
+        self._quotes: List[SharedRing] = []
+        self._signals: List[SharedRing] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._sent = [0] * self.shards
+
+        # Signal records taken off the rings while waiting, until `signal_records` hands them out.
+        self._collected: List[np.ndarray] = []
+
+        context = multiprocessing.get_context(start_method)
+
+        for shard in range(self.shards):
+
+            quotes = SharedRing(width=len(QUOTE_FIELDS), capacity=capacity, lock=context.Lock())
+            signals = SharedRing(width=len(SIGNAL_FIELDS), capacity=capacity, lock=context.Lock())
+
+            process = context.Process(
+                target=_run_shard,
+                args=(self.symbols[shard::self.shards], strategy, (quotes.name, quotes.lock), (signals.name, signals.lock),
+                      capacity, bars, signal_mode, batch_size),
+                name='shard-{shard}'.format(shard=shard),
+                daemon=True
+            )
+            process.start()
+
+            self._quotes.append(quotes)
+            self._signals.append(signals)
+            self._processes.append(process)
+
+    def __enter__(self) -> 'ShardedRuntime':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def shard(self, symbol: str) -> int:
+        return int(self._shard_of[self._numbers[symbol]])
+
+    def publish_records(self, symbols: np.ndarray, values: np.ndarray) -> None:
+        """
+        Sends quotes to the shards in bulk.
+
+        :param symbols: The symbol number of every quote, its position in `symbols`.
+        :param values: A (quotes x 6) array of datetime (ms), open, close, high, low and volume.
+        """
+
+        symbols = np.asarray(symbols, dtype=np.int64)
+        shards = self._shard_of[symbols]
+
+        records = np.empty((len(symbols), len(QUOTE_FIELDS)), dtype=np.float64)
+        records[:, 0] = self._local_of[symbols]
+        records[:, 1:] = values
+
+        for shard in range(self.shards):
+            rows = records[shards == shard]
+            self._sent[shard] += len(rows)
+
+            # A shard blocked on a full signal ring stops taking quotes, so keep emptying
+            # the signal rings while the quote ring is full.
+            while len(rows):
+                rows = rows[self._quotes[shard].push(records=rows):]
+                if len(rows):
+                    self._collect()
+                    time.sleep(0.0001)
+
+    def publish(self, quotes: Dict[str, dict]) -> None:
+        """Sends a dict of quotes, the layout `StockFrame.add_rows` takes, to the shards."""
+
+        symbols = np.fromiter((self._numbers[symbol] for symbol in quotes), dtype=np.int64, count=len(quotes))
+        values = np.array([
+            [quote['quoteTimeInLong'], quote['openPrice'], quote['closePrice'], quote['highPrice'], quote['lowPrice'], quote['volume']]
+            for quote in quotes.values()
+        ], dtype=np.float64)
+
+        self.publish_records(symbols=symbols, values=values)
+
+    def _collect(self) -> None:
+        """Takes the queued signal records off the rings, so the shards never block on a full one."""
+
+        if not all(process.is_alive() for process in self._processes):
+            raise RuntimeError("A shard process died.")
+
+        for members, ring in zip(self._members, self._signals):
+            shard_records = ring.pop()
+            if len(shard_records):
+                shard_records[:, 0] = members[shard_records[:, 0].astype(np.int64)]
+                self._collected.append(shard_records)
+
+    def signal_records(self) -> np.ndarray:
+        """Every signal record the shards sent since the last call, see `SIGNAL_FIELDS`."""
+
+        self._collect()
+        records, self._collected = self._collected, []
+
+        return np.concatenate(records) if records else np.zeros((0, len(SIGNAL_FIELDS)))
+
+    def signals(self) -> List[dict]:
+        """The signals the shards sent since the last call, as dicts keyed by symbol name."""
+
+        return [
+            {'symbol': self.symbols[int(number)], 'datetime': int(timestamp), 'buy': bool(buy), 'sell': bool(sell), 'close': close}
+            for number, timestamp, buy, sell, close in self.signal_records().tolist()
+        ]
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until the shards processed every quote sent so far. The signals sent in
+        the meantime are kept for `signal_records`.
+
+        :return: False if the timeout passed first.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while any(ring.processed < sent for ring, sent in zip(self._quotes, self._sent)):
+
+            self._collect()
+
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+
+            time.sleep(0.0001)
+
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+
+        for ring, process in zip(self._quotes, self._processes):
+            if process.is_alive():
+                ring.push_all(np.full((1, len(QUOTE_FIELDS)), STOP), timeout=timeout)
+
+        for process in self._processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+
+        for ring in self._quotes + self._signals:
+            ring.close()
+
+        self._quotes, self._signals, self._processes = [], [], []
+        self._collected = []
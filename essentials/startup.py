@@ -0,0 +1,106 @@
+import sys
+import builtins
+import threading
+import importlib.util
+
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Iterator
+
+
+class StartupProfile:
+
+    def __init__(self) -> None:
+        """
+        Times the start of the bot: every module imported while the profile is started,
+        with its own and its cumulative time like `python -X importtime`, and the named
+        phases of the start-up such as building the Robot or loading the bar cache.
+
+        Submodules loaded through `from package import submodule` count towards the
+        module doing the import.
+        """
+
+        self.imports: Dict[str, Tuple[int, int]] = {}
+        self.phases: List[Tuple[str, int]] = []
+        self._original_import = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started = perf_counter_ns()
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+
+        if level:
+            resolved = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+        else:
+            resolved = name
+
+        if resolved in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0)
+        start = perf_counter_ns()
+
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = perf_counter_ns() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+
+            with self._lock:
+                self.imports[resolved] = (cumulative - children, cumulative)
+
+    def start(self) -> None:
+
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def stop(self) -> None:
+
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.phases.append((name, perf_counter_ns() - start))
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the profile was created."""
+
+        return (perf_counter_ns() - self._started) / 1e9
+
+    def report(self, limit: int = 25) -> str:
+        """
+        :param limit: How many of the slowest imports to list.
+        :return: The phases in order and the slowest imports by cumulative time, in ms.
+        """
+
+        lines = ['  {phase:40s} {ms:>10s}'.format(phase='phase', ms='ms')]
+        for name, nanoseconds in self.phases:
+            lines.append('  {phase:40s} {ms:10.1f}'.format(phase=name, ms=nanoseconds / 1e6))
+
+        lines.append('  {phase:40s} {ms:10.1f}'.format(phase='total', ms=self.elapsed * 1e3))
+
+        if self.imports:
+            slowest = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+
+            lines.append('')
+            lines.append('  {module:40s} {own:>10s} {cumulative:>10s}'.format(module='import', own='self ms', cumulative='total ms'))
+            for module, (own, cumulative) in slowest:
+                lines.append('  {module:40s} {own:10.1f} {cumulative:10.1f}'.format(module=module, own=own / 1e6, cumulative=cumulative / 1e6))
+
+        return '\n'.join(lines)
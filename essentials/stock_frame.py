@@ -8,53 +8,658 @@ from datetime import timezone
 from typing import List
 from typing import Dict
 from typing import Union
+from typing import Tuple
 
 from pandas.core.groupby import DataFrameGroupBy
 from pandas.core.window import RollingGroupby
 
+from essentials.ring_buffer import RingBuffer
+from essentials.ring_buffer import LatestTable
+from essentials.backfill import parse_klines
+from essentials.timeframes import TimeframeRollup
+
+
+PRICE_COLUMNS = ['open', 'close', 'high', 'low']
+
+# Bars a compact frame collects of a symbol streamed in without history before it checks them for float32.
+COMPACT_CHECK_BARS = 100
+
+
+def fits_float32(values: np.ndarray) -> bool:
+    """
+    Whether prices survive a round trip through float32: the rounding error has to stay
+    below half the smallest step between two prices, so every price still maps back to
+    its own tick.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+
+    if len(values) == 0:
+        return True
+
+    if np.abs(values).max() > np.finfo(np.float32).max:
+        return False
+
+    error = np.abs(values.astype(np.float32).astype(np.float64) - values).max()
+    if error == 0.0:
+        return True
+
+    steps = np.diff(np.unique(values))
+
+    return len(steps) == 0 or error < steps.min() / 2.0
+
 
 class StockFrame:
 
-    def __init__(self, data: List[dict]) -> None:
+    COLUMNS = ['open', 'close', 'high', 'low', 'volume']
+    SIGNAL_COLUMNS = pd.Index(['buy', 'sell'])
+
+    def __init__(self, data: List[dict], backend: str = 'pandas', capacity: int = 100000, compact: bool = False) -> None:
+        """
+        :param data: A list of bars, each a dict with symbol, datetime (ms) and OHLCV.
+        :param backend: 'pandas' keeps one MultiIndex frame, 'ring' keeps a fixed-capacity
+        RingBuffer per symbol and only builds the frame when it is asked for.
+        :param capacity: Number of bars kept per symbol by the 'ring' backend.
+        :param compact: The memory budget mode. Symbols are a categorical index level, and
+        prices and volumes are kept in float32 wherever the prices fit, see `fits_float32`.
+        A symbol streamed in without history is kept in float64 until `COMPACT_CHECK_BARS`
+        bars came in to check.
+        """
+
+        if backend not in ('pandas', 'ring'):
+            raise ValueError("Backend must be either 'pandas' or 'ring'.")
 
         self._data = data
-        self._frame = pd.DataFrame = self.create_frame()
+        self._backend = backend
+        self._capacity = capacity
+        self._compact = compact
+
+        # Bars kept per symbol past which the oldest are evicted, see `set_horizon`.
+        self._horizon: int = None
+        self._horizons: Dict[str, int] = {}
+        self._buffers: Dict[str, RingBuffer] = {}
+        # Buffers of a compact frame still waiting for the bars to check for float32.
+        self._unchecked: Dict[str, RingBuffer] = {}
+        self._latest = LatestTable()
+        self._latest_symbols: List[str] = []
+        self._latest_index: pd.Index = None
+        self._frame_dirty = False
+
+        # Longer intervals rolled up from these bars as they are added, keyed by interval.
+        self._timeframes: Dict[str, 'StockFrame'] = {}
+        self._rollups: Dict[str, TimeframeRollup] = {}
+
+        if backend == 'ring':
+            self._frame = None
+            self._fill_buffers()
+        else:
+            self._frame: pd.DataFrame = self.create_frame()
+
+        # Grouping caches, rebuilt only when the layout version moves on.
+        self._layout_version = 0
+        self._groups_version = -1
         self._symbol_groups: DataFrameGroupBy = None
-        self._symbol_rolling_groups: RollingGroupby = None
-        
+        self._group_starts: np.ndarray = None
+        self._symbol_slices: Dict[str, slice] = {}
+        self._symbol_index: pd.Index = None
+        self._rolling_groups: Dict[int, RollingGroupby] = {}
+
+    @property
+    def backend(self) -> str:
+        return self._backend
+
+    @property
+    def buffers(self) -> Dict[str, RingBuffer]:
+        return self._buffers
+
+    @property
+    def compact(self) -> bool:
+        return self._compact
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def horizon(self) -> int:
+        """The bars kept per symbol by the 'pandas' backend, None keeps every bar."""
+
+        return self._horizon
+
+    @property
+    def horizons(self) -> Dict[str, int]:
+        """The symbols with a horizon of their own, see `set_horizon`."""
+
+        return dict(self._horizons)
+
     @property
     def frame(self) -> pd.DataFrame:
+
+        # The ring backend only pays for a frame when somebody reads it.
+        if self._backend == 'ring' and (self._frame is None or self._frame_dirty):
+            self._frame = self._build_frame()
+            self._frame_dirty = False
+            self._layout_version += 1
+
         return self._frame
-    
+
+    @property
+    def timeframes(self) -> Dict[str, 'StockFrame']:
+        return self._timeframes
+
+    def add_timeframe(self, interval: str, capacity: int = None) -> 'StockFrame':
+        """
+        Keeps a StockFrame of `interval` bars rolled up from the bars of this one. The bars
+        already held are rolled up once, after that every `add_rows` only updates the open
+        bar of each symbol, so there is no resample and no extra download.
+
+        :param interval: A kline interval longer than the one of this frame, e.g. 1h.
+        :param capacity: Bars per symbol kept by a 'ring' backend, the capacity of this frame by default.
+        :return: The StockFrame of the timeframe, with the same backend as this one.
+        """
+
+        if interval in self._timeframes:
+            return self._timeframes[interval]
+
+        rollup = TimeframeRollup(interval=interval)
+        stock_frame = type(self)(data=[], backend=self._backend, capacity=capacity or self._capacity, compact=self._compact)
+
+        rolled = {}
+        for symbol, (timestamps, columns) in self.symbol_columns().items():
+            buckets, rolled_columns = rollup.extend(symbol=symbol, timestamps=timestamps, columns=columns)
+            rolled[symbol] = dict(rolled_columns, datetime=buckets)
+
+        stock_frame.load_columns(columns=rolled)
+
+        self._rollups[interval] = rollup
+        self._timeframes[interval] = stock_frame
+
+        return stock_frame
+
+    def timeframe(self, interval: str) -> 'StockFrame':
+        """The StockFrame of `interval` bars, added on first use, see `add_timeframe`."""
+
+        if interval not in self._timeframes:
+            return self.add_timeframe(interval=interval)
+
+        return self._timeframes[interval]
+
+    def symbol_columns(self) -> Dict[str, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """The timestamps (ms) and OHLCV arrays of every symbol, oldest first."""
+
+        if self._backend == 'ring':
+            return {symbol: buffer.tail() for symbol, buffer in self._buffers.items()}
+
+        frame = self._refresh_groups()
+        timestamps = frame.index.get_level_values('datetime').values.astype('datetime64[ms]').astype(np.int64)
+
+        return {
+            symbol: (
+                timestamps[rows],
+                {name: frame[name].to_numpy(dtype=np.float64)[rows] for name in self.COLUMNS}
+            )
+            for symbol, rows in self._symbol_slices.items()
+        }
+
+    def _roll_rows(self, data: dict) -> None:
+
+        for interval, rollup in self._rollups.items():
+            quotes = {}
+            for symbol, quote in data.items():
+                rolled = rollup.update(
+                    symbol=symbol,
+                    timestamp=int(quote['quoteTimeInLong']),
+                    values=self._quote_values(quote=quote)
+                )
+                if rolled is not None:
+                    quotes[symbol] = rolled
+
+            if quotes:
+                self._timeframes[interval].add_rows(data=quotes)
+
+    def _roll_columns(self, columns: Dict[str, Dict[str, np.ndarray]]) -> None:
+
+        for interval, rollup in self._rollups.items():
+            rolled = {}
+            for symbol, symbol_columns in columns.items():
+                buckets, rolled_columns = rollup.extend(symbol=symbol, timestamps=symbol_columns['datetime'], columns=symbol_columns)
+                if len(buckets):
+                    rolled[symbol] = dict(rolled_columns, datetime=buckets)
+
+            if rolled:
+                self._timeframes[interval].load_columns(columns=rolled)
+
+    def mark_dirty(self) -> None:
+        """Tells the 'ring' backend its buffers were written to outside of `add_rows`."""
+
+        self._frame_dirty = True
+
+    def _refresh_groups(self) -> pd.DataFrame:
+
+        frame = self.frame
+
+        if self._groups_version == self._layout_version:
+            return frame
+
+        codes = np.asarray(frame.index.codes[0])
+
+        if len(codes):
+            starts = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1)).astype(np.int64)
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+
+        ends = np.append(starts[1:], len(codes))
+        symbols = frame.index.levels[0][codes[starts]]
+
+        self._group_starts = starts
+        self._symbol_slices = {
+            symbol: slice(int(start), int(end)) for symbol, start, end in zip(symbols, starts, ends)
+        }
+
+        self._symbol_index = pd.Index(symbols, name='symbol')
+
+        # The groupby objects point at the old frame, build them again on first use.
+        self._symbol_groups = None
+        self._rolling_groups = dict.fromkeys(self._rolling_groups)
+        self._groups_version = self._layout_version
+
+        return frame
+
+    @property
+    def group_starts(self) -> np.ndarray:
+        """The position of the first row of every symbol in `frame`."""
+
+        self._refresh_groups()
+
+        return self._group_starts
+
+    @property
+    def symbol_slices(self) -> Dict[str, slice]:
+        """The positional slice of every symbol in `frame`, use with `frame.iloc`."""
+
+        self._refresh_groups()
+
+        return self._symbol_slices
+
     @property
     def symbol_groups(self) -> DataFrameGroupBy:
 
-        self._symbol_groups = self._frame.groupby(
-            by='symbol',
-            as_index=False,
-            sort=True
-        )
+        frame = self._refresh_groups()
+
+        if self._symbol_groups is None:
+            self._symbol_groups = frame.groupby(
+                by='symbol',
+                as_index=False,
+                sort=True
+            )
 
         return self._symbol_groups
 
-    def _symbol_rolling_groups(self, size: int) -> RollingGroupby:
+    def symbol_rolling_groups(self, size: int) -> RollingGroupby:
+        """
+        A rolling view per symbol, memoized per window size until the layout changes or
+        `release_rolling_groups` is called for the size.
+        """
+
+        symbol_groups = self.symbol_groups
+
+        if self._rolling_groups.get(size) is None:
+            self._rolling_groups[size] = symbol_groups.rolling(size)
+
+        return self._rolling_groups[size]
+
+    def release_rolling_groups(self, size: int) -> None:
+
+        self._rolling_groups.pop(size, None)
+
+    def set_horizon(self, bars: int, symbols: List[str] = None) -> None:
+        """
+        Evicts everything but the newest `bars` bars of every symbol, or only of `symbols`.
+        The horizon of the 'ring' backend is the capacity of its buffers, they are resized.
+
+        :param bars: The bars kept per symbol.
+        :param symbols: Set the horizon of these symbols only, it then wins over the one for every symbol.
+        """
+
+        if bars <= 0:
+            raise ValueError("The horizon must be a positive number of bars.")
+
+        if symbols is None:
+            if self._backend == 'ring':
+                self._capacity = bars
+            else:
+                self._horizon = bars
+            symbols = [symbol for symbol in self._buffers if symbol not in self._horizons]
+        else:
+            self._horizons.update(dict.fromkeys(symbols, bars))
+
+        if self._backend == 'ring':
+            for symbol in symbols:
+                if symbol in self._buffers:
+                    self._buffers[symbol].resize(capacity=bars)
+            self._frame_dirty = True
+        else:
+            self._evict()
+
+    def _evict(self) -> None:
+
+        if self._horizon is None and not self._horizons:
+            return
+
+        frame = self._refresh_groups()
+        keep = None
+
+        for symbol, rows in self._symbol_slices.items():
+            horizon = self._horizons.get(symbol, self._horizon)
+            if horizon is not None and rows.stop - rows.start > horizon:
+                if keep is None:
+                    keep = np.ones(len(frame), dtype=bool)
+                keep[rows.start:rows.stop - horizon] = False
+
+        if keep is not None:
+            self._frame = frame[keep]
+            self._layout_version += 1
+
+    def memory_usage(self) -> Dict[str, float]:
+        """
+        What the bars take up in bytes. `bytes_per_bar` is the memory per symbol per bar
+        held, the frame of the 'ring' backend counts as well once it was built.
+        """
+
+        if self._backend == 'ring':
+            symbols = len(self._buffers)
+            bars = sum(len(buffer) for buffer in self._buffers.values())
+        else:
+            symbols = len(self.symbol_slices)
+            bars = len(self._frame)
+
+        buffer_bytes = sum(buffer.nbytes for buffer in self._buffers.values()) + self._latest.nbytes
+        frame_bytes = int(self._frame.memory_usage(index=True, deep=True).sum()) if self._frame is not None else 0
+
+        return {
+            'symbols': symbols,
+            'bars': bars,
+            'buffer_bytes': buffer_bytes,
+            'frame_bytes': frame_bytes,
+            'bytes': buffer_bytes + frame_bytes,
+            'bytes_per_bar': (buffer_bytes + frame_bytes) / bars if bars else 0.0
+        }
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Dict[str, np.ndarray]], backend: str = 'pandas', capacity: int = 100000,
+                     compact: bool = False) -> 'StockFrame':
+        """
+        Builds a StockFrame straight from typed columns, skipping the list of dicts.
+
+        :param columns: Per symbol a dict with a datetime array (int64 ms) and OHLCV arrays,
+        as returned by `KlineBackfill.fetch`.
+        """
+
+        stock_frame = cls(data=[], backend=backend, capacity=capacity, compact=compact)
+        stock_frame.load_columns(columns=columns)
+
+        return stock_frame
+
+    @classmethod
+    def from_klines(cls, klines: Dict[str, List[list]], backend: str = 'pandas', capacity: int = 100000,
+                    compact: bool = False) -> 'StockFrame':
+        """
+        Builds a StockFrame from raw Binance klines, the lists of
+        [open time, open, high, low, close, volume, ...] returned by the klines endpoint.
+
+        :param klines: The raw klines per symbol.
+        """
+
+        return cls.from_columns(
+            columns={symbol: parse_klines(rows) for symbol, rows in klines.items()},
+            backend=backend,
+            capacity=capacity,
+            compact=compact
+        )
+
+    def load_columns(self, columns: Dict[str, Dict[str, np.ndarray]]) -> None:
+        """Adds the bars of `columns` (see `from_columns`) to the frame in bulk."""
+
+        if self._rollups:
+            self._roll_columns(columns=columns)
+
+        if self._backend == 'ring':
+            for symbol, symbol_columns in columns.items():
+                buffer = self._buffer(symbol=symbol, history=symbol_columns)
+                if buffer.dtype == np.float32 and not self._fits_float32(columns=symbol_columns):
+                    buffer.astype(np.float64)
+                buffer.extend(timestamps=symbol_columns['datetime'], columns=symbol_columns)
+            self._frame_dirty = True
+            return
+
+        symbols = sorted(symbol for symbol in columns if len(columns[symbol]['datetime']))
+        if not symbols:
+            return
+
+        timestamps = []
+        data = {name: [] for name in self.COLUMNS}
+
+        for symbol in symbols:
+
+            symbol_timestamps = np.asarray(columns[symbol]['datetime'], dtype=np.int64)
+            order = None
+
+            # Pages normally arrive in order, only pay for a sort when they did not.
+            if len(symbol_timestamps) > 1 and not np.all(symbol_timestamps[1:] > symbol_timestamps[:-1]):
+                symbol_timestamps, order = np.unique(symbol_timestamps, return_index=True)
+
+            timestamps.append(symbol_timestamps)
+            for name in self.COLUMNS:
+                values = np.asarray(columns[symbol][name], dtype=np.float64)
+                data[name].append(values if order is None else values[order])
+
+        data = {name: np.concatenate(parts) for name, parts in data.items()}
+
+        if self._compact:
+            data = {name: values.astype(np.float32) if self._fits_float32(columns={name: values}) else values for name, values in data.items()}
+
+        new_frame = pd.DataFrame(data=data, index=self._make_index(symbols=symbols, timestamps=timestamps))
+
+        if len(self._frame):
+            new_frame = pd.concat([self._frame, new_frame])
+            new_frame = new_frame[~new_frame.index.duplicated(keep='last')].sort_index()
+            if self._compact:
+                new_frame.index = self._categorical_symbols(index=new_frame.index)
+
+        self._frame = new_frame
+        self._layout_version += 1
+        self._evict()
+
+    def _fits_float32(self, columns: Dict[str, np.ndarray]) -> bool:
+
+        # Volumes are not on a tick grid that float32 could blur, only prices are checked.
+        return all(fits_float32(columns[name]) for name in PRICE_COLUMNS if name in columns)
+
+    def _make_index(self, symbols: List[str], timestamps: List[np.ndarray]) -> pd.MultiIndex:
+        """
+        The (symbol, datetime) index of bars sorted by symbol and time, put together from its
+        levels and codes directly instead of being factorized and sorted again.
+
+        :param symbols: The symbols in order, each with at least one bar.
+        :param timestamps: The bar times (ms) of every symbol.
+        """
+
+        sizes = [len(symbol_timestamps) for symbol_timestamps in timestamps]
+        unique_timestamps, time_codes = np.unique(np.concatenate(timestamps), return_inverse=True)
+
+        # The MultiIndex keeps the symbols as codes already, a categorical level keeps them
+        # that way when the level values are pulled out of the index.
+        if self._compact:
+            symbol_level = pd.CategoricalIndex(symbols, categories=symbols, name='symbol')
+        else:
+            symbol_level = pd.Index(symbols, name='symbol')
+
+        return pd.MultiIndex(
+            levels=[
+                symbol_level,
+                pd.to_datetime(unique_timestamps, unit='ms', origin='unix')
+            ],
+            codes=[
+                np.repeat(np.arange(len(symbols)), sizes),
+                time_codes
+            ],
+            names=['symbol', 'datetime'],
+            verify_integrity=False
+        )
+
+    @staticmethod
+    def _categorical_symbols(index: pd.MultiIndex) -> pd.MultiIndex:
+        """Makes the symbol level of a sorted index categorical again, e.g. after a symbol was added."""
 
-        if not self._symbol_groups:
-            self._symbol_groups
+        symbols = index.levels[0]
+        if isinstance(symbols, pd.CategoricalIndex) and symbols.categories.equals(pd.Index(np.asarray(symbols))):
+            return index
 
-        self._symbol_rolling_groups = self._symbol_groups.rolling(size)
+        symbols = pd.Index(np.asarray(symbols, dtype=object), name='symbol')
 
-        return self._symbol_rolling_groups
+        return index.set_levels(pd.CategoricalIndex(symbols, categories=symbols, name='symbol'), level=0, verify_integrity=False)
+
+    def _empty_frame(self, columns: List[str] = None) -> pd.DataFrame:
+
+        return pd.DataFrame(
+            columns=columns or self.COLUMNS,
+            index=pd.MultiIndex.from_arrays([[], []], names=['symbol', 'datetime']),
+            dtype=np.float64
+        )
 
     def create_frame(self) -> pd.DataFrame:
 
+        if not self._data:
+            return self._empty_frame()
+
         # Make a data frame
         price_df = pd.DataFrame(data=self._data)
         price_df = self._parse_datetime_column(price_df=price_df)
-        price_df = self._set_multi_index(price=price_df)
+        price_df = self._set_multi_index(price_df=price_df)
+
+        # Indicators rely on every symbol being one contiguous, time ordered block.
+        price_df = price_df.sort_index()
+
+        if self._compact:
+            price_df.index = self._categorical_symbols(index=price_df.index)
+            for name in self.COLUMNS:
+                if self._fits_float32(columns={name: price_df[name].to_numpy()}):
+                    price_df[name] = price_df[name].astype(np.float32)
 
         return price_df
 
+    def _fill_buffers(self) -> None:
+
+        rows = sorted(self._data, key=lambda row: (row['symbol'], row['datetime']))
+
+        for row in rows:
+            buffer = self._buffer(symbol=row['symbol'])
+            buffer.append(
+                timestamp=int(row['datetime']),
+                values=[row[column] for column in self.COLUMNS]
+            )
+
+        # All the bars are known here, no need to wait for more.
+        for symbol in list(self._unchecked):
+            self._check_float32(symbol=symbol, force=True)
+
+        self._frame_dirty = True
+
+    def _buffer(self, symbol: str, history: Dict[str, np.ndarray] = None) -> RingBuffer:
+        """
+        :param history: The bars the buffer is created for, a compact frame checks them for float32.
+        """
+
+        if symbol not in self._buffers:
+
+            dtype = np.float64
+            if self._compact and history is not None and self._fits_float32(columns=history):
+                dtype = np.float32
+
+            self._buffers[symbol] = RingBuffer(
+                capacity=self._horizons.get(symbol, self._capacity),
+                columns=self.COLUMNS,
+                dtype=dtype,
+                latest=self._latest
+            )
+            self._latest_symbols.append(symbol)
+
+            if self._compact and history is None:
+                self._unchecked[symbol] = self._buffers[symbol]
+
+        return self._buffers[symbol]
+
+    def _check_float32(self, symbol: str, force: bool = False) -> None:
+        """
+        Moves the buffer of a compact symbol that came without history to float32 once it
+        holds `COMPACT_CHECK_BARS` bars and they fit.
+
+        :param force: Check the bars there are now.
+        """
+
+        buffer = self._unchecked[symbol]
+        if len(buffer) < COMPACT_CHECK_BARS and not force:
+            return
+
+        del self._unchecked[symbol]
+        if self._fits_float32(columns=buffer.tail()[1]):
+            buffer.astype(np.float32)
+
+    def adopt_buffer(self, symbol: str, timestamps: np.ndarray, columns: Dict[str, np.ndarray], appended: int = None,
+                     version: int = 0, dropped: int = 0) -> RingBuffer:
+        """
+        Puts back the buffer of a symbol of the 'ring' backend from its bars, oldest first,
+        see `RingBuffer.from_arrays`. The bars are cut to the capacity of the symbol.
+        """
+
+        if self._backend != 'ring':
+            raise ValueError("Buffers can only be adopted by a StockFrame with the 'ring' backend.")
+
+        if symbol in self._buffers:
+            raise ValueError("{symbol} already has a buffer.".format(symbol=symbol))
+
+        self._latest_symbols.append(symbol)
+
+        self._buffers[symbol] = RingBuffer.from_arrays(
+            capacity=self._horizons.get(symbol, self._capacity),
+            timestamps=timestamps,
+            columns=columns,
+            latest=self._latest,
+            appended=appended,
+            version=version,
+            dropped=dropped
+        )
+        self._frame_dirty = True
+
+        return self._buffers[symbol]
+
+    def _build_frame(self) -> pd.DataFrame:
+
+        symbols = sorted(symbol for symbol, buffer in self._buffers.items() if len(buffer))
+        tails = [self._buffers[symbol].tail() for symbol in symbols]
+
+        # Keep the base columns first, then any derived columns in insertion order.
+        names = list(self.COLUMNS)
+        for _, symbol_columns in tails:
+            names.extend(name for name in symbol_columns if name not in names)
+
+        if not symbols:
+            return self._empty_frame(columns=names)
+
+        sizes = [len(symbol_timestamps) for symbol_timestamps, _ in tails]
+        index = self._make_index(symbols=symbols, timestamps=[symbol_timestamps for symbol_timestamps, _ in tails])
+
+        # Columns a symbol does not have (yet) are padded with NaN.
+        data = {}
+        for name in names:
+            data[name] = np.concatenate([
+                symbol_columns[name] if name in symbol_columns else np.full(size, np.nan, dtype=symbol_columns['close'].dtype)
+                for (_, symbol_columns), size in zip(tails, sizes)
+            ])
+
+        return pd.DataFrame(data=data, index=index)
+
     def _parse_datetime_column(self, price_df: pd.DataFrame) -> pd.DataFrame:
 
         price_df['datetime'] = pd.to_datetime(price_df['datetime'], unit='ms', origin='unix')
@@ -67,9 +672,41 @@ class StockFrame:
 
         return price_df
 
+    def _quote_values(self, quote: dict) -> List[float]:
+
+        # Quotes of an `OrderBook`, or klines valued off one, carry the size resting near the
+        # top, other klines the traded volume, plain quotes only the size at the best bid and ask.
+        if 'bookVolume' in quote:
+            volume = quote['bookVolume']
+        elif 'volume' in quote:
+            volume = quote['volume']
+        else:
+            volume = quote['askSize'] + quote['bidSize']
+
+        # Book quotes without a bar of their own are valued at the mid price.
+        if 'openPrice' not in quote:
+            mid_price = quote['midPrice']
+            return [mid_price, mid_price, mid_price, mid_price, volume]
+
+        return [
+            quote['openPrice'],
+            quote['closePrice'],
+            quote['highPrice'],
+            quote['lowPrice'],
+            volume
+        ]
+
     def add_rows(self, data: dict) -> None:
 
-        column_names = ['open', 'close', 'high', 'low', 'volume']
+        if self._rollups:
+            self._roll_rows(data=data)
+
+        if self._backend == 'ring':
+            self._add_rows_ring(data=data)
+            return
+
+        column_names = self.COLUMNS
+        new_rows = False
 
         for symbol in data:
 
@@ -84,24 +721,180 @@ class StockFrame:
             row_id = (symbol, time_stamp)
 
             # Define values
-            # TODO THIS WILL NEED TO BE CHANGED WITH THE BINANCE API
-            row_values = [
-                data[symbol]['openPrice'],
-                data[symbol]['closePrice'],
-                data[symbol]['highPrice'],
-                data[symbol]['lowPrice'],
-                data[symbol]['askSize'] + data[symbol]['bidSize']
-            ]
-
-            # New row
-            new_row = pd.Series(data=row_values)
+            row_values = self._quote_values(quote=data[symbol])
+
+            # New row, a compact frame only takes values of the dtype of each column.
+            if self._compact:
+                new_row = pd.Series(data=[dtype.type(value) for value, dtype in zip(row_values, self._frame.dtypes[column_names])], dtype=object)
+            else:
+                new_row = pd.Series(data=row_values)
+
+            # Updating an existing bar leaves the layout, and the grouping caches, alone.
+            if row_id not in self._frame.index:
+                new_rows = True
 
             # Add the row
-            self.frame.loc[row_id, column_names] = new_row.values
-            self.frame.sort_index(inplace=True)
+            self._frame.loc[row_id, column_names] = new_row.values
+
+        if new_rows:
+            self._frame.sort_index(inplace=True)
+            if self._compact:
+                self._frame.index = self._categorical_symbols(index=self._frame.index)
+            self._layout_version += 1
+            self._evict()
+
+    def _add_rows_ring(self, data: dict) -> None:
+
+        for symbol in data:
+
+            # O(1) per quote, the frame is rebuilt lazily on the next read.
+            self._buffer(symbol=symbol).append(
+                timestamp=int(data[symbol]['quoteTimeInLong']),
+                values=self._quote_values(quote=data[symbol])
+            )
+
+            if symbol in self._unchecked:
+                self._check_float32(symbol=symbol)
+
+        self._frame_dirty = True
 
     def do_indicators_exist(self, column_names: List[str]) -> bool:
-        pass
 
-    def _check_signals(self, indicators: dict) -> Union[pd.Series, None]:
-        pass
+        if self._backend == 'ring' and self._buffers_have(column_names=column_names):
+            return True
+
+        return set(column_names).issubset(self.frame.columns)
+
+    def _buffers_have(self, column_names: List[str]) -> bool:
+
+        # A column shows up in the latest table as soon as one buffer has it, symbols
+        # that have not got it yet read as NaN.
+        return len(self._latest) > 0 and set(column_names).issubset(self._latest.columns)
+
+    def latest_rows(self, column_names: List[str]) -> Tuple[pd.Index, np.ndarray]:
+        """
+        Grabs the newest bar of every symbol.
+
+        :param column_names: The columns to grab.
+        :return: The symbols and a (symbols x columns) array of values.
+        """
+
+        # Streaming indicators live in the buffers, read the newest slot directly.
+        if self._backend == 'ring' and self._buffers_have(column_names=column_names):
+            if self._latest_index is None or len(self._latest_index) != len(self._latest_symbols):
+                self._latest_index = pd.Index(self._latest_symbols, name='symbol')
+            return self._latest_index, self._latest.values(names=column_names)
+
+        frame = self._refresh_groups()
+
+        if len(frame) == 0:
+            return pd.Index([], name='symbol'), np.empty((0, len(column_names)))
+
+        ends = np.append(self._group_starts[1:], len(frame)) - 1
+
+        values = np.empty((len(ends), len(column_names)), dtype=np.float64)
+
+        for position, column_name in enumerate(column_names):
+            values[:, position] = frame[column_name].to_numpy(dtype=np.float64)[ends]
+
+        return self._symbol_index, values
+
+    def _signal_columns(self, indicators: dict) -> List[str]:
+
+        # Every column the conditions touch, thresholds included.
+        column_names = list(indicators)
+        for signal in indicators.values():
+            for side in ('buy', 'sell'):
+                if isinstance(signal[side], str) and signal[side] not in column_names:
+                    column_names.append(signal[side])
+
+        return column_names
+
+    def _evaluate_signals(self, indicators: dict, mode: str, column_names: List[str], values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Runs the buy and sell conditions over the rows of a (rows x columns) array."""
+
+        if mode not in ('and', 'or'):
+            raise ValueError("Mode must be either 'and' or 'or'.")
+
+        positions = {column_name: position for position, column_name in enumerate(column_names)}
+
+        combine = np.logical_and if mode == 'and' else np.logical_or
+        buy = np.full(len(values), mode == 'and')
+        sell = np.full(len(values), mode == 'and')
+
+        with np.errstate(invalid='ignore'):
+            for indicator, signal in indicators.items():
+
+                current = values[:, positions[indicator]]
+
+                buy_threshold = signal['buy']
+                if isinstance(buy_threshold, str):
+                    buy_threshold = values[:, positions[buy_threshold]]
+
+                sell_threshold = signal['sell']
+                if isinstance(sell_threshold, str):
+                    sell_threshold = values[:, positions[sell_threshold]]
+
+                buy = combine(buy, signal['buy_operator'](current, buy_threshold))
+                sell = combine(sell, signal['sell_operator'](current, sell_threshold))
+
+        return buy, sell
+
+    def _check_signals(self, indicators: dict, mode: str = 'and') -> Union[pd.DataFrame, None]:
+        """
+        Evaluates the buy and sell conditions of every indicator against the newest bar of
+        every symbol, one NumPy comparison per condition.
+
+        :param indicators: The signals set through `Indicators.set_indicator_signals`, keyed by
+        the column they read. A threshold may be a number or the name of another column.
+        :param mode: 'and' when every indicator has to agree, 'or' when one is enough.
+        :return: A boolean frame with a buy and a sell column indexed by symbol, or None
+        if no signals are set or a column does not exist yet.
+        """
+
+        if mode not in ('and', 'or'):
+            raise ValueError("Mode must be either 'and' or 'or'.")
+
+        if not indicators:
+            return None
+
+        column_names = self._signal_columns(indicators=indicators)
+
+        if not self.do_indicators_exist(column_names=column_names):
+            return None
+
+        symbols, values = self.latest_rows(column_names=column_names)
+        buy, sell = self._evaluate_signals(indicators=indicators, mode=mode, column_names=column_names, values=values)
+
+        return pd.DataFrame(
+            data=np.column_stack((buy, sell)),
+            index=symbols,
+            columns=self.SIGNAL_COLUMNS
+        )
+
+    def signal_history(self, indicators: dict, mode: str = 'and') -> Union[pd.DataFrame, None]:
+        """
+        Like `_check_signals` but for every bar in the frame instead of only the newest,
+        which is what a backtest needs once the indicators were calculated in bulk.
+
+        :return: A boolean frame with a buy and a sell column on the frame's index, or None
+        if no signals are set or a column does not exist yet.
+        """
+
+        if not indicators:
+            return None
+
+        column_names = self._signal_columns(indicators=indicators)
+        frame = self.frame
+
+        if not set(column_names).issubset(frame.columns):
+            return None
+
+        values = frame[column_names].to_numpy(dtype=np.float64)
+        buy, sell = self._evaluate_signals(indicators=indicators, mode=mode, column_names=column_names, values=values)
+
+        return pd.DataFrame(
+            data=np.column_stack((buy, sell)),
+            index=frame.index,
+            columns=self.SIGNAL_COLUMNS
+        )
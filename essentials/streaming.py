@@ -0,0 +1,303 @@
+import numpy as np
+
+from collections import deque
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+
+from essentials.ring_buffer import RingBuffer
+
+
+class DiffState:
+
+    def __init__(self) -> None:
+        self._previous = np.nan
+
+    def update(self, value: float) -> float:
+
+        change = value - self._previous
+        self._previous = value
+
+        return change
+
+    def peek(self, value: float) -> float:
+        return value - self._previous
+
+    def state(self) -> List[float]:
+        """The running state as plain numbers, `restore` takes it back."""
+
+        return [self._previous]
+
+    def restore(self, values: List[float]) -> None:
+
+        self._previous = float(values[0])
+
+
+class RollingMeanState:
+
+    def __init__(self, period: int) -> None:
+
+        self._period = period
+        self._window = deque()
+        self._sum = 0.0
+
+    def update(self, value: float) -> float:
+
+        self._window.append(value)
+        self._sum += value
+
+        if len(self._window) > self._period:
+            self._sum -= self._window.popleft()
+
+        if len(self._window) < self._period:
+            return np.nan
+
+        return self._sum / self._period
+
+    def peek(self, value: float) -> float:
+
+        count = len(self._window) + 1
+        total = self._sum + value
+
+        if count > self._period:
+            total -= self._window[0]
+            count = self._period
+
+        if count < self._period:
+            return np.nan
+
+        return total / self._period
+
+    def state(self) -> List[float]:
+        return [self._sum] + list(self._window)
+
+    def restore(self, values: List[float]) -> None:
+
+        self._sum = float(values[0])
+        self._window = deque(float(value) for value in values[1:])
+
+
+class EmaState:
+
+    def __init__(self, period: int) -> None:
+        """
+        Matches pandas `ewm(span=period).mean()`, which defaults to adjust=True. That
+        average is a ratio of two decaying sums so it can be carried forward exactly.
+        """
+
+        self._decay = 1.0 - 2.0 / (period + 1.0)
+        self._numerator = 0.0
+        self._denominator = 0.0
+
+    def update(self, value: float) -> float:
+
+        self._numerator = value + self._decay * self._numerator
+        self._denominator = 1.0 + self._decay * self._denominator
+
+        return self._numerator / self._denominator
+
+    def peek(self, value: float) -> float:
+        return (value + self._decay * self._numerator) / (1.0 + self._decay * self._denominator)
+
+    def state(self) -> List[float]:
+        return [self._numerator, self._denominator]
+
+    def restore(self, values: List[float]) -> None:
+
+        self._numerator = float(values[0])
+        self._denominator = float(values[1])
+
+
+class WilderState:
+
+    def __init__(self, period: int) -> None:
+        """Matches pandas `ewm(alpha=1 / period, adjust=False).mean()`."""
+
+        self._alpha = 1.0 / period
+        self._average = np.nan
+
+    def update(self, value: float) -> float:
+
+        self._average = self.peek(value)
+
+        return self._average
+
+    def peek(self, value: float) -> float:
+
+        if np.isnan(self._average):
+            return value
+
+        return self._average + self._alpha * (value - self._average)
+
+    def state(self) -> List[float]:
+        return [self._average]
+
+    def restore(self, values: List[float]) -> None:
+
+        self._average = float(values[0])
+
+
+def relative_strength_index(average_up: float, average_down: float) -> float:
+
+    if average_down == 0:
+        return 100.0
+
+    return 100.0 - (100.0 / (1.0 + average_up / average_down))
+
+
+class RsiState:
+
+    def __init__(self, period: int, method: str = 'wilders') -> None:
+
+        self._change = DiffState()
+
+        if method == 'wilders':
+            self._up = WilderState(period=period)
+            self._down = WilderState(period=period)
+        else:
+            self._up = EmaState(period=period)
+            self._down = EmaState(period=period)
+
+    def update(self, value: float) -> float:
+
+        change = self._change.update(value)
+
+        # The first bar has no change, the averages start on the second one.
+        if np.isnan(change):
+            return np.nan
+
+        return relative_strength_index(
+            average_up=self._up.update(max(change, 0.0)),
+            average_down=self._down.update(max(-change, 0.0))
+        )
+
+    def peek(self, value: float) -> float:
+
+        change = self._change.peek(value)
+
+        if np.isnan(change):
+            return np.nan
+
+        return relative_strength_index(
+            average_up=self._up.peek(max(change, 0.0)),
+            average_down=self._down.peek(max(-change, 0.0))
+        )
+
+    def state(self) -> List[float]:
+        return self._change.state() + self._up.state() + self._down.state()
+
+    def restore(self, values: List[float]) -> None:
+
+        # Both averages are of the same kind, so they split the rest in half.
+        half = (len(values) - 1) // 2
+
+        self._change.restore(values[:1])
+        self._up.restore(values[1:1 + half])
+        self._down.restore(values[1 + half:])
+
+
+class IndicatorStream:
+
+    def __init__(self, column_name: str, factory: Callable, source: str = 'close') -> None:
+        """
+        Keeps one running state per symbol for an indicator and writes its values into
+        the symbol's RingBuffer as new bars arrive.
+
+        Every state has two methods, `update` which folds a finished bar into the state
+        and `peek` which returns the value for a bar without storing it. The newest bar
+        of a symbol can still be revised by later ticks, so it is only ever peeked and
+        gets folded in on the next refresh once a newer bar has arrived.
+
+        :param column_name: The column the values are written to.
+        :param factory: Callable returning a fresh state for a symbol.
+        :param source: The column the indicator is calculated from.
+        """
+
+        self.column_name = column_name
+        self._factory = factory
+        self._source = source
+        self._states: Dict[str, object] = {}
+        self._seen: Dict[str, int] = {}
+        self._versions: Dict[str, int] = {}
+
+    def update(self, buffers: Dict[str, RingBuffer]) -> int:
+        """
+        :param buffers: The RingBuffer of every symbol in the StockFrame.
+        :return: The number of bars that were processed.
+        """
+
+        processed = 0
+
+        for symbol, buffer in buffers.items():
+
+            if self._versions.get(symbol) == buffer.version or len(buffer) == 0:
+                continue
+
+            if symbol not in self._states:
+                self._states[symbol] = self._factory()
+                buffer.add_column(self.column_name)
+
+            state = self._states[symbol]
+            seen = self._seen.get(symbol, 0)
+
+            # Start from the bar that was only peeked last time. Bars that were pushed
+            # out of the buffer before we saw them can not be recovered.
+            count = min(buffer.appended - max(seen - 1, 0), len(buffer))
+            values = buffer.values(self._source, count)
+
+            for position in range(count - 1):
+                buffer.set_value(self.column_name, state.update(values[position]), offset=count - 1 - position)
+
+            buffer.set_value(self.column_name, state.peek(values[-1]), offset=0)
+
+            self._seen[symbol] = buffer.appended
+            self._versions[symbol] = buffer.version
+            processed += count
+
+        return processed
+
+    def export(self) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        """
+        The state of every symbol as flat arrays, e.g. for a checkpoint.
+
+        :return: The symbols and the arrays `load` takes: the bars seen and the buffer
+        version per symbol, and the states one after the other with their offsets.
+        """
+
+        symbols = list(self._states)
+        states = [self._states[symbol].state() for symbol in symbols]
+
+        return symbols, {
+            'seen': np.array([self._seen.get(symbol, 0) for symbol in symbols], dtype=np.int64),
+            'versions': np.array([self._versions.get(symbol, -1) for symbol in symbols], dtype=np.int64),
+            'offsets': np.cumsum([0] + [len(state) for state in states]).astype(np.int64),
+            'values': np.array([value for state in states for value in state], dtype=np.float64)
+        }
+
+    def load(self, symbols: List[str], arrays: Dict[str, np.ndarray]) -> None:
+        """
+        Takes back the states of `export`. Symbols whose buffer is still at the exported
+        version are skipped by the next `update`, the others only replay their new bars.
+        """
+
+        offsets = arrays['offsets']
+        values = arrays['values']
+
+        for position, symbol in enumerate(symbols):
+            state = self._factory()
+            state.restore(values[offsets[position]:offsets[position + 1]].tolist())
+
+            self._states[symbol] = state
+            self._seen[symbol] = int(arrays['seen'][position])
+            self._versions[symbol] = int(arrays['versions'][position])
+
+    def remove(self, buffers: Dict[str, RingBuffer]) -> None:
+
+        for buffer in buffers.values():
+            buffer.remove_column(self.column_name)
+
+        self._states.clear()
+        self._seen.clear()
+        self._versions.clear()
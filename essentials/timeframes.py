@@ -0,0 +1,165 @@
+import numpy as np
+
+from typing import Dict
+from typing import Tuple
+from typing import Optional
+from typing import Sequence
+
+from essentials.backfill import INTERVAL_MS
+
+
+# The epoch was a Thursday, Binance starts its weekly bars on Monday.
+WEEK_OFFSET_MS = 4 * 86400000
+
+
+def rollup_columns(timestamps: np.ndarray, columns: Dict[str, np.ndarray], interval_ms: int,
+                   offset_ms: int = 0) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Rolls time ordered bars up into bars of `interval_ms`, one pass with `reduceat`.
+
+    :param timestamps: The bar times in milliseconds since the epoch.
+    :param columns: The OHLCV arrays of the bars.
+    :return: The open time of every rolled bar and its OHLCV arrays.
+    """
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) == 0:
+        return timestamps, {name: np.zeros(0) for name in ('open', 'close', 'high', 'low', 'volume')}
+
+    buckets = timestamps - (timestamps - offset_ms) % interval_ms
+    starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+
+    rolled = {
+        'open': np.asarray(columns['open'], dtype=np.float64)[starts],
+        'close': np.asarray(columns['close'], dtype=np.float64)[ends],
+        'high': np.maximum.reduceat(np.asarray(columns['high'], dtype=np.float64), starts),
+        'low': np.minimum.reduceat(np.asarray(columns['low'], dtype=np.float64), starts),
+        'volume': np.add.reduceat(np.asarray(columns['volume'], dtype=np.float64), starts)
+    }
+
+    return buckets[starts], rolled
+
+
+class TimeframeRollup:
+
+    def __init__(self, interval: str) -> None:
+        """
+        Rolls the bars of a StockFrame up into a longer interval as they arrive. Only the
+        open bar of every symbol is kept as state, a base bar updates it in O(1).
+
+        A base bar can be revised until the next one starts (klines tick many times per
+        bar), so the volume of the open base bar is kept apart from the volume of the
+        base bars already finished in the rolled bar.
+
+        :param interval: The interval rolled up to, one of the Binance kline intervals, e.g. 1h.
+        """
+
+        if interval not in INTERVAL_MS:
+            raise ValueError("Unknown interval {interval}, use one of {intervals}.".format(
+                interval=interval,
+                intervals=', '.join(INTERVAL_MS)
+            ))
+
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.offset_ms = WEEK_OFFSET_MS if interval == '1w' else 0
+
+        # Per symbol [open time, open, close, high, low, finished volume, base bar time, base bar volume].
+        self._states: Dict[str, list] = {}
+
+    def bucket(self, timestamp: int) -> int:
+        """The open time of the rolled bar `timestamp` falls in."""
+
+        return timestamp - (timestamp - self.offset_ms) % self.interval_ms
+
+    def update(self, symbol: str, timestamp: int, values: Sequence[float]) -> Optional[dict]:
+        """
+        Folds a base bar into the open rolled bar of its symbol.
+
+        :param values: The open, close, high, low and volume of the base bar.
+        :return: The open rolled bar as a quote for `StockFrame.add_rows`, None if the base
+        bar was older than the open one.
+        """
+
+        open_price, close, high, low, volume = values
+        bucket = timestamp - (timestamp - self.offset_ms) % self.interval_ms
+        state = self._states.get(symbol)
+
+        if state is None or bucket > state[0]:
+            state = [bucket, open_price, close, high, low, 0.0, timestamp, volume]
+            self._states[symbol] = state
+
+        elif timestamp < state[6]:
+            return None
+
+        else:
+            if timestamp != state[6]:
+                state[5] += state[7]
+                state[6] = timestamp
+
+            state[2] = close
+            state[3] = max(state[3], high)
+            state[4] = min(state[4], low)
+            state[7] = volume
+
+        return {
+            'quoteTimeInLong': state[0],
+            'openPrice': state[1],
+            'closePrice': state[2],
+            'highPrice': state[3],
+            'lowPrice': state[4],
+            'volume': state[5] + state[7]
+        }
+
+    def extend(self, symbol: str, timestamps: np.ndarray, columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Folds many base bars in at once, e.g. a backfill. Bars not newer than the open
+        base bar are skipped.
+
+        :return: The rolled bars, the first one replaces the open rolled bar if it continues it.
+        """
+
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        columns = {name: np.asarray(columns[name], dtype=np.float64) for name in ('open', 'close', 'high', 'low', 'volume')}
+        state = self._states.get(symbol)
+
+        if len(timestamps) > 1 and not np.all(timestamps[1:] > timestamps[:-1]):
+            timestamps, order = np.unique(timestamps, return_index=True)
+            columns = {name: values[order] for name, values in columns.items()}
+
+        if state is not None:
+            newer = timestamps > state[6]
+            timestamps = timestamps[newer]
+            columns = {name: values[newer] for name, values in columns.items()}
+
+        buckets, rolled = rollup_columns(
+            timestamps=timestamps,
+            columns=columns,
+            interval_ms=self.interval_ms,
+            offset_ms=self.offset_ms
+        )
+
+        if len(buckets) == 0:
+            return buckets, rolled
+
+        if state is not None and buckets[0] == state[0]:
+            rolled['open'][0] = state[1]
+            rolled['high'][0] = max(rolled['high'][0], state[3])
+            rolled['low'][0] = min(rolled['low'][0], state[4])
+            rolled['volume'][0] += state[5] + state[7]
+
+        last_volume = float(columns['volume'][-1])
+
+        self._states[symbol] = [
+            int(buckets[-1]),
+            float(rolled['open'][-1]),
+            float(rolled['close'][-1]),
+            float(rolled['high'][-1]),
+            float(rolled['low'][-1]),
+            float(rolled['volume'][-1]) - last_volume,
+            int(timestamps[-1]),
+            last_volume
+        ]
+
+        return buckets, rolled
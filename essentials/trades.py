@@ -1,23 +1,30 @@
-import numpy as np
-import pandas as pd
+import math
 
-from datetime import time
 from datetime import datetime
-from datetime import timezone
 
 from typing import List, Optional
 from typing import Dict
-from typing import Union
 
-from pandas.core.groupby import DataFrameGroupBy
-from pandas.core.window import RollingGroupby
+from essentials.orders import Leg
+from essentials.orders import Order
+from essentials.orders import Instrument
+from essentials.orders import ORDER_TYPES
+from essentials.orders import ORDER_INSTRUCTIONS
+from essentials.orders import OPPOSITE_SIDE
+from essentials.orders import OPPOSITE_ENTER_OR_EXIT
 
 
 class Trade:
 
+    # Shared lookup tables, kept as attributes for code reading them off a trade.
+    order_types = ORDER_TYPES
+    order_instructions = ORDER_INSTRUCTIONS
+
     def __init__(self):
 
-        self.order = {}
+        self._order: Optional[Order] = None
+        self._payload: Optional[dict] = None
+        self._exit_legs: Optional[List[Leg]] = None
         self._order_response = {}
 
         self._trigger_added = False
@@ -26,6 +33,11 @@ class Trade:
         # For identification
         self._trade_id = ""
 
+        # What is traded, set by `instrument`
+        self.symbol: Optional[str] = None
+        self.asset_type: Optional[str] = None
+        self.order_size = 0
+
         # Long or short
         self.side = ""
 
@@ -38,62 +50,57 @@ class Trade:
         # Opposite of the enter exit value
         self.enter_or_exit_opposite = ""
 
-    def new_trade(self, trade_id: str, order_type: str, side: str, enter_or_exit: str, price: float = 0.0, stop_limit_price: float = 0.0) -> dict:
+    @property
+    def order(self) -> dict:
+        """
+        The exchange payload of the order. It is built on first access and kept until the
+        trade changes the order again, so edit the order through the Trade methods.
+        """
+
+        if self._order is None:
+            return {}
+
+        if self._payload is None:
+            self._payload = self._order.to_dict()
+
+        return self._payload
+
+    @property
+    def order_object(self) -> Optional[Order]:
+        """The order in its compact form, for code that does not need the payload."""
+
+        return self._order
+
+    def _changed(self) -> None:
+
+        self._payload = None
+
+    def new_trade(self, trade_id: str, order_type: str, side: str, enter_or_exit: str, price: float = 0.0, stop_limit_price: float = 0.0) -> Order:
 
         self.trade_id = trade_id
-        self.order_types = {
-            'mkt': 'MARKET',
-            'lmt': 'LIMIT',
-            'stop': 'STOP',
-            'stop_lmt': 'STOP_LIMIT',
-            'trailing_stop': 'TRAILING_STOP'
-        }
-
-        self.order_instructions = {
-            'enter': {
-                'long': 'BUY',
-                'short': 'SELL_SHORT'
-            },
-            'exit': {
-                'long': 'SELL',
-                'short': 'BUY_TO_COVER'
-            }
-        }
-
-        self.order = {
-            'orderStrategyType': "SINGLE",
-            'orderType': self.order_types[order_type],
-            'session': 'NORMAL',
-            'duration': 'DAY',
-            'orderLegCollection': [
-                {
-                    'instruction': self.order_instructions[enter_or_exit][side],
-                    'quantity': 0,
-                    'instrument': {
-                        'symbol': None,
-                        'assetType': None
-                    }
-
-                }
-            ]
-
-        }
-
-        if self.order['orderType'] == 'STOP':
-            self.order['stopPrice'] = price
-
-        elif self.order['orderType'] == 'LIMIT':
-            self.order['price'] = price
-
-        elif self.order['orderType'] == 'STOP_LIMIT':
-            self.order['stopPrice'] = price
-            self.order['price'] = stop_limit_price
-
-        elif self.order['orderType'] == 'TRAILING_STOP':
-            self.order['stopPriceLinkBasis'] = ''
-            self.order['stopPriceLinkType'] = ''
-            self.order['stopPriceOffset'] = 0.00
-            self.order['stopType'] = 'STANDARD'
+
+        exchange_type = ORDER_TYPES[order_type]
+
+        self._order = Order(exchange_type, [Leg(ORDER_INSTRUCTIONS[enter_or_exit][side])])
+        self._exit_legs = None
+
+        if exchange_type == 'STOP':
+            self._order.stop_price = price
+
+        elif exchange_type == 'LIMIT':
+            self._order.price = price
+
+        elif exchange_type == 'STOP_LIMIT':
+            self._order.stop_price = price
+            self._order.price = stop_limit_price
+
+        self._payload = None
+        self._trigger_added = False
+
+        # A new order starts without an instrument.
+        self.symbol = None
+        self.asset_type = None
+        self.order_size = 0
 
         self.enter_or_exit = enter_or_exit
         self.side = side
@@ -103,52 +110,80 @@ class Trade:
         # Store important info for use later.
         if order_type == 'stop':
             self.stop_price = price
-        elif order_type == 'stop-lmt':
+        elif order_type == 'stop_lmt':
             self.stop_price = price
             self.stop_limit_price = stop_limit_price
         else:
             self.stop_price = 0.0
 
-        if self.enter_or_exit == 'enter':
-            self.enter_or_exit_opposite = 'exit'
-        elif self.enter_or_exit == 'exit':
-            self.enter_or_exit_opposite = 'enter'
+        self.enter_or_exit_opposite = OPPOSITE_ENTER_OR_EXIT[enter_or_exit]
+        self.side_opposite = OPPOSITE_SIDE[side]
 
-        if self.side == 'long':
-            self.side_opposite = 'short'
-        elif self.side == 'short':
-            self.side_opposite = 'long'
+        # The payload is only built once somebody reads `order`.
+        return self._order
 
-        return self.order
+    def instrument(self, symbol: str, quantity: int, asset_type: str, sub_asset_type: str = None, order_leg_id: int = 0) -> Leg:
+        """
+        Sets what the trade buys or sells. A quantity of zero leaves the sizing to a
+        `RiskManager`.
+        """
 
-    def instrument(self, symbol: str, quantity: int, asset_type: str, sub_asset_type: str = None, order_leg_id: int = 0) -> dict:
+        if not math.isfinite(quantity) or quantity < 0:
+            raise ValueError("The quantity has to be a finite number of zero or more.")
 
-        leg = self.order['orderLegCollection'][order_leg_id]
+        leg = self._order.legs[order_leg_id]
 
-        leg['instrument']['symbol'] = symbol
-        leg['instrument']['asset_type'] = asset_type
-        leg['quantity'] = quantity
+        leg.instrument.symbol = symbol
+        leg.instrument.asset_type = asset_type
+        leg.instrument.sub_asset_type = sub_asset_type
+        leg.quantity = quantity
 
         self.order_size = quantity
         self.symbol = symbol
         self.asset_type = asset_type
 
+        # The children share one exit leg on the same instrument, see `_child_order`.
+        if order_leg_id == 0 and self._exit_legs is not None:
+            self._exit_legs[0].quantity = quantity
+
+        self._changed()
+
         return leg
 
+    def modify_quantity(self, quantity: float, order_leg_id: int = 0) -> None:
+        """Changes the quantity of a leg, the stop loss and take profit children follow the first leg."""
+
+        if not math.isfinite(quantity) or quantity < 0:
+            raise ValueError("The quantity has to be a finite number of zero or more.")
+
+        self._order.legs[order_leg_id].quantity = quantity
+
+        if order_leg_id == 0:
+            self.order_size = quantity
+
+            # The children share one exit leg, see `_child_order`.
+            if self._exit_legs is not None:
+                self._exit_legs[0].quantity = quantity
+
+        self._changed()
+
     def good_till_cancel(self, cancel_time: datetime) -> None:
 
-        self.order['duration'] = 'GOOD_TILL_CANCEL'
-        self.order['cancelTime'] = cancel_time.isoformat()
+        self._order.duration = 'GOOD_TILL_CANCEL'
+        self._order.cancel_time = cancel_time.isoformat()
+        self._changed()
 
     def modify_side(self, side: Optional[str], order_leg_id: int = 0) -> None:
 
-        if side and side not in ['buy', 'sell', 'sell_short', 'but_to_cover']:
+        if side and side not in ['buy', 'sell', 'sell_short', 'buy_to_cover']:
             raise ValueError("You passed through an invalid side.")
 
         if side:
-            self.side['orderLegCollection'][order_leg_id]['instructions'] = side.upper()
+            self._order.legs[order_leg_id].instruction = side.upper()
         else:
-            self.order['orderLegCollection'][order_leg_id]['instructions'] = self.order_instructions[self.enter_or_exit][self.side_opposite]
+            self._order.legs[order_leg_id].instruction = ORDER_INSTRUCTIONS[self.enter_or_exit][self.side_opposite]
+
+        self._changed()
 
     def add_box_range(self, profit_size: float = 0.00, percentage: bool = False, stop_limit: bool = False):
         if not self._trigger_added:
@@ -159,43 +194,39 @@ class Trade:
         if not stop_limit:
             self.add_stop_loss(stop_size=profit_size, percentage=percentage)
 
+    def _child_order(self, order_type: str, price: float = None, stop_price: float = None) -> Order:
+
+        # Children close what the parent opens, they all share one leg on the parent's instrument.
+        if self._exit_legs is None:
+            self._exit_legs = [Leg(
+                ORDER_INSTRUCTIONS[self.enter_or_exit_opposite][self.side],
+                self.order_size,
+                self._order.legs[0].instrument
+            )]
+
+        child = Order(order_type, self._exit_legs, price, stop_price)
+
+        self._order.children.append(child)
+        self._payload = None
+
+        return child
+
     def add_stop_loss(self, stop_size: float, percentage: bool = False) -> bool:
 
         if not self._trigger_added:
             self._convert_to_trigger()
 
-        if self.order_type == 'mkt':
-            pass
-        elif self.order_type == 'lmt':
-            price = self.price
+        # Market orders carry the price they were made at as a reference.
+        price = self.price
 
         if percentage:
-            adjustment = 1.0 - stop_size
+            adjustment = 1.0 - stop_size if self.side == 'long' else 1.0 + stop_size
             new_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=True)
         else:
-            adjustment = stop_size
+            adjustment = -stop_size if self.side == 'long' else stop_size
             new_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=False)
 
-        stop_loss_order = {
-            "order_type": "STOP",
-            "session": "NORMAL",
-            "duration": "DAY",
-            "stopPrice": new_price,
-            "orderStrategyType": "SINGLE",
-            "orderLegCollection": [
-                {
-                    "instruction": self.order_instructions[self.enter_or_exit_opposite][self.side],
-                    "quantity": self.order_size,
-                    "instrument": {
-                        "symbol": self.symbol,
-                        "assetType": self.asset_type
-                    }
-                }
-            ]
-        }
-
-        self.add_stop_loss = stop_loss_order
-        self.order['childOrderStrategies'].append(self.stop_loss_order)
+        self.stop_loss_order = self._child_order(order_type='STOP', stop_price=new_price)
 
         return True
 
@@ -204,10 +235,7 @@ class Trade:
         if not self._trigger_added:
             self._convert_to_trigger()
 
-        if self.order_type == 'mkt':
-            pass
-        elif self.order_type == 'lmt':
-            price = self.price
+        price = self.price
 
         if stop_percentage:
             adjustment = 1.0 - stop_size
@@ -223,30 +251,9 @@ class Trade:
             adjustment = limit_size
             limit_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=False)
 
-        stop_limit_order = {
-            "order_type": "STOP_LIMIT",
-            "session": "NORMAL",
-            "duration": "DAY",
-            "price": limit_price,
-            "stopPrice": stop_price,
-            "orderStrategyType": "SINGLE",
-            "orderLegCollection": [
-                {
-                    "instruction": self.order_instructions[self.enter_or_exit_opposite][self.side],
-                    "quantity": self.order_size,
-                    "instrument": {
-                        "symbol": self.symbol,
-                        "assetType": self.asset_type
-                    }
-                }
-            ]
-        }
-
-        self.stop_limit_order = stop_limit_order
-        self.order['childOrderStrategies'].append(self.stop_limit_order)
+        self.stop_limit_order = self._child_order(order_type='STOP_LIMIT', price=limit_price, stop_price=stop_price)
 
         return True
-
     def _calculate_new_price(self, price: float, adjustment: float, percentage: bool) -> float:
         """
         :param price: This is the price which should be re calculated
@@ -269,58 +276,37 @@ class Trade:
 
     def add_take_profit(self, profit_size: float, percentage: bool = False) -> bool:
 
-        if not self._triggered_added:
+        if not self._trigger_added:
             self._convert_to_trigger()
 
-        if self.order_type == 'mkt':
-            pass
-        elif self.order_type == 'lmt':
-            price = self.price
+        price = self.price
 
         if percentage:
             # The adjustment will be based on a percentage.
-            adjustment = 1.0 - profit_size
+            adjustment = 1.0 + profit_size if self.side == 'long' else 1.0 - profit_size
             profit_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=True)
         else:
             # The adjustment will be plain
-            adjustment = profit_size
+            adjustment = profit_size if self.side == 'long' else -profit_size
             profit_price = self._calculate_new_price(price=price, adjustment=adjustment, percentage=False)
 
-        take_profit_order = {
-            "order_type": "LIMIT",
-            "session": "NORMAL",
-            "duration": "DAY",
-            "price": profit_price,
-            "orderStrategyType": "SINGLE",
-            "orderLegCollection": [
-                {
-                    "instruction": self.order_instructions[self.enter_or_exit_opposite][self.side],
-                    "quantity": self.order_size,
-                    "instrument": {
-                        "symbol": self.symbol,
-                        "assetType": self.asset_type
-                    }
-                }
-            ]
-        }
-
         # Add the order.
-        self.take_profit_order = take_profit_order
-        self.order['childOrderStrategies'].append(self.take_profit_order)
+        self.take_profit_order = self._child_order(order_type='LIMIT', price=profit_price)
 
         return True
 
     def _convert_to_trigger(self):
 
-        if self.order and self._trigger_added == False:
-            self.order['orderStrategyType'] = 'TRIGGER'
-            self.order['childOrderStrategies'] = []
+        if self._order and self._trigger_added == False:
+            self._order.strategy_type = 'TRIGGER'
             self._trigger_added = True
+            self._changed()
 
     def modify_session(self, session: str) -> None:
         #TODO: This might not be needed when trading with bitcoin.
         if session in ['am', 'pm', 'normal', 'seamless']:
-            self.order['session'] = session.upper()
+            self._order.session = session.upper()
+            self._changed()
         else:
             raise ValueError("Invalid session")
 
@@ -329,16 +315,16 @@ class Trade:
 
         return self._order_response
 
-    @order_response
+    @order_response.setter
     def order_response(self, order_response_dict: dict) -> None:
 
         self._order_response = order_response_dict
 
     def _generate_order_id(self) -> str:
 
-        if self.order:
+        if self._order:
 
-            order_id = "{symbol}_{side}_{enter _or_exit}_{timestamp}"
+            order_id = "{symbol}_{side}_{enter_or_exit}_{timestamp}"
             order_id = order_id.format(
                 symbol=self.symbol,
                 side=self.side,
@@ -354,15 +340,6 @@ class Trade:
 
     def add_leg(self, order_leg_id: int, symbol: str, quantity: int, asset_type: str, sub_asset_type: str=None) -> List[Dict]:
 
-        # Define the leg
-        leg = {}
-        leg['instrument']['symbol'] = symbol
-        leg['instrument']['assetType'] = asset_type
-        leg['quantity'] = quantity
-
-        if sub_asset_type:
-            leg['instrument']['subAssetType'] = sub_asset_type
-
         if order_leg_id == 0:
             self.instrument(
                 symbol=symbol,
@@ -372,11 +349,14 @@ class Trade:
                 order_leg_id=0
             )
         else:
-            order_leg_collection: list = self.order['orderLegCollection']
-            order_leg_collection.insert(order_leg_id, leg)
+            # Define the leg
+            leg = Leg(
+                instruction=self._order.legs[0].instruction,
+                quantity=quantity,
+                instrument=Instrument(symbol=symbol, asset_type=asset_type, sub_asset_type=sub_asset_type)
+            )
+            self._order.legs.insert(order_leg_id, leg)
+            self._multi_leg = True
+            self._changed()
 
         return self.order['orderLegCollection']
-
-
-
-
@@ -1,23 +1,75 @@
-import pandas as pdb
+from __future__ import annotations
 
-from binance.client import Client
+import os
+import threading
+import importlib
 
 from datetime import datetime
 from datetime import time
 from datetime import timezone
 
-import os
 from os.path import join, dirname
-from dotenv import load_dotenv
 
 from typing import List
 from typing import Dict
 from typing import Union
+from typing import Optional
+from typing import TYPE_CHECKING
+
+from essentials.instrumentation import Instrumentation
+from essentials.instrumentation import INSTRUMENTATION
+
+# Everything below pulls in pandas, requests or the exchange client, so it is imported
+# where it is first used and a restart gets to the first tick quickly.
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+    from binance.client import Client
+    from concurrent.futures import Future
+
+    from essentials.portfolio import Portfolio
+    from essentials.stock_frame import StockFrame
+    from essentials.market_data import MarketDataPipeline
+    from essentials.market_data import Transport
+    from essentials.bar_store import BarStore
+    from essentials.trades import Trade
+    from essentials.gateway import OrderGateway
+    from essentials.order_book import OrderBooks
+    from essentials.sharding import ShardedRuntime
+    from essentials.indicators import Indicators
+    from essentials.checkpoint import Checkpoint
+    from essentials.checkpoint import CheckpointStore
+    from essentials.risk import RiskManager
+
+# Imported by `Robot.warm_up` in the background while the bot connects.
+WARM_UP_MODULES = [
+    'pandas',
+    'essentials.stock_frame',
+    'essentials.indicators',
+    'essentials.trades',
+    'essentials.portfolio',
+    'essentials.market_data',
+    'essentials.gateway',
+    'binance.client'
+]
+
+_environment_loaded = False
+
 
-from essentials.portfolio import Portfolio
+def load_environment() -> None:
+    """Reads the API keys from the .env file next to this one, once."""
 
-dotenv_path = join(dirname(__file__), '.env')
-load_dotenv(dotenv_path, verbose=True)
+    global _environment_loaded
+
+    if _environment_loaded:
+        return
+
+    from dotenv import load_dotenv
+
+    dotenv_path = join(dirname(__file__), '.env')
+    load_dotenv(dotenv_path, verbose=True)
+    _environment_loaded = True
 
 
 class Robot:
@@ -26,8 +78,14 @@ class Robot:
                  redirect_uri: str = None,
                  credentials_path: str = None,
                  trading_account: str = None,
-                 paper_trading: bool = True)\
+                 paper_trading: bool = True,
+                 connect: bool = True)\
                  -> None:
+        """
+        :param connect: Connect to the exchange right away. Without it the client is built on
+            first use, or in the background by `warm_up`, so the bot starts without waiting
+            on the network.
+        """
 
         print("Initiating...")
 
@@ -36,24 +94,141 @@ class Robot:
         self.credentials_path: str = credentials_path
         self.redirect_uri: str = redirect_uri
         self.trades: dict = {}
+        self._trade_count = 0
         self.historical_prices: dict = {}
         self.stock_frame = None
+        self.market_data: MarketDataPipeline = None
+        self.gateway: OrderGateway = None
+        self.order_books: OrderBooks = None
+        self.sharded_runtime: ShardedRuntime = None
+        self.checkpoints: CheckpointStore = None
+        self.portfolio: Portfolio = None
+        self.risk: RiskManager = None
+        self.instrumentation: Instrumentation = INSTRUMENTATION
         self.paper_trading = paper_trading
 
-        client = self._create_client()
+        self._client: Client = None
+        self._client_lock = threading.Lock()
+        self._warm_up_thread: threading.Thread = None
+        self._warm_up_error: BaseException = None
+        self.ready = threading.Event()
 
-        info = client.get_asset_balance(asset="BTC")
-        print(info['free'])
-        depth = client.get_order_book(symbol='BNBBTC')
-        print("hello")
-        # print(depth)
+        self.create_order_books()
+
+        if connect:
+            self.connect()
+            self.order_books.wait()
+            self.ready.set()
 
     def _create_client(self) -> Client:
+        from binance.client import Client
+
+        load_environment()
+
         api_key = os.environ.get("BINANCE_PUBLIC_KEY")
         api_secret = os.environ.get("BINANCE_PRIVATE_KEY")
         client = Client(api_key, api_secret)
         return client
 
+    @property
+    def client(self) -> Client:
+        """The exchange client, built on first use."""
+
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+
+        return self._client
+
+    def connect(self, symbols: List[str] = None) -> None:
+        """
+        Builds the client, prints the free BTC balance and fetches the order book snapshots.
+        They are handed over to `order_books`, which seeds them on the thread applying the
+        depth stream, so `connect` can run on the `warm_up` thread while the stream is live.
+
+        :param symbols: The order books to seed, BNBBTC by default.
+        """
+
+        info = self.client.get_asset_balance(asset="BTC")
+        print(info['free'])
+
+        for symbol in symbols or ['BNBBTC']:
+            self.order_books.hand_over(symbol=symbol, snapshot=self.client.get_order_book(symbol=symbol, limit=1000))
+
+    def warm_up(self, symbols: List[str] = None, connect: bool = True) -> threading.Thread:
+        """
+        Imports the heavy modules and connects from a background thread, `ready` is set
+        when it is done. Ticks can be taken in the meantime, whatever they need first is
+        imported on the spot.
+
+        :param symbols: Passed on to `connect`.
+        :param connect: Only import, e.g. for a bot that runs on cached bars.
+        """
+
+        if self._warm_up_thread is not None:
+            return self._warm_up_thread
+
+        def run() -> None:
+            try:
+                for module in WARM_UP_MODULES:
+                    try:
+                        importlib.import_module(module)
+                    except ImportError:
+                        pass
+
+                if connect:
+                    self.connect(symbols=symbols)
+            except BaseException as error:
+                self._warm_up_error = error
+            finally:
+                self.ready.set()
+
+        self._warm_up_thread = threading.Thread(target=run, name='robot-warm-up', daemon=True)
+        self._warm_up_thread.start()
+
+        return self._warm_up_thread
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """
+        Waits for `warm_up` to finish and raises what it failed with, if anything.
+
+        :return: False when `timeout` ran out first.
+        """
+
+        if not self.ready.wait(timeout):
+            return False
+
+        if self._warm_up_error is not None:
+            raise RuntimeError('Warming up the robot failed.') from self._warm_up_error
+
+        return True
+
+    def enable_instrumentation(self, dump_path: str = None, dump_interval: float = 60.0) -> Instrumentation:
+        """
+        Starts timing the hot paths, from `add_rows` to order submission. Call it before
+        the indicators are set up.
+
+        :param dump_path: Write the stats to this JSON file every `dump_interval` seconds.
+        """
+
+        self.instrumentation.enable()
+
+        if dump_path:
+            self.instrumentation.start_dumping(path=dump_path, interval=dump_interval)
+
+        return self.instrumentation
+
+    def disable_instrumentation(self) -> None:
+
+        self.instrumentation.stop_dumping()
+        self.instrumentation.disable()
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """Latency percentiles of every timed hot path in microseconds."""
+
+        return self.instrumentation.stats()
+
     @property
     def pre_market_open(self) -> bool:
         pre_market_start_time = datetime.now().replace(hour=12, minute=00, second=00, tzinfo=timezone.utc).timestamp()
@@ -88,20 +263,303 @@ class Robot:
             return False
 
     def create_portfolio(self):
+        from essentials.portfolio import Portfolio
+
         # Init a new portfolio
-        self.portfolio = Portfolio(account_nu,b)
+        self.portfolio = Portfolio(account_number=self.trading_account)
+
+        return self.portfolio
+
+    def create_trade(self, trade_id: str, enter_or_exit: str, long_or_short: str, order_type: str = 'mkt',
+                     price: float = 0.0, stop_limit_price: float = 0.0) -> Trade:
+
+        from essentials.trades import Trade
+
+        trade = Trade()
+        trade.new_trade(
+            trade_id=trade_id,
+            order_type=order_type,
+            side=long_or_short,
+            enter_or_exit=enter_or_exit,
+            price=price,
+            stop_limit_price=stop_limit_price
+        )
+
+        self.trades[trade_id] = trade
+
+        return trade
+
+    def create_gateway(self, base_url: str = None, max_workers: int = 16) -> OrderGateway:
+
+        from essentials.gateway import OrderGateway
+        from essentials.backfill import BINANCE_API_URL
+
+        load_environment()
+
+        self.gateway = OrderGateway(
+            api_key=os.environ.get("BINANCE_PUBLIC_KEY"),
+            api_secret=os.environ.get("BINANCE_PRIVATE_KEY"),
+            base_url=base_url or BINANCE_API_URL,
+            max_workers=max_workers
+        )
+
+        return self.gateway
+
+    def create_risk_manager(self, equity: float, **limits) -> RiskManager:
+        """
+        Sizes the trades and holds them to the exposure limits before `execute_trades`
+        sends them, see `RiskManager` for the sizing rules and `limits`.
+        """
+
+        from essentials.risk import RiskManager
+
+        if self.portfolio is None:
+            self.create_portfolio()
+
+        self.risk = RiskManager(portfolio=self.portfolio, equity=equity, **limits)
+
+        return self.risk
+
+    def trades_from_signals(self, signals: pd.DataFrame, prices: Dict[str, float] = None, volatility: Dict[str, float] = None,
+                            order_type: str = 'mkt', asset_type: str = 'CRYPTO') -> List[Trade]:
+        """
+        Turns the signals of `Indicators.check_signals` into trades, a buy enters a long
+        position and a sell exits it. The risk manager sizes and checks the signals as
+        arrays before any Trade exists, so only the trades that pass are built. Symbols
+        with both a buy and a sell signal are left alone.
 
-    def create_trade(self):
-        pass
+        :param signals: The frame of `Indicators.check_signals`.
+        :param prices: The current prices per symbol, the trades are made at them.
+        :param volatility: The standard deviation of the returns per symbol, for volatility sizing.
+        :return: The sized trades, send them with `execute_trades(trades, check=False)`.
+        """
 
-    def create_stock_frame(self):
-        pass
+        import numpy as np
+
+        if self.risk is None:
+            raise ValueError("Create a risk manager first, it sizes the trades.")
+
+        buy = signals['buy'].to_numpy(dtype=bool)
+        sell = signals['sell'].to_numpy(dtype=bool)
+        active = np.flatnonzero(buy != sell)
+
+        symbols = signals.index[active].tolist()
+        enter = buy[active]
+
+        quantity, reasons = self.risk.size(
+            symbols=symbols,
+            enter=enter,
+            long=np.ones(len(symbols), dtype=bool),
+            prices=prices,
+            volatility=volatility
+        )
+
+        trades = []
+        for symbol, entry, size, reason in zip(symbols, enter.tolist(), quantity.tolist(), reasons.tolist()):
+
+            if reason:
+                continue
+
+            self._trade_count += 1
+            trade = self.create_trade(
+                trade_id='{symbol}_{count}'.format(symbol=symbol, count=self._trade_count),
+                enter_or_exit='enter' if entry else 'exit',
+                long_or_short='long',
+                order_type=order_type,
+                price=prices.get(symbol, 0.0) if prices else 0.0
+            )
+            trade.instrument(symbol=symbol, quantity=size, asset_type=asset_type)
+            trades.append(trade)
+
+        return trades
+
+    def execute_trades(self, trades: List[Trade], prices: Dict[str, float] = None, volatility: Dict[str, float] = None,
+                       check: bool = True) -> List[Future]:
+        """
+        Sends the trades concurrently, every `Trade.order_response` is filled in as its
+        answer arrives. With a risk manager only the trades passing its checks are sent,
+        the others are in `risk.rejected`.
+
+        :param prices: The current prices per symbol, for sizing market orders.
+        :param volatility: The standard deviation of the returns per symbol, for volatility sizing.
+        :param check: Leave it off for trades the risk manager sized already, see `trades_from_signals`.
+        """
+
+        if self.risk is not None and check:
+            trades = self.risk.check(trades=trades, prices=prices, volatility=volatility)
+
+        if self.gateway is None:
+            self.create_gateway()
+
+        return self.gateway.submit_many(trades=trades)
+
+    def create_stock_frame(self, data: List[dict], backend: str = 'ring', capacity: int = 100000) -> StockFrame:
+
+        from essentials.stock_frame import StockFrame
+
+        self.stock_frame = StockFrame(data=data, backend=backend, capacity=capacity)
+
+        return self.stock_frame
+
+    def create_sharded_runtime(self, symbols: List[str], strategy, shards: int = None, bars: int = 5000) -> ShardedRuntime:
+        """
+        Splits the indicator work for `symbols` over worker processes. The Portfolio and the
+        gateway stay in this process, feed the runtime with `publish` and act on `signals`.
+
+        :param strategy: A picklable function that sets up the indicators and signals on an `Indicators`.
+        """
+
+        from essentials.sharding import ShardedRuntime
+
+        if self.sharded_runtime is not None:
+            self.sharded_runtime.close()
+
+        self.sharded_runtime = ShardedRuntime(symbols=symbols, strategy=strategy, shards=shards, bars=bars)
+
+        return self.sharded_runtime
+
+    def create_order_books(self) -> OrderBooks:
+        """Local order books, re-seeded from the REST snapshot whenever the depth stream skips an update."""
+
+        from essentials.order_book import OrderBooks
+
+        self.order_books = OrderBooks(snapshot_source=lambda symbol: self.client.get_order_book(symbol=symbol, limit=1000))
+
+        return self.order_books
+
+    def create_market_data(self, symbols: List[str], interval: str = '1m', transport: Transport = None) -> MarketDataPipeline:
+        """
+        Sets up the streaming ingestion of klines and book tickers into `self.stock_frame`.
+        Start it with `await robot.market_data.start()` from the strategy's event loop.
+        """
+
+        from essentials.market_data import MarketDataPipeline
+
+        if self.stock_frame is None:
+            self.create_stock_frame(data=[])
+
+        self.market_data = MarketDataPipeline(
+            stock_frame=self.stock_frame,
+            symbols=symbols,
+            interval=interval,
+            transport=transport,
+            order_books=self.order_books
+        )
+
+        return self.market_data
 
     def grab_current_quotes(self) -> dict :
-        pass
 
-    def grab_historical_prices(self) -> List[Dict] :
-        pass
+        # The newest quote per symbol as it was streamed into the StockFrame.
+        if self.market_data is None:
+            return {}
+
+        return dict(self.market_data.quotes)
+
+    def grab_historical_prices(self, start: datetime, end: datetime, symbols: List[str], interval: str = '1m',
+                               max_workers: int = 8, base_url: str = None, bar_store: BarStore = None) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Backfills the klines of every symbol between `start` and `end` and loads them into
+        `self.stock_frame`, creating it if needed.
+
+        With a `bar_store` only the bars after the newest cached bar are downloaded, they
+        are saved to the store and everything is then loaded from disk.
+
+        :return: The typed columns per symbol, also kept in `self.historical_prices`.
+        """
+
+        from essentials.stock_frame import StockFrame
+        from essentials.backfill import KlineBackfill
+        from essentials.backfill import BINANCE_API_URL
+
+        backfill = KlineBackfill(base_url=base_url or BINANCE_API_URL, max_workers=max_workers)
+        start_ms = int(start.replace(tzinfo=start.tzinfo or timezone.utc).timestamp() * 1000)
+        end_ms = int(end.replace(tzinfo=end.tzinfo or timezone.utc).timestamp() * 1000)
+
+        if bar_store is not None:
+            bar_store.top_up(backfill=backfill, symbols=symbols, interval=interval, start=start_ms, end=end_ms)
+            columns = bar_store.load_many(symbols=symbols, interval=interval)
+        else:
+            columns = backfill.fetch(symbols=symbols, interval=interval, start=start_ms, end=end_ms)
+
+        if self.stock_frame is None:
+            self.stock_frame = StockFrame.from_columns(columns=columns, backend='ring')
+        else:
+            self.stock_frame.load_columns(columns=columns)
+
+        self.historical_prices = columns
+
+        return columns
+
+    def load_bar_cache(self, bar_store: BarStore, symbols: List[str] = None, interval: str = '1m') -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Loads the cached bars into `self.stock_frame` without touching the network, the
+        quickest way back to a warm frame after a restart. `grab_historical_prices` with
+        the same store fills in what was missed while the bot was down.
+
+        :param symbols: Every symbol cached for `interval` by default.
+        """
+
+        from essentials.stock_frame import StockFrame
+
+        columns = bar_store.load_many(symbols=symbols or bar_store.symbols(interval=interval), interval=interval)
+
+        if self.stock_frame is None:
+            self.stock_frame = StockFrame.from_columns(columns=columns, backend='ring')
+        else:
+            self.stock_frame.load_columns(columns=columns)
+
+        self.historical_prices = columns
+
+        return columns
+
+    def create_checkpoints(self, root: str, keep: int = 3, interval: float = 300.0) -> CheckpointStore:
+        """Snapshots of the StockFrame, the indicator states and the portfolio under `root`."""
+
+        from essentials.checkpoint import CheckpointStore
+
+        self.checkpoints = CheckpointStore(root=root, keep=keep, interval=interval)
+
+        return self.checkpoints
+
+    def checkpoint(self, indicators: List[Indicators] = None, force: bool = False) -> Optional[str]:
+        """
+        Saves a checkpoint when one is due, call it from the trading loop between ticks.
+
+        :param force: Save now, e.g. before shutting down.
+        :return: The directory of the checkpoint, None when none was due.
+        """
+
+        if force:
+            return self.checkpoints.save(stock_frame=self.stock_frame, indicators=indicators, portfolio=self.portfolio)
+
+        return self.checkpoints.save_if_due(stock_frame=self.stock_frame, indicators=indicators, portfolio=self.portfolio)
+
+    def resume(self, strategy=None, bar_store: BarStore = None, interval: str = '1m') -> Optional[Checkpoint]:
+        """
+        Restores the newest checkpoint into `stock_frame` and `portfolio`, and replays the
+        bars cached in `bar_store` after it.
+
+        :param strategy: Sets up the indicators and signals on every restored Indicators, see `CheckpointStore.restore`.
+        :return: The checkpoint, its `indicators` are ready for the next tick. None when there is none.
+        """
+
+        import numpy as np
+
+        checkpoint = self.checkpoints.restore(strategy=strategy)
+        if checkpoint is None:
+            return None
 
+        self.stock_frame = checkpoint.stock_frame
+        if checkpoint.portfolio is not None:
+            self.portfolio = checkpoint.portfolio
 
+        if bar_store is not None:
+            last_timestamps = checkpoint.last_timestamps
+            columns = {}
+            for symbol, symbol_columns in bar_store.load_many(symbols=list(last_timestamps), interval=interval).items():
+                start = int(np.searchsorted(symbol_columns['datetime'], last_timestamps[symbol], side='left'))
+                columns[symbol] = {name: values[start:] for name, values in symbol_columns.items()}
+            checkpoint.replay(columns=columns)
 
+        return checkpoint
@@ -1,17 +1,50 @@
 # From here we run the robot.
-import os
-import time as true_time
-import pprint
-import pathlib
-import operator
-import pandas as pd
+#
+#   python run_robot.py --bar-store bars --symbols BNBBTC ETHBTC --profile-startup
+#
+# The robot starts without waiting on the exchange: pandas, the exchange client and the
+# order book snapshots are loaded by a background thread while the cached bars are read.
+import argparse
 
-from datetime import datetime
-from datetime import timedelta
-from configparser import ConfigParser
+from essentials.startup import StartupProfile
 
-from robot import Robot
-from essentials.indicators import Indicators
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--symbols', nargs='+', default=['BNBBTC'])
+parser.add_argument('--interval', default='1m')
+parser.add_argument('--bar-store', help='Load the bars cached in this directory at start-up.')
+parser.add_argument('--offline', action='store_true', help='Do not connect to the exchange.')
+parser.add_argument('--profile-startup', action='store_true', help='Print the time spent per import and start-up phase.')
+arguments = parser.parse_args()
 
-robot = Robot()
+profile = StartupProfile()
+if arguments.profile_startup:
+    profile.start()
+
+with profile.phase('import robot'):
+    from robot import Robot
+
+with profile.phase('Robot()'):
+    robot = Robot(connect=False)
+    robot.warm_up(symbols=arguments.symbols, connect=not arguments.offline)
+
+if arguments.bar_store:
+    with profile.phase('load bar cache'):
+        from essentials.bar_store import BarStore
+        robot.load_bar_cache(bar_store=BarStore(root=arguments.bar_store), symbols=arguments.symbols, interval=arguments.interval)
+else:
+    with profile.phase('create stock frame'):
+        robot.create_stock_frame(data=[])
+
+with profile.phase('import indicators'):
+    from essentials.indicators import Indicators
+    indicators = Indicators(price_data_frame=robot.stock_frame, streaming=True)
+
+if arguments.profile_startup:
+    print('Ready for ticks after {seconds:.3f} s'.format(seconds=profile.elapsed))
+
+    with profile.phase('warm-up (background)'):
+        robot.wait_ready()
+
+    profile.stop()
+    print(profile.report())
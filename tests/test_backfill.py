@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from benchmarks.fake_exchange import FakeRestServer
+from benchmarks.fake_exchange import synthetic_klines
+
+from essentials.backfill import KlineBackfill
+from essentials.backfill import merge_pages
+from essentials.backfill import parse_klines
+from essentials.bar_store import BarStore
+
+
+START = 1600000000000 - 1600000000000 % 60000
+MINUTE = 60000
+
+
+@pytest.fixture
+def exchange():
+
+    server = FakeRestServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+def expected_columns(symbol: str, start: int, end: int) -> dict:
+    return parse_klines(synthetic_klines(symbol=symbol, start=start, end=end, limit=10 ** 6))
+
+
+def test_ranges_are_paged_and_merged_in_order(exchange):
+
+    end = START + 2499 * MINUTE
+    backfill = KlineBackfill(base_url=exchange.url, max_workers=4)
+
+    columns = backfill.fetch(symbols=['BTCUSDT', 'ETHUSDT'], interval='1m', start=START, end=end)
+
+    # 2500 bars a symbol are three pages of at most 1000.
+    assert backfill.requests_made == 6
+
+    for symbol in ('BTCUSDT', 'ETHUSDT'):
+        assert len(columns[symbol]['datetime']) == 2500
+        assert np.all(np.diff(columns[symbol]['datetime']) == MINUTE)
+
+        expected = expected_columns(symbol=symbol, start=START, end=end)
+        for name, values in expected.items():
+            np.testing.assert_array_equal(columns[symbol][name], values)
+
+
+def test_merge_drops_the_bars_two_pages_share():
+
+    first = expected_columns(symbol='BTCUSDT', start=START, end=START + 9 * MINUTE)
+    second = expected_columns(symbol='BTCUSDT', start=START + 9 * MINUTE, end=START + 19 * MINUTE)
+
+    merged = merge_pages([first, second])
+
+    np.testing.assert_array_equal(merged['datetime'], START + MINUTE * np.arange(20))
+    np.testing.assert_array_equal(merged['close'], expected_columns(symbol='BTCUSDT', start=START, end=START + 19 * MINUTE)['close'])
+
+
+def test_top_up_fetches_from_the_newest_cached_bar(exchange, tmp_path):
+
+    store = BarStore(root=str(tmp_path))
+    cached = expected_columns(symbol='BTCUSDT', start=START, end=START + 99 * MINUTE)
+
+    # The newest bar was cached while it was still open.
+    cached['close'] = cached['close'].copy()
+    cached['close'][-1] += 1.0
+    store.save('BTCUSDT', '1m', cached)
+
+    backfill = KlineBackfill(base_url=exchange.url)
+    end = START + 1499 * MINUTE
+    added = store.top_up(backfill=backfill, symbols=['BTCUSDT', 'ETHUSDT'], interval='1m', start=START, end=end)
+
+    # The changed newest bar is written again along with the 1400 new ones.
+    assert added == {'BTCUSDT': 1401, 'ETHUSDT': 1500}
+
+    for symbol in ('BTCUSDT', 'ETHUSDT'):
+        columns = store.load(symbol, '1m')
+        expected = expected_columns(symbol=symbol, start=START, end=end)
+        for name, values in expected.items():
+            np.testing.assert_array_equal(columns[name], values)
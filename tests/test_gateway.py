@@ -0,0 +1,157 @@
+import time
+
+import pytest
+
+from essentials.trades import Trade
+from essentials.gateway import GatewayError
+from essentials.gateway import OrderGateway
+
+from benchmarks.fake_exchange import FakeRestServer
+
+
+API_KEY = 'test-key'
+API_SECRET = 'test-secret'
+
+
+@pytest.fixture
+def exchange():
+
+    server = FakeRestServer(api_secret=API_SECRET)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def gateway(exchange):
+
+    with OrderGateway(api_key=API_KEY, api_secret=API_SECRET, base_url=exchange.url, max_workers=2) as gateway:
+        yield gateway
+
+
+def make_trade(trade_id: str, order_type: str = 'mkt', exits: bool = True) -> Trade:
+
+    trade = Trade()
+    trade.new_trade(trade_id=trade_id, order_type=order_type, side='long', enter_or_exit='enter', price=100.0)
+    trade.instrument(symbol='BTCUSDT', quantity=1.5, asset_type='CRYPTO')
+
+    if exits:
+        trade.add_stop_loss(stop_size=0.02, percentage=True)
+        trade.add_take_profit(profit_size=0.04, percentage=True)
+
+    return trade
+
+
+def test_gateway_needs_a_secret():
+
+    with pytest.raises(ValueError):
+        OrderGateway(api_key=API_KEY, api_secret=None)
+
+
+def test_order_placed_by_a_lost_attempt_is_looked_up(exchange, gateway):
+
+    exchange.faults.append('lost')
+
+    answer = gateway.wait([gateway.submit(make_trade(trade_id='lost-1', exits=False))])[0]
+
+    assert answer['clientOrderId'] == 'lost-1'
+    assert answer['status'] == 'FILLED'
+    assert len(exchange.orders) == 1
+
+
+def test_order_list_placed_by_a_lost_attempt_is_looked_up(exchange, gateway):
+
+    exchange.faults.append('lost')
+
+    answer = gateway.wait([gateway.submit(make_trade(trade_id='lost-2', order_type='lmt'))])[0]
+
+    assert answer['listClientOrderId'] == 'lost-2'
+    assert len(answer['orderReports']) == 3
+
+
+def test_rejection_on_a_retry_is_returned(exchange, gateway):
+
+    exchange.balance = 10.0
+    exchange.faults.append('error')
+
+    trade = make_trade(trade_id='broke-1', exits=False)
+    answer = gateway.wait([gateway.submit(trade)])[0]
+
+    assert answer['code'] == -2010
+    assert 'insufficient balance' in answer['msg']
+    assert trade.order_response is answer
+    assert not exchange.orders
+
+
+def test_html_error_page_raises_a_gateway_error(exchange):
+
+    exchange.faults.extend(['html', 'html'])
+
+    with OrderGateway(api_key=API_KEY, api_secret=API_SECRET, base_url=exchange.url, retries=1) as gateway:
+        with pytest.raises(GatewayError) as error:
+            gateway.request('POST', '/api/v3/order', {'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'MARKET', 'quantity': 1})
+
+    assert error.value.status == 502
+    assert '502 Bad Gateway' in error.value.text
+
+
+def test_server_errors_are_retried(exchange, gateway):
+
+    exchange.faults.extend(['error', 'error'])
+
+    answer = gateway.wait([gateway.submit(make_trade(trade_id='retry-1', exits=False))])[0]
+
+    assert answer['status'] == 'FILLED'
+    assert gateway.requests_made == 3
+
+
+def test_throttled_requests_back_off_for_retry_after(exchange, gateway):
+
+    exchange.retry_after = 0.3
+    exchange.faults.append('throttle')
+
+    started = time.monotonic()
+    status, answer = gateway.request('POST', '/api/v3/order', {'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'MARKET',
+                                                              'quantity': 1, 'newClientOrderId': 'throttled-1'})
+
+    assert status == 200 and answer['clientOrderId'] == 'throttled-1'
+    assert gateway.requests_made == 2
+
+    # The retry went out once Retry-After had passed.
+    assert time.monotonic() - started >= 0.3
+
+
+def test_limit_entry_with_both_exits_is_one_otoco_list(exchange, gateway):
+
+    answer = gateway.wait([gateway.submit(make_trade(trade_id='otoco-1', order_type='lmt'))])[0]
+
+    assert gateway.requests_made == 1
+    assert answer['listClientOrderId'] == 'otoco-1'
+
+    working, above, below = answer['orderReports']
+    assert (working['type'], working['side'], working['price']) == ('LIMIT', 'BUY', '100.0')
+    assert (above['type'], above['side'], float(above['price'])) == ('LIMIT_MAKER', 'SELL', pytest.approx(104.0))
+    assert (below['type'], below['side']) == ('STOP_LOSS', 'SELL')
+
+
+def test_market_entry_places_its_exits_after_the_fill(exchange, gateway):
+
+    answer = gateway.wait([gateway.submit(make_trade(trade_id='market-1'))])[0]
+
+    assert gateway.requests_made == 2
+    assert answer['status'] == 'FILLED'
+    assert answer['childOrders']['listClientOrderId'] == 'market-1-x'
+    assert sorted(order['type'] for order in answer['childOrders']['orderReports']) == ['LIMIT_MAKER', 'STOP_LOSS']
+
+
+def test_resent_order_is_not_placed_twice(exchange, gateway):
+
+    trade = make_trade(trade_id='twice-1', exits=False)
+    first = gateway.wait([gateway.submit(trade)])[0]
+
+    # The retry of the resubmission is told it is a duplicate and finds the order placed first.
+    exchange.faults.append('error')
+    second = gateway.wait([gateway.submit(trade)])[0]
+
+    assert second == first
+    assert len(exchange.orders) == 1
@@ -0,0 +1,114 @@
+import json
+import time
+import asyncio
+
+from benchmarks.fake_exchange import kline_messages
+from benchmarks.fake_exchange import FakeStreamServer
+
+from essentials.stock_frame import StockFrame
+from essentials.market_data import MarketDataPipeline
+from essentials.market_data import ReplayTransport
+from essentials.market_data import WebSocketTransport
+
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT']
+
+
+def last_ticks(messages: list) -> dict:
+    """The last kline of every symbol and bar, what the StockFrame should end up with."""
+
+    klines = {}
+    for message in messages:
+        kline = json.loads(message)['data']['k']
+        klines[kline['s'], kline['t']] = kline
+
+    return klines
+
+
+def check_frame(stock_frame: StockFrame, messages: list) -> None:
+
+    klines = last_ticks(messages=messages)
+    frame = stock_frame.frame
+
+    assert len(frame) == len(klines)
+
+    for symbol in SYMBOLS:
+        rows = frame.loc[symbol]
+        expected = [kline for (kline_symbol, _), kline in sorted(klines.items()) if kline_symbol == symbol]
+        assert rows['close'].tolist() == [float(kline['c']) for kline in expected]
+        assert rows['volume'].tolist() == [float(kline['v']) for kline in expected]
+
+
+def test_websocket_replay_is_batched_into_the_stock_frame():
+
+    messages = kline_messages(symbols=SYMBOLS, bars=5, ticks_per_bar=3)
+    stock_frame = StockFrame(data=[], backend='ring')
+
+    async def replay() -> MarketDataPipeline:
+
+        server = FakeStreamServer(messages=messages)
+        await server.start()
+
+        pipeline = MarketDataPipeline(stock_frame=stock_frame, symbols=SYMBOLS, max_delay=0.05,
+                                      transport=WebSocketTransport(url=server.url))
+        try:
+            await pipeline.run()
+        finally:
+            await server.stop()
+
+        assert server.subscriptions == pipeline.streams
+        return pipeline
+
+    pipeline = asyncio.run(replay())
+
+    # The subscription answer is received as well.
+    assert pipeline.messages_received == len(messages) + 1
+    assert pipeline.bad_messages == 0
+    assert pipeline.batches < len(messages)
+
+    check_frame(stock_frame=stock_frame, messages=messages)
+
+
+def test_every_message_is_its_own_batch_with_a_batch_size_of_one():
+
+    messages = kline_messages(symbols=SYMBOLS, bars=4, ticks_per_bar=2)
+    stock_frame = StockFrame(data=[], backend='ring')
+
+    pipeline = MarketDataPipeline(stock_frame=stock_frame, symbols=SYMBOLS, max_batch=1,
+                                  transport=ReplayTransport(messages=messages))
+    asyncio.run(pipeline.run())
+
+    assert pipeline.batches == pipeline.bars_added == len(messages)
+    check_frame(stock_frame=stock_frame, messages=messages)
+
+
+def test_lone_ticks_do_not_wait_for_max_delay():
+
+    messages = kline_messages(symbols=SYMBOLS, bars=2)
+    stock_frame = StockFrame(data=[], backend='ring')
+
+    pipeline = MarketDataPipeline(stock_frame=stock_frame, symbols=SYMBOLS, max_delay=5.0,
+                                  transport=ReplayTransport(messages=messages, delay=0.01))
+
+    start = time.perf_counter()
+    asyncio.run(pipeline.run())
+
+    assert time.perf_counter() - start < 2.0
+    assert pipeline.batches == len(messages)
+    check_frame(stock_frame=stock_frame, messages=messages)
+
+
+def test_bad_messages_are_skipped():
+
+    messages = kline_messages(symbols=SYMBOLS, bars=3)
+    broken = json.loads(messages[4])
+    del broken['data']['k']['c']
+
+    stock_frame = StockFrame(data=[], backend='ring')
+    pipeline = MarketDataPipeline(stock_frame=stock_frame, symbols=SYMBOLS,
+                                  transport=ReplayTransport(messages=messages[:2] + ['{not json'] + messages[2:4] +
+                                                            [json.dumps(broken)] + messages[5:]))
+    asyncio.run(pipeline.run())
+
+    assert pipeline.bad_messages == 2
+    check_frame(stock_frame=stock_frame, messages=messages[:4] + messages[5:])
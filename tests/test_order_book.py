@@ -0,0 +1,192 @@
+import json
+import random
+import asyncio
+import threading
+
+import pytest
+
+from benchmarks.fake_exchange import depth_messages
+from benchmarks.fake_exchange import kline_messages
+
+from essentials.order_book import BookSide
+from essentials.order_book import OrderBook
+from essentials.order_book import OrderBooks
+from essentials.stock_frame import StockFrame
+from essentials.market_data import MarketDataPipeline
+from essentials.market_data import ReplayTransport
+
+
+def test_quote_values_prefer_the_book_fields():
+
+    stock_frame = StockFrame(data=[], backend='ring')
+    stock_frame.add_rows(data={
+        'BTCUSDT': {
+            'quoteTimeInLong': 1600000000000,
+            'openPrice': 1.0,
+            'closePrice': 2.0,
+            'highPrice': 3.0,
+            'lowPrice': 0.5,
+            'volume': 10.0,
+            'midPrice': 2.0,
+            'bookVolume': 42.0
+        }
+    })
+
+    assert stock_frame.frame['volume'].tolist() == [42.0]
+
+
+def test_book_quotes_are_valued_at_the_mid_price():
+
+    stock_frame = StockFrame(data=[], backend='ring')
+    stock_frame.add_rows(data={'BTCUSDT': {'quoteTimeInLong': 1600000000000, 'midPrice': 5.0, 'bookVolume': 3.0}})
+
+    row = stock_frame.frame.iloc[0]
+    assert (row['open'], row['close'], row['high'], row['low'], row['volume']) == (5.0, 5.0, 5.0, 5.0, 3.0)
+
+
+def test_pipeline_values_the_bars_off_a_synced_book():
+
+    snapshot, depth = depth_messages(symbol='BTCUSDT', updates=50, levels=50)
+    klines = kline_messages(symbols=['BTCUSDT'], bars=3)
+
+    books = OrderBooks()
+    books.seed(symbol='BTCUSDT', snapshot=snapshot)
+
+    stock_frame = StockFrame(data=[], backend='ring')
+    pipeline = MarketDataPipeline(stock_frame=stock_frame, symbols=['BTCUSDT'], order_books=books,
+                                  transport=ReplayTransport(messages=depth + klines))
+    asyncio.run(pipeline.run())
+
+    book = books['BTCUSDT']
+    last = stock_frame.frame.iloc[-1]
+
+    assert last['close'] == book.mid_price
+    assert last['volume'] == book.book_volume
+
+    # The traded volume of the kline is still on the quote.
+    assert pipeline.quotes['BTCUSDT']['volume'] == float(json.loads(klines[-1])['data']['k']['v'])
+
+
+def test_pipeline_keeps_the_kline_prices_without_a_book():
+
+    klines = kline_messages(symbols=['BTCUSDT'], bars=3)
+    kline = json.loads(klines[-1])['data']['k']
+
+    stock_frame = StockFrame(data=[], backend='ring')
+    pipeline = MarketDataPipeline(stock_frame=stock_frame, symbols=['BTCUSDT'], transport=ReplayTransport(messages=klines))
+    asyncio.run(pipeline.run())
+
+    last = stock_frame.frame.iloc[-1]
+    assert last['close'] == float(kline['c'])
+    assert last['volume'] == float(kline['v'])
+
+
+def _check_side(side: BookSide, levels: dict, bids: bool) -> None:
+
+    ranked = sorted(levels.items(), reverse=bids)
+
+    assert len(side) == len(levels)
+    assert side.best() == (ranked[0] if ranked else None)
+
+    for count in (1, 3, 10, len(ranked) + 1):
+        assert side.volume(levels=count) == pytest.approx(sum(size for _, size in ranked[:count]))
+
+    prices, sizes = side.levels(count=5)
+    assert list(zip(prices.tolist(), sizes.tolist())) == pytest.approx(ranked[:5])
+
+    for price, _ in ranked[::7]:
+        for probe in (price, price + 0.005, price - 0.005):
+            expected = sum(size for level, size in levels.items() if (level >= probe if bids else level <= probe))
+            assert side.depth(price=probe) == pytest.approx(expected)
+
+
+def test_book_matches_a_brute_force_book():
+
+    snapshot, messages = depth_messages(symbol='BTCUSDT', updates=300, levels=200)
+
+    book = OrderBook(symbol='BTCUSDT')
+    book.seed(snapshot=snapshot)
+
+    bids = {float(price): float(size) for price, size in snapshot['bids']}
+    asks = {float(price): float(size) for price, size in snapshot['asks']}
+
+    for number, message in enumerate(messages):
+        event = json.loads(message)['data']
+        assert book.apply(event=event)
+
+        for levels, changes in ((bids, event['b']), (asks, event['a'])):
+            for price, size in changes:
+                if float(size) == 0.0:
+                    levels.pop(float(price), None)
+                else:
+                    levels[float(price)] = float(size)
+
+        if number % 10 == 0:
+            _check_side(side=book.bids, levels=bids, bids=True)
+            _check_side(side=book.asks, levels=asks, bids=False)
+
+    assert book.mid_price == (max(bids) + min(asks)) / 2.0
+
+
+def test_side_follows_a_price_far_from_the_snapshot():
+
+    rng = random.Random(1)
+    side = BookSide(bids=False)
+    side.load(levels=[['100.00', '1.0'], ['100.50', '2.0']])
+    levels = {100.0: 1.0, 100.5: 2.0}
+
+    # Levels far outside the tree, better than its base, on a finer tick and emptying the side.
+    for price in (99.0, 5000.0, 250000.25, 1.5, 100.125):
+        side.update(price=price, size=3.0)
+        levels[price] = 3.0
+        _check_side(side=side, levels=levels, bids=False)
+
+    for _ in range(500):
+        price = round(rng.choice(list(levels)) if rng.random() < 0.4 else rng.uniform(50.0, 150.0), 3)
+        size = 0.0 if rng.random() < 0.4 else round(rng.uniform(0.1, 5.0), 4)
+        side.update(price=price, size=size)
+        if size:
+            levels[price] = size
+        else:
+            levels.pop(price, None)
+    _check_side(side=side, levels=levels, bids=False)
+
+    for price in list(levels):
+        side.update(price=price, size=0.0)
+    _check_side(side=side, levels={}, bids=False)
+    assert side.depth(price=1e9) == 0.0
+
+
+def test_snapshot_handed_over_from_another_thread_seeds_on_the_next_event():
+
+    snapshot, messages = depth_messages(symbol='BTCUSDT', updates=20, levels=50)
+    events = [json.loads(message)['data'] for message in messages]
+
+    books = OrderBooks()
+    books.book(symbol='BTCUSDT').apply(event=events[0])
+
+    fetch = threading.Thread(target=books.hand_over, kwargs={'symbol': 'BTCUSDT', 'snapshot': snapshot})
+    fetch.start()
+    fetch.join()
+
+    # Nothing touches the book until the thread feeding the stream picks the snapshot up.
+    assert not books['BTCUSDT'].synced
+
+    for event in events[1:]:
+        books.apply(event=event)
+
+    book = books['BTCUSDT']
+    assert book.synced and book.updates_applied == len(events)
+    assert book.last_update_id == events[-1]['u']
+
+
+def test_wait_seeds_a_handed_over_snapshot_of_a_new_symbol():
+
+    snapshot, _ = depth_messages(symbol='BTCUSDT', updates=0, levels=50)
+
+    books = OrderBooks()
+    books.hand_over(symbol='BTCUSDT', snapshot=snapshot)
+    books.wait()
+
+    assert books['BTCUSDT'].synced
+    assert books['BTCUSDT'].best_bid == (float(snapshot['bids'][0][0]), float(snapshot['bids'][0][1]))
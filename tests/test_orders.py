@@ -0,0 +1,39 @@
+import pytest
+
+from benchmarks.bench_orders import DictTrade
+
+from essentials.trades import Trade
+
+
+@pytest.mark.parametrize('order_type', ['mkt', 'lmt', 'stop', 'stop_lmt', 'trailing_stop'])
+@pytest.mark.parametrize('side', ['long', 'short'])
+def test_payload_matches_the_dict_layout(order_type, side):
+
+    trades = [Trade(), DictTrade()]
+    for trade in trades:
+        trade.new_trade(trade_id='SYM', order_type=order_type, side=side, enter_or_exit='enter', price=100.0,
+                        stop_limit_price=99.0)
+        trade.instrument(symbol='SYMUSDT', quantity=1.5, asset_type='CRYPTO')
+        trade.add_stop_loss(stop_size=0.02, percentage=True)
+        trade.add_take_profit(profit_size=0.04, percentage=True)
+
+    assert trades[0].order == trades[1].order
+
+
+def test_payload_follows_changes_to_the_trade():
+
+    trade = Trade()
+    trade.new_trade(trade_id='SYM', order_type='lmt', side='long', enter_or_exit='enter', price=100.0)
+    trade.instrument(symbol='SYMUSDT', quantity=1.5, asset_type='CRYPTO', sub_asset_type='SPOT')
+    trade.add_stop_loss(stop_size=0.02, percentage=True)
+
+    assert trade.order['orderLegCollection'][0]['instrument'] == {'symbol': 'SYMUSDT', 'assetType': 'CRYPTO', 'subAssetType': 'SPOT'}
+
+    trade.modify_quantity(quantity=3.0)
+
+    payload = trade.order
+    assert payload['orderLegCollection'][0]['quantity'] == 3.0
+    assert payload['childOrderStrategies'][0]['orderLegCollection'][0]['quantity'] == 3.0
+
+    # The children get their own copies, changing one does not change the other.
+    assert payload['childOrderStrategies'][0]['orderLegCollection'] is not payload['orderLegCollection']
@@ -0,0 +1,58 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from essentials.sharding import SharedRing
+
+
+WIDTH = 4
+
+
+def produce(name: str, lock, count: int, capacity: int) -> None:
+
+    ring = SharedRing(width=WIDTH, capacity=capacity, name=name, lock=lock)
+
+    try:
+        for start in range(0, count, 7):
+            numbers = np.arange(start, min(start + 7, count), dtype=np.float64)
+            ring.push_all(np.column_stack([numbers] * WIDTH), timeout=30.0)
+    finally:
+        ring.close()
+
+
+def test_records_cross_processes_whole_and_in_order():
+
+    context = multiprocessing.get_context('spawn')
+    ring = SharedRing(width=WIDTH, capacity=16, lock=context.Lock())
+    count = 2000
+
+    producer = context.Process(target=produce, args=(ring.name, ring.lock, count, ring.capacity))
+    producer.start()
+
+    try:
+        received = []
+        while sum(map(len, received)) < count and (producer.is_alive() or len(ring)):
+            records = ring.pop(limit=5)
+            ring.done(len(records))
+            received.append(records)
+
+        producer.join(timeout=30.0)
+        records = np.concatenate(received)
+
+        # Every field of a record was written before the record was counted.
+        assert np.array_equal(records, np.column_stack([np.arange(count, dtype=np.float64)] * WIDTH))
+        assert ring.processed == count
+    finally:
+        ring.close()
+
+
+def test_attaching_needs_the_lock():
+
+    ring = SharedRing(width=WIDTH, capacity=8)
+
+    try:
+        with pytest.raises(ValueError):
+            SharedRing(width=WIDTH, capacity=8, name=ring.name)
+    finally:
+        ring.close()